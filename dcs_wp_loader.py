@@ -0,0 +1,153 @@
+'''
+*
+*  dcs_wp_loader.py: DCS waypoint editor headless profile loader
+*
+*  Copyright (C) 2023 twillis/ilominar
+*
+*  This program is free software: you can redistribute it and/or modify
+*  it under the terms of the GNU General Public License as published by
+*  the Free Software Foundation, either version 3 of the License, or
+*  (at your option) any later version.
+*
+*  This program is distributed in the hope that it will be useful,
+*  but WITHOUT ANY WARRANTY; without even the implied warranty of
+*  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+*  GNU General Public License for more details.
+*
+*  You should have received a copy of the GNU General Public License
+*  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+*
+'''
+
+import argparse
+import logging
+import os
+import queue
+import sys
+import threading
+
+from time import monotonic
+
+from src.airframes import airframe_map
+from src.db_models import ProfileModel
+from src.db_objects import Profile
+from src.logger import get_logger
+from src.prefs import Preferences
+from src.wp_editor import WaypointEditor
+
+
+# loads a profile from the profile database into a jet through dcs-bios without bringing up
+# the gui. this avoids the gui, ocr, and tts modules (and their startup cost) entirely so the
+# loader can be scripted (e.g., from a stream deck) or used to benchmark loads on any platform.
+#
+#   python dcs_wp_loader.py [--data <path>] [--airframe <type>] [--host <host>] [--port <port>]
+#                           <profile>
+#   python dcs_wp_loader.py [--data <path>] --list
+#
+# loads go only to the given endpoint (additional endpoints from the preferences are not
+# used). exits with status 0 if the profile was loaded, 1 otherwise.
+
+
+# return the path to dcswe files (profile database, preferences, etc.) with a trailing
+# separator as Preferences expects, using the path dcswe would use if data_path is None.
+#
+def locate_data_path(data_path):
+    if data_path is None:
+        data_path = Preferences.locate_dcswe_prefs()
+    if data_path is None:
+        data_path = os.curdir
+    if not data_path.endswith(("/", "\\")):
+        data_path += os.sep
+    return data_path
+
+# keep stdout for progress by limiting the console logging from the editor and drivers to
+# warnings and errors, everything still goes to the log file.
+#
+def quiet_console_loggers():
+    for logger in logging.Logger.manager.loggerDict.values():
+        for handler in getattr(logger, "handlers", [ ]):
+            if type(handler) == logging.StreamHandler:
+                handler.setLevel(logging.WARNING)
+
+# run the load in the background, reporting progress from the drivers on stdout until the
+# load finishes. a keyboard interrupt cancels the load. returns True if the profile loaded.
+#
+def load_profile(editor, profile):
+    progress_q = queue.Queue()
+    command_q = queue.Queue()
+    results = [ False ]
+
+    def load_fn():
+        endpoints = [ (editor.driver.host, editor.driver.port) ]
+        results[0] = editor.enter_all(profile, command_q=command_q, progress_q=progress_q,
+                                      endpoints=endpoints)
+
+    thread = threading.Thread(target=load_fn, daemon=True)
+    t_start = monotonic()
+    thread.start()
+    endpoints = dict()
+    while thread.is_alive() or not progress_q.empty():
+        try:
+            progress = progress_q.get(timeout=0.1)
+            if type(progress) == tuple and len(progress) == 3:
+                endpoints[progress[0]] = progress[1]
+            elif type(progress) == tuple:
+                per_endpoint = ""
+                if len(endpoints) > 1:
+                    per_endpoint = " (" + ", ".join([ f"{host}:{port} {pct:.0f}%"
+                                                      for (host, port), pct
+                                                          in sorted(endpoints.items()) ]) + ")"
+                print(f"\r{progress[0]:5.1f}% complete, {progress[1]:5.1f}s remaining" +
+                      per_endpoint, end="", flush=True)
+        except queue.Empty:
+            pass
+        except KeyboardInterrupt:
+            command_q.put("CANCEL")
+    thread.join()
+    status = "loaded" if results[0] else "failed"
+    print(f"\n{profile.profilename} {status} in {monotonic() - t_start:.2f}s")
+    return results[0]
+
+# main.
+#
+def main(args):
+    prefs = Preferences(data_path=locate_data_path(args.data))
+    editor = WaypointEditor(prefs)
+    quiet_console_loggers()
+    try:
+        if args.list:
+            for name in ProfileModel.list_all_names():
+                print(name)
+            return True
+        try:
+            profile = Profile.load(args.profile)
+        except ProfileModel.DoesNotExist:
+            print(f"Profile '{args.profile}' not found in {prefs.path_profile_db}", file=sys.stderr)
+            return False
+        airframe = args.airframe or profile.aircraft or prefs.airframe_default
+        editor.set_driver(airframe)
+        editor.driver.host = args.host
+        editor.driver.port = args.port
+        print(f"Loading {profile.profilename} into {airframe} at {editor.driver.host}:{editor.driver.port}...")
+        return load_profile(editor, profile)
+    finally:
+        editor.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="dcs_wp_loader", description="Load a DCSWE profile without the GUI")
+    parser.add_argument("profile", nargs="?", help="name of the profile to load")
+    parser.add_argument("--list", action="store_true", help="list the profiles in the database")
+    parser.add_argument("--data", help="path to DCSWE files (default: where DCSWE keeps them)")
+    parser.add_argument("--airframe", choices=sorted(airframe_map.values()),
+                        help="airframe to load (default: the profile's airframe)")
+    parser.add_argument("--host", default="127.0.0.1", help="DCS-BIOS host (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=7778, help="DCS-BIOS port (default: 7778)")
+    args = parser.parse_args()
+    if not args.list and args.profile is None:
+        parser.error("a profile is required unless listing profiles")
+
+    logger = get_logger("dcswe")
+    logger.info("============ Launching DCSWE loader ============")
+    quiet_console_loggers()
+
+    sys.exit(0 if main(args) else 1)
@@ -0,0 +1,52 @@
+'''
+*
+*  airframes.py: Supported airframes
+*
+*  Copyright (C) 2023 twillis/ilominar
+*
+*  This program is free software: you can redistribute it and/or modify
+*  it under the terms of the GNU General Public License as published by
+*  the Free Software Foundation, either version 3 of the License, or
+*  (at your option) any later version.
+*
+*  This program is distributed in the hope that it will be useful,
+*  but WITHOUT ANY WARRANTY; without even the implied warranty of
+*  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+*  GNU General Public License for more details.
+*
+*  You should have received a copy of the GNU General Public License
+*  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+*
+'''
+
+# maps UI text : internal type for airframe pulldown menus in the ui.
+#
+airframe_map = { "A-10C Warthog" : "warthog",
+                 "AV-8B Harrier" : "harrier",
+                 "F-14A/B Tomcat" : "tomcat",
+                 "F-16C Viper" : "viper",
+                 "F/A-18C Hornet" : "hornet",
+                 "M-2000C Mirage" : "mirage"
+}
+
+
+# return list of supported airframes. second token (" " separated) of items is internal name.
+#
+def airframe_list():
+    return list(airframe_map.keys())
+
+# convert ui airframe text to internal airframe type.
+#  
+def airframe_ui_text_to_type(ui_text):
+    type = airframe_map[ui_text]
+    if type is None:
+        type = "viper"
+    return type
+
+# convert interanl airframe type to text suitable for ui
+#
+def airframe_type_to_ui_text(type):
+    hits = [k for k,v in airframe_map.items() if v == type]
+    if (len(hits) == 0):
+        hits = ["F-16C Viper"]
+    return hits[0]
@@ -23,6 +23,7 @@ import PySimpleGUI as PyGUI
 
 from src.avionics_setup_viper_gui import AvionicsSetupViperGUI
 from src.db_models import AvionicsSetupModel
+from src.db_objects import av_setup_cache
 from src.gui_util import airframe_type_to_ui_text
 from src.logger import get_logger
 
@@ -135,6 +136,7 @@ class AvionicsSetupGUI:
         if name is not None:
             try:
                 self.airframe_gui.af_do_template_save_as(event, name)
+                av_setup_cache.invalidate(name)
                 self.update_gui_template_list()
             except:
                 PyGUI.Popup(f"Unable to create a template named '{name}'. Is there already" +
@@ -143,13 +145,16 @@ class AvionicsSetupGUI:
     def do_template_update(self, event):
         if not self.is_setup_default():
             self.airframe_gui.af_do_template_update(event)
+            av_setup_cache.invalidate(self.cur_av_setup)
 
     def do_template_delete(self, event):
         action = PyGUI.PopupOKCancel(f"Are you sure you want to delete the settings {self.cur_av_setup}?",
                                      title="Confirm Delete")
         if action == "OK":
             try:
+                name = self.cur_av_setup
                 self.airframe_gui.af_do_template_delete(event)
+                av_setup_cache.invalidate(name)
                 self.update_gui_template_list()
             except Exception as e:
                 PyGUI.PopupError(f"Unable to delete the settings {self.cur_av_setup} from the database.")
@@ -20,145 +20,168 @@
 *
 '''
 
-from peewee import CharField, IntegerField, IntegrityError, SqliteDatabase
+from time import monotonic
+
+from peewee import CharField, IntegerField
 from playhouse.migrate import SqliteMigrator, migrate
 
 from src.db_models import ProfileModel, WaypointModel, SequenceModel, AvionicsSetupModel, db
+from src.db_models import NamedModel
+from src.db_objects import av_setup_cache, profile_cache
 from src.logger import get_logger
 
 
+# ordered registry of schema migrations. each entry is a ( <version>, <columns> ) tuple where
+# <columns> is a list of ( <table>, <column>, <field> ) tuples for the columns that must be
+# added to move the database from the previous version to <version>. to add a new version,
+# add the fields to the models in db_models.py and append an entry here.
+#
+DB_MIGRATIONS = [
+    # db v.2 adds "av_setup_name" column to "ProfileModel" table.
+    #
+    (2, [ ('ProfileModel', 'av_setup_name', CharField(null=True, unique=False)) ]),
+    # db v.3 adds "is_set_cur" column to "WaypointModel" table.
+    #
+    (3, [ ('WaypointModel', 'is_set_cur', IntegerField(default=False)) ]),
+    # db v.4 adds "f16_cmds_setup_p<x>" columns to "AvionicsSetupModel" table.
+    #
+    (4, [ ('AvionicsSetupModel', f"f16_cmds_setup_p{i}", CharField(null=True, default=None))
+          for i in range(1, 6) ]),
+    # db v.5 adds "f16_bulls_setup" and "f16_jhmcs_setup" columns to "AvionicsSetupModel" table.
+    #
+    (5, [ ('AvionicsSetupModel', 'f16_bulls_setup', CharField(null=True, default=None)),
+          ('AvionicsSetupModel', 'f16_jhmcs_setup', CharField(null=True, default=None)) ]),
+    # db v.6 adds "f16_cmds_setup_p6" column to "AvionicsSetupModel" table.
+    #
+    (6, [ ('AvionicsSetupModel', 'f16_cmds_setup_p6', CharField(null=True, default=None)) ]),
+    # db v.7 adds "f16_mfd_setup_opt" column to "AvionicsSetupModel" table.
+    #
+    (7, [ ('AvionicsSetupModel', 'f16_mfd_setup_opt', IntegerField(default=False)) ]),
+    # db v.8 adds "f16_cmds_setup_opt" column to "AvionicsSetupModel" table.
+    #
+    (8, [ ('AvionicsSetupModel', 'f16_cmds_setup_opt', IntegerField(default=False)) ]),
+]
+
+DB_VERSION = DB_MIGRATIONS[-1][0]
+
+# sqlite storage profiles for the database, maps a profile name onto the pragmas to apply to
+# each connection. "safe" is the sqlite default rollback journal with full syncs. "fast" uses
+# a write-ahead log with normal syncs (a power loss may lose the last commits, but does not
+# corrupt the database) and larger page and memory-mapped i/o caches.
+#
+DB_STORAGE_PROFILES = {
+    'safe' : { 'foreign_keys' : 1, 'journal_mode' : 'delete', 'synchronous' : 2 },
+    'fast' : { 'foreign_keys' : 1, 'journal_mode' : 'wal', 'synchronous' : 1,
+               'cache_size' : -16384, 'mmap_size' : 64 * 1024 * 1024, 'temp_store' : 2 },
+}
+
+# while the database is open, sqlite is asked to update its query planner statistics after
+# every DB_OPTIMIZE_SAVES saves, or on the first save more than DB_OPTIMIZE_INTERVAL seconds
+# after the statistics were last updated. the statistics are also updated when the database
+# is closed.
+#
+DB_OPTIMIZE_SAVES = 32
+DB_OPTIMIZE_INTERVAL = 30 * 60
+
+# when the database is closed, it is vacuumed if at least DB_VACUUM_MIN_PAGES pages make up
+# more than DB_VACUUM_FREE of the pages in the file.
+#
+DB_VACUUM_FREE = 0.25
+DB_VACUUM_MIN_PAGES = 64
+
+
+# the schema version of the database is kept in the sqlite user_version pragma so that an
+# up-to-date database costs a single pragma read to open. databases from before the version
+# was kept there have a user_version of 0 and are brought up to date by replaying every
+# migration. migrations only add the columns that are missing, so replaying one that was
+# already applied (or that create_tables already covered) is harmless. pending migrations
+# are applied in one transaction.
+#
+# the database is opened with the pragmas from a storage profile (see DB_STORAGE_PROFILES) and
+# maintained while it is open and when it is closed: sqlite is given a chance to update its
+# query planner statistics periodically as named rows are saved (see DB_OPTIMIZE_SAVES) and
+# on close, and the file is vacuumed on close once enough of it is free pages. the profile cache
+# and avionics setup cache (see db_objects.py) and the name indexes (see NameIndex in db_models.py) are
+# cleared when the database is opened or closed.
+#
 class DatabaseInterface:
-    def __init__(self, db_name):
+    num_saves = 0
+    t_optimized = 0.0
+
+    def __init__(self, db_name, storage="safe"):
         self.logger = get_logger(__name__)
-        self.db_version = 1
 
-        db.init(db_name)
+        DatabaseInterface.invalidate_caches()
+        db.init(db_name, pragmas=DB_STORAGE_PROFILES[storage])
         db.connect()
-        db.create_tables([ProfileModel, WaypointModel, SequenceModel, AvionicsSetupModel])
-        self.logger.debug(f"Connected to database {db_name}")
+        self.logger.debug(f"Connected to database {db_name} ({storage} storage)")
+
+        self.db_version = db.pragma('user_version')
+        if self.db_version < DB_VERSION:
+            try:
+                self.migrate(db_name)
+            except Exception as e:
+                self.logger.error(f"Database migration fails, {e}")
+                raise e
 
+        self.logger.debug(f"Database {db_name} is v{self.db_version}")
+
+        DatabaseInterface.num_saves = 0
+        DatabaseInterface.t_optimized = monotonic()
+        NamedModel.save_hook = DatabaseInterface.note_save
+
+    def migrate(self, db_name):
         migrator = SqliteMigrator(db)
-        try:
-            for metadata in db.get_columns('ProfileModel'):
-                if metadata.name == 'av_setup_name':
-                    #
-                    # db v.2 adds "av_setup_name" column to "ProfileModel" table.
-                    #
-                    self.db_version = 2
-                    break
-            for metadata in db.get_columns('WaypointModel'):
-                if self.db_version == 2 and metadata.name == 'is_set_cur':
-                    #
-                    # db v.3 adds "is_set_cur" column to "WaypointModel" table.
-                    #
-                    self.db_version = 3
-                    break
-            for metadata in db.get_columns('AvionicsSetupModel'):
-                if self.db_version == 3 and metadata.name == 'f16_cmds_setup_p1':
-                    #
-                    # db v.4 adds "f16_cmds_setup_p<x>" columns to "AvionicsSetupModel" table.
-                    #
-                    self.db_version = 4
-                    break
-            for metadata in db.get_columns('AvionicsSetupModel'):
-                if self.db_version == 4 and metadata.name == 'f16_bulls_setup':
-                    #
-                    # db v.5 adds "f16_bulls_setup" and "f16_jhmcs_setup" columns to
-                    # "AvionicsSetupModel" table.
-                    #
-                    self.db_version = 5
-                    break
-            for metadata in db.get_columns('AvionicsSetupModel'):
-                if self.db_version == 5 and metadata.name == 'f16_cmds_setup_p6':
-                    #
-                    # db v.6 adds "f16_cmds_setup_p6" column to "AvionicsSetupModel" table.
-                    #
-                    self.db_version = 6
-                    break
-            for metadata in db.get_columns('AvionicsSetupModel'):
-                if self.db_version == 6 and metadata.name == 'f16_mfd_setup_opt':
-                    #
-                    # db v.7 adds "f16_mfd_setup_opt" column to "AvionicsSetupModel" table.
-                    #
-                    self.db_version = 7
-                    break
-
-            for metadata in db.get_columns('AvionicsSetupModel'):
-                if self.db_version == 7 and metadata.name == 'f16_cmds_setup_opt':
-                    #
-                    # db v.8 adds "f16_cmds_setup_opt" column to "AvionicsSetupModel" table.
-                    #
-                    self.db_version = 8
-                    break
-
-            if self.db_version == 1:
-                avionics_setup_field = CharField(null=True, unique=False)
-                with db.atomic():
-                    migrate(
-                        migrator.add_column('ProfileModel', 'av_setup_name', avionics_setup_field)
-                    )
-                self.db_version = 2
-                self.logger.debug(f"Migrated database {db_name} to v{self.db_version}")
-            if self.db_version == 2:
-                is_init_field = IntegerField(default=False)
-                with db.atomic():
-                    migrate(
-                        migrator.add_column('WaypointModel', 'is_set_cur', is_init_field)
-                    )
-                self.db_version = 3
-                self.logger.debug(f"Migrated database {db_name} to v{self.db_version}")
-            if self.db_version == 3:
-                is_init_field = CharField(null=True, default=None)
-                with db.atomic():
-                    migrate(
-                        migrator.add_column('AvionicsSetupModel', 'f16_cmds_setup_p1', is_init_field),
-                        migrator.add_column('AvionicsSetupModel', 'f16_cmds_setup_p2', is_init_field),
-                        migrator.add_column('AvionicsSetupModel', 'f16_cmds_setup_p3', is_init_field),
-                        migrator.add_column('AvionicsSetupModel', 'f16_cmds_setup_p4', is_init_field),
-                        migrator.add_column('AvionicsSetupModel', 'f16_cmds_setup_p5', is_init_field)
-                    )
-                self.db_version = 4
-                self.logger.debug(f"Migrated database {db_name} to v{self.db_version}")
-            if self.db_version == 4:
-                is_init_field = CharField(null=True, default=None)
-                with db.atomic():
-                    migrate(
-                        migrator.add_column('AvionicsSetupModel', 'f16_bulls_setup', is_init_field),
-                        migrator.add_column('AvionicsSetupModel', 'f16_jhmcs_setup', is_init_field)
-                    )
-                self.db_version = 5
-                self.logger.debug(f"Migrated database {db_name} to v{self.db_version}")
-            if self.db_version == 5:
-                is_init_field = CharField(null=True, default=None)
-                with db.atomic():
-                    migrate(
-                        migrator.add_column('AvionicsSetupModel', 'f16_cmds_setup_p6', is_init_field),
-                    )
-                self.db_version = 6
-                self.logger.debug(f"Migrated database {db_name} to v{self.db_version}")
-            if self.db_version == 6:
-                is_init_field = IntegerField(default=False)
-                with db.atomic():
-                    migrate(
-                        migrator.add_column('AvionicsSetupModel', 'f16_mfd_setup_opt', is_init_field),
-                    )
-                self.db_version = 7
-                self.logger.debug(f"Migrated database {db_name} to v{self.db_version}")
-            if self.db_version == 7:
-                is_init_field = IntegerField(default=False)
-                with db.atomic():
-                    migrate(
-                        migrator.add_column('AvionicsSetupModel', 'f16_cmds_setup_opt', is_init_field),
-                    )
-                self.db_version = 8
-                self.logger.debug(f"Migrated database {db_name} to v{self.db_version}")
-
-            self.logger.debug(f"Database {db_name} is v{self.db_version}")
-
-        except Exception as e:
-            self.logger.error(f"Database migration fails, {e}")
-            raise e
+        columns = dict()
+        with db.atomic():
+            db.create_tables([ProfileModel, WaypointModel, SequenceModel, AvionicsSetupModel])
+            for version, version_columns in DB_MIGRATIONS:
+                if version <= self.db_version:
+                    continue
+                for table, column, field in version_columns:
+                    if table not in columns:
+                        columns[table] = [ metadata.name for metadata in db.get_columns(table) ]
+                    if column not in columns[table]:
+                        migrate(migrator.add_column(table, column, field))
+                        columns[table].append(column)
+                self.logger.debug(f"Migrated database {db_name} to v{version}")
+            db.pragma('user_version', DB_VERSION)
+        self.db_version = DB_VERSION
+
+    @staticmethod
+    def invalidate_caches():
+        profile_cache.invalidate()
+        av_setup_cache.invalidate()
+        ProfileModel.name_index.invalidate()
+        AvionicsSetupModel.name_index.invalidate()
+
+    # count a save of a named row, optimizing the database once enough saves or time have
+    # passed since the last optimize (see DB_OPTIMIZE_SAVES).
+    #
+    @staticmethod
+    def note_save():
+        DatabaseInterface.num_saves += 1
+        if ((DatabaseInterface.num_saves >= DB_OPTIMIZE_SAVES) or
+            (monotonic() - DatabaseInterface.t_optimized >= DB_OPTIMIZE_INTERVAL)):
+            get_logger(__name__).debug(f"Optimizing database after {DatabaseInterface.num_saves} saves")
+            DatabaseInterface.optimize()
+
+    @staticmethod
+    def optimize():
+        db.pragma('optimize')
+        DatabaseInterface.num_saves = 0
+        DatabaseInterface.t_optimized = monotonic()
 
     @staticmethod
     def close():
+        DatabaseInterface.invalidate_caches()
+        NamedModel.save_hook = None
+        if db.is_closed():
+            return
+        DatabaseInterface.optimize()
+        page_count = db.pragma('page_count')
+        free_count = db.pragma('freelist_count')
+        if free_count >= DB_VACUUM_MIN_PAGES and free_count > DB_VACUUM_FREE * page_count:
+            get_logger(__name__).debug(f"Vacuuming database, {free_count} of {page_count} pages free")
+            db.execute_sql("VACUUM")
         db.close()
@@ -0,0 +1,128 @@
+'''
+*
+*  db_bench.py: Benchmark profile database latency under the storage profiles
+*
+*  Copyright (C) 2023 twillis/ilominar
+*
+*  This program is free software: you can redistribute it and/or modify
+*  it under the terms of the GNU General Public License as published by
+*  the Free Software Foundation, either version 3 of the License, or
+*  (at your option) any later version.
+*
+*  This program is distributed in the hope that it will be useful,
+*  but WITHOUT ANY WARRANTY; without even the implied warranty of
+*  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+*  GNU General Public License for more details.
+*
+*  You should have received a copy of the GNU General Public License
+*  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+*
+'''
+
+import argparse
+import logging
+import os
+import random
+import tempfile
+
+from LatLon23 import LatLon, Longitude, Latitude
+from time import perf_counter
+
+from src.db import DB_STORAGE_PROFILES, DatabaseInterface
+from src.db_models import ProfileModel
+from src.db_objects import Profile, Waypoint
+
+
+# the benchmark builds a profile database with a number of profiles under each storage
+# profile (see DB_STORAGE_PROFILES in db.py) and measures the latency of the operations the
+# editor performs on it: saving a profile with an edited waypoint ("save"), loading a profile
+# ("load"), and listing the profile names ("list"). the database is built in a temporary
+# directory, by default in the system temporary directory (which may be a ram disk, pass a
+# directory on the disk dcswe uses for realistic sync costs).
+#
+BENCH_COUNTS = [ 10, 100, 1000 ]
+BENCH_WAYPOINTS = 20
+BENCH_REPEATS = 50
+
+
+def bench_profile(name, num_wps):
+    wps = [ Waypoint(LatLon(Latitude(36.0 + i * 0.01), Longitude(-115.0 - i * 0.01)),
+                     elevation=100 * i, name=f"WP{i}", sequence=(i % 3) + 1) for i in range(num_wps) ]
+    return Profile(name, waypoints=wps, aircraft="hornet")
+
+# return the ( <mean>, <p95> ) of a list of latencies.
+#
+def bench_latency_stats(latencies):
+    latencies = sorted(latencies)
+    return (sum(latencies) / len(latencies), latencies[int(0.95 * (len(latencies) - 1))])
+
+# run the benchmark for a storage profile and number of profiles in a directory. returns a
+# dictionary that maps the operations onto ( <mean>, <p95> ) latencies in seconds.
+#
+def bench_storage(path, storage, num_profiles, num_wps=BENCH_WAYPOINTS, repeats=BENCH_REPEATS):
+    db_name = os.path.join(path, f"bench_{storage}_{num_profiles}.db")
+    dbi = DatabaseInterface(db_name, storage)
+    try:
+        profiles = [ bench_profile(f"Profile {i:04d}", num_wps) for i in range(num_profiles) ]
+        for profile in profiles:
+            profile.save()
+
+        rng = random.Random(num_profiles)
+        latencies = { 'save' : [ ], 'load' : [ ], 'list' : [ ] }
+        for i in range(repeats):
+            profile = rng.choice(profiles)
+            profile.waypoints[rng.randrange(num_wps)].elevation = i
+            t_start = perf_counter()
+            profile.save()
+            latencies['save'].append(perf_counter() - t_start)
+
+            name = rng.choice(profiles).profilename
+            t_start = perf_counter()
+            Profile.load(name)
+            latencies['load'].append(perf_counter() - t_start)
+
+            t_start = perf_counter()
+            ProfileModel.list_all_names()
+            latencies['list'].append(perf_counter() - t_start)
+    finally:
+        dbi.close()
+    return { op : bench_latency_stats(values) for op, values in latencies.items() }
+
+# run the benchmark for each storage profile and number of profiles. returns a list of
+# ( <storage>, <num_profiles>, <stats> ) tuples, see bench_storage.
+#
+def bench_run(counts=BENCH_COUNTS, num_wps=BENCH_WAYPOINTS, repeats=BENCH_REPEATS, path=None):
+    results = [ ]
+    with tempfile.TemporaryDirectory(dir=path) as tmp_path:
+        for num_profiles in counts:
+            for storage in DB_STORAGE_PROFILES.keys():
+                stats = bench_storage(tmp_path, storage, num_profiles, num_wps, repeats)
+                results.append((storage, num_profiles, stats))
+    return results
+
+# return a list of lines with a report on the benchmark results. latencies are in milliseconds.
+#
+def bench_report(results):
+    lines = [ f"{'storage':<8} {'profiles':>8} {'save mean':>10} {'p95':>8} {'load mean':>10} {'p95':>8}" +
+              f" {'list mean':>10} {'p95':>8}" ]
+    for storage, num_profiles, stats in results:
+        line = f"{storage:<8} {num_profiles:8d}"
+        for op in ('save', 'load', 'list'):
+            line += f" {stats[op][0] * 1000.0:10.3f} {stats[op][1] * 1000.0:8.3f}"
+        lines.append(line)
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="db_bench", description="Benchmark profile database storage")
+    parser.add_argument("--counts", default=",".join([ str(count) for count in BENCH_COUNTS ]),
+                        help="comma-separated list of profile counts to test")
+    parser.add_argument("--waypoints", type=int, default=BENCH_WAYPOINTS, help="waypoints per profile")
+    parser.add_argument("--repeats", type=int, default=BENCH_REPEATS, help="operations timed per test")
+    parser.add_argument("--dir", default=None, help="directory to build databases in (default: system temp)")
+    args = parser.parse_args()
+
+    logging.disable(logging.DEBUG)
+    counts = [ int(count) for count in args.counts.split(",") ]
+    results = bench_run(counts, args.waypoints, args.repeats, args.dir)
+    print("\n".join(bench_report(results)))
@@ -20,6 +20,7 @@
 *
 '''
 
+from bisect import bisect_left, bisect_right, insort
 from peewee import Model, IntegerField, CharField, ForeignKeyField, FloatField, SqliteDatabase
 
 
@@ -31,7 +32,101 @@ class BaseModel(Model):
         database = db
 
 
-class ProfileModel(BaseModel):
+# memoized, sorted list of the names of the rows in the table for a model with a unique "name"
+# field. the list is built with a single ordered query on the name column the first time it is
+# needed and then kept up to date as rows are created, renamed, or deleted through the model
+# (see NamedModel). lookups, including finding the names before and after a name for cycling
+# through names, bisect the list.
+#
+class NameIndex:
+    def __init__(self, model):
+        self.model = model
+        self.names = None
+
+    def sorted_names(self):
+        if self.names is None:
+            query = self.model.select(self.model.name).order_by(self.model.name).tuples()
+            self.names = [ name for (name,) in query ]
+        return self.names
+
+    def invalidate(self):
+        self.names = None
+
+    def add(self, name):
+        if self.names is not None and not self.contains(name):
+            insort(self.names, name)
+
+    def remove(self, name):
+        if self.names is not None and self.contains(name):
+            del self.names[bisect_left(self.names, name)]
+
+    def all(self):
+        return list(self.sorted_names())
+
+    def contains(self, name):
+        if name is None:
+            return False
+        names = self.sorted_names()
+        i = bisect_left(names, name)
+        return i < len(names) and names[i] == name
+
+    # return the name after (before) a name in order, None if there is no such name. name
+    # need not be in the index.
+    #
+    def name_after(self, name):
+        names = self.sorted_names()
+        i = bisect_right(names, name)
+        return names[i] if i < len(names) else None
+
+    def name_before(self, name):
+        names = self.sorted_names()
+        i = bisect_left(names, name)
+        return names[i - 1] if i > 0 else None
+
+
+# base model for tables with a unique "name" field that keeps a NameIndex of the names in the
+# table, name_index, up to date as rows are saved and deleted. bulk queries (e.g., delete())
+# bypass the index and must invalidate it. save_hook, if not None, is called with no arguments
+# after each row is saved (see DatabaseInterface in db.py).
+#
+# each instance keeps the name of its row as last loaded or saved in saved_name so that the
+# index only needs to change when a save writes a new name.
+#
+class NamedModel(BaseModel):
+    save_hook = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.saved_name = self.name if self.id is not None else None
+
+    def save(self, *args, **kwargs):
+        model = type(self)
+        is_renamed = 'name' in self._dirty or kwargs.get('force_insert', False)
+        result = super().save(*args, **kwargs)
+        if is_renamed:
+            if self.saved_name is not None and self.saved_name != self.name:
+                model.name_index.remove(self.saved_name)
+            model.name_index.add(self.name)
+            self.saved_name = self.name
+        if NamedModel.save_hook is not None:
+            NamedModel.save_hook()
+        return result
+
+    def delete_instance(self, *args, **kwargs):
+        result = super().delete_instance(*args, **kwargs)
+        type(self).name_index.remove(self.saved_name)
+        return result
+
+    @classmethod
+    def list_all(cls):
+        return list(cls.select().order_by(cls.name))
+
+    @classmethod
+    def list_all_names(cls):
+        return cls.name_index.all()
+
+
+class ProfileModel(NamedModel):
     name = CharField(unique=True)
     aircraft = CharField(unique=False)
     #
@@ -39,14 +134,6 @@ class ProfileModel(BaseModel):
     #
     av_setup_name = CharField(null=True, unique=False)
 
-    @staticmethod
-    def list_all():
-        return sorted(list(ProfileModel.select()), key=lambda profile: profile.name)
-
-    @staticmethod
-    def list_all_names():
-        return [ profile.name for profile in ProfileModel.list_all() ]
-
 
 class SequenceModel(BaseModel):
     identifier = IntegerField()
@@ -69,7 +156,7 @@ class WaypointModel(BaseModel):
 
 # Model added in db v.2, v1.1.0-51stVFW and later
 #
-class AvionicsSetupModel(BaseModel):
+class AvionicsSetupModel(NamedModel):
     name = CharField(null=False, unique=True)
 
     # airframes supported: viper
@@ -152,10 +239,6 @@ class AvionicsSetupModel(BaseModel):
     #
     f16_cmds_setup_opt = IntegerField(default=False)
 
-    @staticmethod
-    def list_all():
-        return sorted(list(AvionicsSetupModel.select()), key=lambda setup: setup.name)
 
-    @staticmethod
-    def list_all_names():
-        return [ setup.name for setup in AvionicsSetupModel.list_all() ]
+ProfileModel.name_index = NameIndex(ProfileModel)
+AvionicsSetupModel.name_index = NameIndex(AvionicsSetupModel)
@@ -20,12 +20,15 @@
 *
 '''
 
+import copy
 import json
 
+from collections import OrderedDict
 from dataclasses import dataclass, asdict
 from LatLon23 import LatLon, Longitude, Latitude
 from os import walk
-from peewee import IntegrityError
+from peewee import JOIN
+from types import MappingProxyType
 from typing import Any
 
 from src.db_models import ProfileModel, WaypointModel, SequenceModel, AvionicsSetupModel
@@ -151,6 +154,58 @@ class MSN(Waypoint):
                    station=dict.get('station'))
 
 
+# bounded lru cache of the profiles loaded from the database, keyed by profile name. the
+# cache holds its own copies of the profiles so that changes to a profile that are not saved
+# do not leak into the cache. profiles are dropped from the cache when they are saved or
+# deleted and the cache is cleared when a database is opened or closed (see db.py).
+#
+PROFILE_CACHE_SIZE = 64
+
+class ProfileCache:
+    def __init__(self, size=PROFILE_CACHE_SIZE):
+        self.size = size
+        self.profiles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # return a copy of a profile that shares the (immutable) positions of its waypoints.
+    #
+    @staticmethod
+    def copy(profile):
+        return Profile(profile.profilename, waypoints=[ copy.copy(wp) for wp in profile.waypoints ],
+                       aircraft=profile.aircraft, av_setup_name=profile.av_setup_name)
+
+    # return a copy of the cached profile with a name, None if the profile is not cached.
+    #
+    def get(self, name):
+        profile = self.profiles.get(name)
+        if profile is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.profiles.move_to_end(name)
+        return ProfileCache.copy(profile)
+
+    def put(self, profile):
+        self.profiles[profile.profilename] = ProfileCache.copy(profile)
+        self.profiles.move_to_end(profile.profilename)
+        while len(self.profiles) > self.size:
+            self.profiles.popitem(last=False)
+
+    # drop the profile with a name from the cache, or all profiles if name is None.
+    #
+    def invalidate(self, name=None):
+        if name is None:
+            self.profiles.clear()
+        else:
+            self.profiles.pop(name, None)
+
+    def __str__(self):
+        return f"{len(self.profiles)} profiles, {self.hits} hits, {self.misses} misses"
+
+profile_cache = ProfileCache()
+
+
 class Profile:
     def __init__(self, profilename, waypoints=None, aircraft="viper", av_setup_name=None):
         self.profilename = profilename
@@ -182,9 +237,9 @@ class Profile:
     @property
     def av_setup(self):
         if self.has_av_setup:
-            return AvionicsSetup(self.av_setup_name, self.aircraft)
+            return AvionicsSetup.resolve(self.av_setup_name, self.aircraft)
         else:
-            return AvionicsSetup()
+            return AvionicsSetup.resolve(None)
     
     @property
     def has_waypoints(self):
@@ -306,92 +361,127 @@ class Profile:
             logger.error(e)
             raise ValueError("Failed to load profile from data")
 
+    # return the WaypointModel field values (as stored in the database) for the waypoints in
+    # the profile, in order. sequences maps sequence identifiers onto SequenceModel ids.
+    #
+    def waypoint_rows(self, profile_id, sequences):
+        rows = [ ]
+        for waypoint in self.waypoints:
+            values = dict(name=waypoint.name,
+                          latitude=waypoint.position.lat.decimal_degree,
+                          longitude=waypoint.position.lon.decimal_degree,
+                          elevation=waypoint.elevation,
+                          profile=profile_id,
+                          sequence=None,
+                          wp_type=waypoint.wp_type,
+                          station=0,
+                          is_set_cur=waypoint.is_set_cur)
+            if not isinstance(waypoint, MSN):
+                values['sequence'] = sequences.get(waypoint.sequence)
+            else:
+                values['station'] = waypoint.station
+            rows.append({ name : WaypointModel._meta.fields[name].db_value(value)
+                          for name, value in values.items() })
+        return rows
+
+    # save the profile to the database in a single transaction. the waypoint rows already in
+    # the database for the profile are reused in order: rows that match the waypoint at the
+    # same position are left alone, rows that differ are updated in one batch, extra waypoints
+    # are inserted in one batch, and extra rows are deleted in one statement. rows keep their
+    # ids in waypoint order so that loading the profile returns the waypoints in order.
+    #
     def save(self, profilename=None):
-        delete_list = list()
         if profilename is not None:
             self.profilename = profilename
 
-        try:
-            with db.atomic():
-                profile = ProfileModel.create(name=self.profilename, aircraft=self.aircraft)
-        except IntegrityError:
-            profile = ProfileModel.get(ProfileModel.name == self.profilename)
-        profile.aircraft = self.aircraft
-        profile.av_setup_name = self.av_setup_name
-
-        for waypoint in profile.waypoints:
-            delete_list.append(waypoint)
-
-        for sequence in profile.sequences:
-            delete_list.append(sequence)
-
-        sequences_db_instances = dict()
-        for sequencenumber in self.sequences:
-            sequence_db_instance = SequenceModel.create(
-                identifier=sequencenumber,
-                profile=profile
-            )
-            sequences_db_instances[sequencenumber] = sequence_db_instance
-
-        for waypoint in self.waypoints:
-            if not isinstance(waypoint, MSN):
-                sequence = sequences_db_instances.get(waypoint.sequence)
-                WaypointModel.create(
-                    name=waypoint.name,
-                    latitude=waypoint.position.lat.decimal_degree,
-                    longitude=waypoint.position.lon.decimal_degree,
-                    elevation=waypoint.elevation,
-                    profile=profile,
-                    sequence=sequence,
-                    wp_type=waypoint.wp_type,
-                    is_set_cur=waypoint.is_set_cur
-                )
-            else:
-                WaypointModel.create(
-                    name=waypoint.name,
-                    latitude=waypoint.position.lat.decimal_degree,
-                    longitude=waypoint.position.lon.decimal_degree,
-                    elevation=waypoint.elevation,
-                    profile=profile,
-                    wp_type=waypoint.wp_type,
-                    is_set_cur=waypoint.is_set_cur,
-                    station=waypoint.station
-                )
-
-        for instance in delete_list:
-            instance.delete_instance()
-        profile.save()
+        profile_cache.invalidate(self.profilename)
+        with db.atomic():
+            profile = ProfileModel.get_or_none(ProfileModel.name == self.profilename)
+            if profile is None:
+                profile = ProfileModel.create(name=self.profilename, aircraft=self.aircraft,
+                                              av_setup_name=self.av_setup_name)
+            elif profile.aircraft != self.aircraft or profile.av_setup_name != self.av_setup_name:
+                profile.aircraft = self.aircraft
+                profile.av_setup_name = self.av_setup_name
+                profile.save()
 
+            sequences = { identifier : seq_id for seq_id, identifier in
+                          SequenceModel.select(SequenceModel.id, SequenceModel.identifier)
+                                       .where(SequenceModel.profile == profile).tuples() }
+            stale_sequences = [ seq_id for identifier, seq_id in sequences.items()
+                                if identifier not in self.sequences ]
+            new_sequences = [ identifier for identifier in self.sequences if identifier not in sequences ]
+            if len(new_sequences) > 0:
+                SequenceModel.insert_many([ (identifier, profile.id) for identifier in new_sequences ],
+                                          fields=[ SequenceModel.identifier, SequenceModel.profile ]).execute()
+                sequences = { identifier : seq_id for seq_id, identifier in
+                              SequenceModel.select(SequenceModel.id, SequenceModel.identifier)
+                                           .where(SequenceModel.profile == profile).tuples() }
+
+            fields = [ name for name in WaypointModel._meta.sorted_field_names if name != "id" ]
+            old_rows = list(WaypointModel.select().where(WaypointModel.profile == profile)
+                                         .order_by(WaypointModel.id).dicts())
+            new_rows = self.waypoint_rows(profile.id, sequences)
+
+            changed = [ WaypointModel(id=old['id'], **new) for old, new in zip(old_rows, new_rows)
+                        if any([ old[name] != new[name] for name in fields ]) ]
+            if len(changed) > 0:
+                WaypointModel.bulk_update(changed, fields=fields, batch_size=100)
+            if len(new_rows) > len(old_rows):
+                WaypointModel.insert_many(new_rows[len(old_rows):]).execute()
+            if len(old_rows) > len(new_rows):
+                stale_ids = [ old['id'] for old in old_rows[len(new_rows):] ]
+                WaypointModel.delete().where(WaypointModel.id.in_(stale_ids)).execute()
+            if len(stale_sequences) > 0:
+                SequenceModel.delete().where(SequenceModel.id.in_(stale_sequences)).execute()
+
+        logger.debug(f"Saved {self.profilename} to DB, {len(changed)} updated, " +
+                     f"{max(len(new_rows) - len(old_rows), 0)} inserted, " +
+                     f"{max(len(old_rows) - len(new_rows), 0)} deleted")
+
+    # load a profile from the database, or from profile_cache if the profile is cached. the
+    # waypoints and the identifiers of their sequences are fetched with a single joined query
+    # in the order they were saved in (see save).
+    #
     @staticmethod
     def load(profile_name):
+        profile = profile_cache.get(profile_name)
+        if profile is not None:
+            logger.debug(f"Fetched {profile_name} from cache ({profile_cache})")
+            return profile
+
         profile = ProfileModel.get(ProfileModel.name == profile_name)
         aircraft = profile.aircraft
         av_setup_name = profile.av_setup_name
 
+        query = (WaypointModel.select(WaypointModel.latitude, WaypointModel.longitude,
+                                      WaypointModel.elevation, WaypointModel.name,
+                                      WaypointModel.wp_type, WaypointModel.station,
+                                      WaypointModel.is_set_cur, SequenceModel.identifier)
+                              .join(SequenceModel, JOIN.LEFT_OUTER)
+                              .where(WaypointModel.profile == profile)
+                              .order_by(WaypointModel.id)
+                              .tuples())
+
         wps = list()
-        for waypoint in profile.waypoints:
-            try:
-                sequence = waypoint.sequence.identifier
-            except AttributeError:
-                sequence = 0
-
-            if waypoint.wp_type != "MSN":
-                wp = Waypoint(LatLon(Latitude(waypoint.latitude), Longitude(waypoint.longitude)),
-                              elevation=waypoint.elevation, name=waypoint.name, sequence=sequence,
-                              wp_type=waypoint.wp_type, is_set_cur=waypoint.is_set_cur)
+        for latitude, longitude, elevation, name, wp_type, station, is_set_cur, sequence in query:
+            position = LatLon(Latitude(latitude), Longitude(longitude))
+            if wp_type != "MSN":
+                wp = Waypoint(position, elevation=elevation, name=name, sequence=sequence or 0,
+                              wp_type=wp_type, is_set_cur=is_set_cur)
             else:
-                wp = MSN(LatLon(Latitude(waypoint.latitude), Longitude(waypoint.longitude)),
-                         elevation=waypoint.elevation, name=waypoint.name, sequence=sequence,
-                         wp_type=waypoint.wp_type, station=waypoint.station, is_set_cur=waypoint.is_set_cur)
+                wp = MSN(position, elevation=elevation, name=name, sequence=sequence or 0,
+                         wp_type=wp_type, station=station, is_set_cur=is_set_cur)
             wps.append(wp)
 
         profile = Profile(profile_name, waypoints=wps, aircraft=aircraft, av_setup_name=av_setup_name)
-        profile.update_waypoint_numbers()
+        profile_cache.put(profile)
         logger.debug(f"Fetched {profile_name} from DB, with {len(wps)} waypoints")
         return profile
 
     @staticmethod
     def delete(profile_name):
+        profile_cache.invalidate(profile_name)
         profile = ProfileModel.get(name=profile_name)
 
         for waypoint in profile.waypoints:
@@ -400,6 +490,43 @@ class Profile:
         profile.delete_instance(recursive=True)
 
 
+# cache of resolved avionics setups keyed by ( <name>, <aircraft> ), see AvionicsSetup.resolve.
+# setups are dropped from the cache when their template is saved or deleted from the avionics
+# setup ui and the cache is cleared when a database is opened or closed (see db.py).
+#
+class AvionicsSetupCache:
+    def __init__(self):
+        self.setups = dict()
+
+    def invalidate(self, name=None):
+        if name is None:
+            self.setups.clear()
+        else:
+            for key in [ key for key in self.setups.keys() if key[0] == name ]:
+                del self.setups[key]
+
+av_setup_cache = AvionicsSetupCache()
+
+
+# parse the database form of a viper mfd setup, "<fmt>,..." with the formats for the left
+# mfd osb 14, 13, 12 then the right mfd osb 14, 13, 12, into a tuple of the formats.
+#
+def av_setup_parse_mfd(spec):
+    return tuple(spec.split(","))
+
+# parse the database form of a viper cmds program, "<bq>,<bi>,<sq>,<si>;<bq>,<bi>,<sq>,<si>"
+# with the chaff then flare fields, into a tuple of chaff and flare field tuples.
+#
+def av_setup_parse_cmds(spec):
+    return tuple([ tuple(fields.split(",")) for fields in spec.split(";") ])
+
+
+# an avionics setup for an aircraft, resolved from the template with a name in the database
+# along with the defaults for the aircraft. the resolved setup is expanded once, when the
+# setup is built, into the read-only mapping in the avs_dict attribute. the mfd setups and
+# cmds programs (and their defaults) in avs_dict are also parsed once, into the read-only
+# mapping in the avs_parsed attribute (see av_setup_parse_mfd and av_setup_parse_cmds).
+#
 class AvionicsSetup:
     def __init__(self, name=None, aircraft="viper"):
         self.name = name
@@ -412,10 +539,37 @@ class AvionicsSetup:
             except:
                 self.db_model = None
 
+        self.avs_dict = MappingProxyType(self.expand())
+        self.avs_parsed = MappingProxyType(self.parse())
+
+    # return the avionics setup with a name for an aircraft from av_setup_cache, resolving it
+    # from the database and adding it to the cache if it is not already cached. setups from
+    # the cache are shared and must not be changed.
+    #
+    @staticmethod
+    def resolve(name=None, aircraft="viper"):
+        setup = av_setup_cache.setups.get((name, aircraft))
+        if setup is None:
+            setup = AvionicsSetup(name, aircraft)
+            av_setup_cache.setups[(name, aircraft)] = setup
+        return setup
+
     def __str__(self):
         return json.dumps(self.to_dict())
 
     def to_dict(self):
+        return dict(self.avs_dict)
+
+    def parse(self):
+        avs_parsed = dict()
+        for key, value in self.avs_dict.items():
+            if key.startswith("f16_mfd_setup_") and key != "f16_mfd_setup_opt":
+                avs_parsed[key] = av_setup_parse_mfd(value)
+            elif key.startswith("f16_cmds_setup_p"):
+                avs_parsed[key] = av_setup_parse_cmds(value)
+        return avs_parsed
+
+    def expand(self):
         avs_dict = dict()
         if self.db_model is not None and self.aircraft == "viper":
 
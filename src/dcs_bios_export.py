@@ -0,0 +1,221 @@
+'''
+*
+*  dcs_bios_export.py: DCS-BIOS export stream state
+*
+*  Copyright (C) 2023 twillis/ilominar
+*
+*  This program is free software: you can redistribute it and/or modify
+*  it under the terms of the GNU General Public License as published by
+*  the Free Software Foundation, either version 3 of the License, or
+*  (at your option) any later version.
+*
+*  This program is distributed in the hope that it will be useful,
+*  but WITHOUT ANY WARRANTY; without even the implied warranty of
+*  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+*  GNU General Public License for more details.
+*
+*  You should have received a copy of the GNU General Public License
+*  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+*
+'''
+
+import json
+import socket
+import threading
+
+from time import monotonic, sleep
+
+from src.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# parse the writes from a packet in the DCS-BIOS export stream. returns a list of ( <addr>,
+# <data> ) tuples where <addr> is the starting address of the write and <data> is a bytes
+# object with the data written.
+#
+# frames start with a frame delimiter: { 0x55 0x55 0x55 0x55 }. bytes before the first
+# delimiter are ignored. each element in the frame is encoded as { <addr> <len> <data> } where
+# <addr> is a 2-byte addres, <len> is a 2-byte data length, and <data> is <len> bytes of
+# element data. <addr>, <len>, and integer data are little-endian.
+#
+def dcs_bios_parse_writes(data):
+    writes = [ ]
+    i = data.find(b"\x55\x55\x55\x55")
+    if i == -1:
+        return writes
+    i += 4
+    while i < len(data):
+        if data[i:i+4] == b"\x55\x55\x55\x55":
+            i += 4
+        elif len(data) >= (i + 4):
+            addr = (data[i+1] << 8) + data[i]
+            length = (data[i+3] << 8) + data[i+2]
+            i += 4
+            if len(data) < (i + length):
+                break
+            writes.append((addr, data[i:i+length]))
+            i += length
+        else:
+            break
+    return writes
+
+# load a DCS-BIOS control reference .json file. returns a tuple ( <ints>, <strings> ) where
+# <ints> maps control identifiers onto ( <addr>, <mask>, <shift> ) tuples for the integer
+# output of the control and <strings> maps identifiers onto ( <addr>, <length> ) tuples for
+# the string output of the control. returns empty maps if the file cannot be loaded.
+#
+def dcs_bios_load_control_ref(path):
+    ints = dict()
+    strings = dict()
+    try:
+        with open(path, "r") as f:
+            ref = json.load(f)
+        for category in ref.values():
+            for ident, control in category.items():
+                for output in control.get("outputs", [ ]):
+                    if output.get("type") == "integer" and ident not in ints:
+                        ints[ident] = (output["address"], output["mask"], output["shift_by"])
+                    elif output.get("type") == "string" and ident not in strings:
+                        strings[ident] = (output["address"], output["max_length"])
+    except Exception as e:
+        logger.debug(f"Unable to load control reference {path}: {e}")
+    return ints, strings
+
+
+# tracks the state of the cockpit as reported by the DCS-BIOS export stream. the state is a
+# 64KB image of the DCS-BIOS address space along with a sequence number for each 16-bit word
+# that identifies the update that last changed the word. threads may wait for the state to
+# satisfy a predicate.
+#
+class DcsBiosExportState:
+    def __init__(self):
+        self.mem = bytearray(65536)
+        self.mem_seq = [ 0 ] * 32768
+        self.seq = 0
+        self.time_update = None
+        self.cond = threading.Condition()
+        self.listen_thread = None
+        self.is_listening = False
+        self.port = None
+
+    # update the state from a packet from the export stream. returns a list of the addresses
+    # of the 16-bit words that changed.
+    #
+    def update(self, data):
+        changed = [ ]
+        with self.cond:
+            self.seq += 1
+            for addr, wr_data in dcs_bios_parse_writes(data):
+                for j in range(0, len(wr_data) - 1, 2):
+                    word_addr = (addr + j) & 0xfffe
+                    if self.mem[word_addr] != wr_data[j] or self.mem[word_addr+1] != wr_data[j+1]:
+                        self.mem[word_addr] = wr_data[j]
+                        self.mem[word_addr+1] = wr_data[j+1]
+                        self.mem_seq[word_addr >> 1] = self.seq
+                        changed.append(word_addr)
+            self.time_update = monotonic()
+            self.cond.notify_all()
+        return changed
+
+    def word(self, addr):
+        return (self.mem[addr+1] << 8) + self.mem[addr]
+
+    def value(self, addr, mask, shift):
+        return (self.word(addr) & mask) >> shift
+
+    # return True if any word in [addr, addr + length) has changed after update seq.
+    #
+    def is_changed_since(self, addr, length, seq):
+        for word_addr in range(addr & 0xfffe, addr + length, 2):
+            if self.mem_seq[word_addr >> 1] > seq:
+                return True
+        return False
+
+    # return True if the export stream has updated the state within the last max_age seconds.
+    #
+    def is_live(self, max_age=1.0):
+        return self.time_update is not None and (monotonic() - self.time_update) < max_age
+
+    # wait until predicate (called with the condition lock held) returns True or the timeout
+    # expires. returns the last value of the predicate.
+    #
+    def wait_for(self, predicate, timeout):
+        with self.cond:
+            return self.cond.wait_for(predicate, timeout)
+
+    # listen for the export stream on a udp socket and update the state from it on a
+    # background thread. use this when nothing else is feeding the state. port 0 picks an
+    # unused port, see the port attribute.
+    #
+    def listen(self, host="127.0.0.1", port=7777):
+        if self.listen_thread is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            sock.settimeout(0.5)
+            sock.bind((host, port))
+            self.port = sock.getsockname()[1]
+            self.is_listening = True
+            self.listen_thread = threading.Thread(target=self.listen_thread_fn, args=(sock,),
+                                                  daemon=True)
+            self.listen_thread.start()
+
+    def listen_thread_fn(self, sock):
+        while self.is_listening:
+            try:
+                data, _ = sock.recvfrom(4096)
+                self.update(data)
+            except socket.error:
+                continue
+        sock.close()
+
+    def stop(self):
+        self.is_listening = False
+        if self.listen_thread is not None:
+            self.listen_thread.join()
+            self.listen_thread = None
+
+
+# paces button presses on acknowledgements from the export stream rather than fixed delays.
+# a press is acknowledged when the integer outputs of the controls it commands reach the
+# commanded values. a release may also require one of the displays (a list of ( <addr>,
+# <length> ) tuples) to change before it is acknowledged. waits are limited to a timeout (the
+# fixed delay) so that presses without a known output, or a stalled export stream, fall back
+# to fixed delays.
+#
+class DcsBiosAckPacer:
+    def __init__(self, state, controls, displays=None):
+        self.state = state
+        self.controls = controls
+        self.displays = [ ] if displays is None else displays
+
+    def mark(self):
+        return self.state.seq
+
+    # wait for an acknowledgement of the dcs-bios commands cmds (e.g., "ICP_BTN_1 1") that were
+    # sent after update seq. if is_display is True, a display must also change after update
+    # seq for the acknowledgement. returns True if acknowledged, False if the wait timed out.
+    #
+    def wait(self, cmds, seq, timeout, is_display=False):
+        expects = [ ]
+        for cmd in cmds:
+            tokens = cmd.split(" ")
+            if len(tokens) == 2 and tokens[0] in self.controls and tokens[1].isdigit():
+                expects.append((self.controls[tokens[0]], int(tokens[1])))
+
+        if len(expects) == 0 or not self.state.is_live():
+            sleep(timeout)
+            return False
+
+        def is_acked():
+            if not all([ self.state.value(*output) == value for output, value in expects ]):
+                return False
+            return not is_display or len(self.displays) == 0 or \
+                   any([ self.state.is_changed_since(addr, length, seq) for addr, length in self.displays ])
+
+        return self.state.wait_for(is_acked, timeout)
+
+
+# shared export stream state, fed by the export stream parser thread.
+#
+dcs_bios_export_state = DcsBiosExportState()
@@ -21,10 +21,11 @@
 
 import socket
 
+from src.dcs_bios_export import dcs_bios_export_state
 from src.gui_util import gui_is_dcs_foreground
 from src.logger import get_logger
 
-from time import sleep
+from time import monotonic
 
 # maps internal airframe name onto map defining a set of cockpit buttons to use for loading
 # a profile ("load"), toggling the item select type ("type"), and selecting the next item
@@ -46,6 +47,11 @@ exp_button_map = {
 logger = get_logger(__name__)
 
 
+# export stream parser thread. the thread feeds the shared export stream state (see
+# dcs_bios_export.py) that drivers use to pace button presses, and triggers the profile load
+# and item select hot keys in the main ui when the tracked cockpit buttons are pressed while
+# dcs is in the foreground.
+#
 def dcs_exp_parse_thread(wpe_gui, host = "127.0.0.1", port = 7777):
 
     logger.info("DCS-BIOS export stream parser thread starting")
@@ -57,16 +63,19 @@ def dcs_exp_parse_thread(wpe_gui, host = "127.0.0.1", port = 7777):
     sock.bind((host, port))
 
     af_btn_map = None
+    af_mem_map = { }
+    time_af_update = 0.0
 
-    # TODO: do we want to throttle this a bit?
     while not wpe_gui.is_dcswe_exiting:
 
         # if dcs is not in the foreground, we will track the current airframe to update the
-        # export details we are going to track. we'll skip checking the export stream at this
-        # point since dcs is not foreground.
+        # export details we are going to track, at most once every two seconds. hot keys are
+        # only triggered when dcs is foreground.
         #
-        if not gui_is_dcs_foreground():
-            exp_params = exp_button_map[wpe_gui.profile_airframe()]
+        is_foreground = gui_is_dcs_foreground()
+        if not is_foreground and (monotonic() - time_af_update) > 2.0:
+            time_af_update = monotonic()
+            exp_params = exp_button_map.get(wpe_gui.profile_airframe())
             if exp_params is not None:
                 af_btn_map = {
                     wpe_gui.hkey_profile_enter_in_jet : exp_params["load"],
@@ -79,71 +88,38 @@ def dcs_exp_parse_thread(wpe_gui, host = "127.0.0.1", port = 7777):
                         af_mem_map[val["a"]] = 0
             else:
                 af_btn_map = None
-            sleep(2)
-            continue
-        elif af_btn_map == None:
-            sleep(2)
-            continue
 
         # try to pull data from the export stream. if the receive fails, we will loop back
         # around and try again. note that the stream will not come up until player is in
         # pit and exports have started.
         #
         try:
-            data, addr = sock.recvfrom(1024)
+            data, addr = sock.recvfrom(4096)
         except socket.error as e:
             # logger.debug(f"DCS-BIOS export stream parser thread socket error: {e}")
             continue
 
-        # search from the start of the received bytes for a frame delimiter: { 0x55 0x55 0x55 0x55 }
-        # to find the stream index from which we will start parsing. this will effectively throw away
-        # all bytes from before the frame delimiter.
-        #
-        i = 0
-        while i < len(data):
-            if ((data[i] == 0x55) and (data[i+1] == 0x55) and (data[i+2] == 0x55) and (data[i+3] == 0x55)):
-                i += 4
-                break
-            i += 1
-
-        # scan forward from the first delimiter we found in the received byte stream and process the
-        # elements. each element is encoded in the stream as { <addr> <len> <data> } where <addr> is
-        # a 2-byte addres, <len> is a 2-byte data length, and <data> is <len> bytes of element data.
-        # <addr>, <len>, and integer data are little-endian. if we find another frame delimiter, we
-        # will skip over it and continue processing.
+        # update the export stream state. if an update changes a button we track, we will
+        # trigger the appropriate load hot key in the main ui.
         #
-        # if we find an element that writes to a button we track, we will trigger the appropriate load
-        # hot key in the main ui.
-        #
-        while i < len(data):
-            if ((data[i] == 0x55) and (data[i+1] == 0x55) and (data[i+2] == 0x55) and (data[i+3] == 0x55)):
-                i += 4
-            elif len(data) >= (i + 4):
-                btn_addr = (data[i+1] << 8) + data[i]
-                btn_len  = (data[i+3] << 8) + data[i+2]
-                i += 4
-                if len(data) >= (i + btn_len):
-                    af_mem_map_dirty = False
-                    for j in range(0, btn_len - 1, 2):
-                        if (btn_addr + j) in af_mem_map:
-                            data_word = (data[i+j+1] << 8) + data[i+j]
-                            if af_mem_map[btn_addr+j] != data_word:
-                                af_mem_map[btn_addr+j] = data_word
-                                af_mem_map_dirty = True
-                                # TODO: comment this out once we have further indications buttons are working better.
-                                logger.debug(f"Export: WR 0x{btn_addr+j:x} <-- 0x{data_word:x} [{data[i+j]:02x} {data[i+j+1]:02x}]")
-                    i += btn_len
-
-                    if af_mem_map_dirty:
-                        for hkey_fn, btn_info in af_btn_map.items():
-                            if btn_info["a"] in af_mem_map and \
-                               btn_info["v"] == (af_mem_map[btn_info["a"]] & btn_info["m"]) >> btn_info["s"]:
-                                logger.debug(f"Detect PRESS: 0x{btn_info['a']:x} | 0x{af_mem_map[btn_info['a']]:x} & 0x{btn_info['m']:x} >> {btn_info['s']} = {btn_info['v']}")
-                                hkey_fn()
-
-                else:
-                    break
-            else:
-                break
+        changed = dcs_bios_export_state.update(data)
+        if not is_foreground or af_btn_map is None:
+            continue
 
-    logger.info("DCS-BIOS export stream parser thread exiting")
\ No newline at end of file
+        af_mem_map_dirty = False
+        for word_addr in changed:
+            if word_addr in af_mem_map:
+                data_word = dcs_bios_export_state.word(word_addr)
+                af_mem_map[word_addr] = data_word
+                af_mem_map_dirty = True
+                # TODO: comment this out once we have further indications buttons are working better.
+                logger.debug(f"Export: WR 0x{word_addr:x} <-- 0x{data_word:x}")
+
+        if af_mem_map_dirty:
+            for hkey_fn, btn_info in af_btn_map.items():
+                if btn_info["a"] in af_mem_map and \
+                   btn_info["v"] == (af_mem_map[btn_info["a"]] & btn_info["m"]) >> btn_info["s"]:
+                    logger.debug(f"Detect PRESS: 0x{btn_info['a']:x} | 0x{af_mem_map[btn_info['a']]:x} & 0x{btn_info['m']:x} >> {btn_info['s']} = {btn_info['v']}")
+                    hkey_fn()
+
+    logger.info("DCS-BIOS export stream parser thread exiting")
@@ -0,0 +1,226 @@
+'''
+*
+*  driver_bench.py: Benchmark driver press/release timing against requested delays
+*
+*  Copyright (C) 2023 twillis/ilominar
+*
+*  This program is free software: you can redistribute it and/or modify
+*  it under the terms of the GNU General Public License as published by
+*  the Free Software Foundation, either version 3 of the License, or
+*  (at your option) any later version.
+*
+*  This program is distributed in the hope that it will be useful,
+*  but WITHOUT ANY WARRANTY; without even the implied warranty of
+*  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+*  GNU General Public License for more details.
+*
+*  You should have received a copy of the GNU General Public License
+*  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+*
+'''
+
+import argparse
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+
+from time import monotonic, sleep
+
+from src.driver_plan import DriverPlan, DriverPlanExecutor
+from src.drivers import ViperDriver
+from src.logger import get_logger
+from src.prefs import Preferences
+
+
+# the benchmark runs the press path of a real driver (press_with_delay through the plan
+# executor) against a local udp sink that timestamps the datagrams it receives. for each
+# requested delay, it presses a button with that delay as both the release ("hold") and
+# after delays and compares the actual press-to-release and press-to-press intervals seen at
+# the sink with the requested ones. runs are made with the driver's executor ("deadline") and
+# with an executor that chains plain sleep() calls ("sleep"), the way presses were timed
+# before the executor scheduled against deadlines, both at idle and with synthetic cpu load.
+#
+# a delay is usable if the timing error stays small relative to it: the 99th percentile of
+# the absolute error in both intervals must be within BENCH_MAX_ERROR of the delay. below the
+# smallest usable delay, timing error rather than dcs becomes the limit on how low the delay
+# preferences can go.
+#
+BENCH_MAX_ERROR = 0.10
+BENCH_DELAYS = [ 0.005, 0.010, 0.020, 0.030, 0.050, 0.100, 0.150 ]
+BENCH_PRESSES = 50
+BENCH_BUTTON = "ICP_BTN_1"
+
+
+# executor that waits with a single sleep() for each delay and schedules each command from
+# the time the previous wait ended, so oversleeping accumulates.
+#
+class DriverBenchSleepExecutor(DriverPlanExecutor):
+    def wait_until(self, deadline):
+        t_start = monotonic()
+        if deadline > t_start:
+            sleep(deadline - t_start)
+        now = monotonic()
+        self.t_wait += now - t_start
+        self.jitter.add(now - deadline)
+        return now
+
+
+# udp endpoint that stands in for dcs-bios, recording the receive time and contents of each
+# dcs-bios command it receives as ( <time>, <command> ) tuples.
+#
+class DriverBenchSink:
+    def __init__(self, host="127.0.0.1"):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.bind((host, 0))
+        self.sock.settimeout(0.1)
+        self.host, self.port = self.sock.getsockname()
+        self.records = [ ]
+        self.is_running = False
+        self.thread = None
+
+    def listen(self):
+        while self.is_running:
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            now = monotonic()
+            for cmd in data.decode("utf-8").splitlines():
+                self.records.append((now, cmd))
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self.listen, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.is_running = False
+        self.thread.join()
+        self.sock.close()
+
+
+# busy loop for the synthetic cpu load.
+#
+def bench_cpu_burn():
+    while True:
+        pass
+
+# return ( <mean>, <p50>, <p99>, <max> ) of the absolute values of a list of errors.
+#
+def bench_error_stats(errors):
+    errors = sorted([ abs(error) for error in errors ])
+    if len(errors) == 0:
+        return (0.0, 0.0, 0.0, 0.0)
+    p50 = errors[int(0.50 * (len(errors) - 1))]
+    p99 = errors[int(0.99 * (len(errors) - 1))]
+    return (sum(errors) / len(errors), p50, p99, errors[-1])
+
+# run num_presses presses of the benchmark button with a delay on a driver, sending to the
+# sink. returns a dictionary with the errors (actual less requested, in seconds) in the
+# press-to-release ("hold") and press-to-press ("interval") intervals.
+#
+def bench_presses(driver, sink, delay, num_presses=BENCH_PRESSES):
+    driver.plan = DriverPlan()
+    try:
+        for _ in range(num_presses):
+            driver.press_with_delay(BENCH_BUTTON, delay_after=delay, delay_release=delay)
+        plan = driver.plan
+    finally:
+        driver.plan = None
+
+    sink.records = [ ]
+    driver.executor.run(plan)
+    t_end = monotonic() + 0.25
+    while len(sink.records) < 2 * num_presses and monotonic() < t_end:
+        sleep(0.01)
+
+    presses = [ t for t, cmd in sink.records if cmd == f"{BENCH_BUTTON} 1" ]
+    releases = [ t for t, cmd in sink.records if cmd == f"{BENCH_BUTTON} 0" ]
+    holds = [ (t_rel - t_prs) - delay for t_prs, t_rel in zip(presses, releases) ]
+    intervals = [ (t_b - t_a) - (2.0 * delay) for t_a, t_b in zip(presses, presses[1:]) ]
+    return { 'hold' : holds, 'interval' : intervals }
+
+# run the benchmark for a set of delays with each scheduler, at idle and under cpu load (with
+# num_burners busy processes, one per cpu if None). returns a list of ( <load>, <scheduler>,
+# <delay>, <hold_stats>, <interval_stats> ) tuples, see bench_error_stats.
+#
+def bench_run(delays=BENCH_DELAYS, num_presses=BENCH_PRESSES, loads=("idle", "cpu"),
+              num_burners=None, logger=None):
+    logger = logger or get_logger("driver_bench")
+    schedulers = { 'sleep' : DriverBenchSleepExecutor, 'deadline' : DriverPlanExecutor }
+    results = [ ]
+    with tempfile.TemporaryDirectory() as path:
+        prefs = Preferences(data_path=path + os.sep)
+        driver = ViperDriver(logger, prefs)
+        sink = DriverBenchSink()
+        sink.start()
+        driver.host, driver.port = sink.host, sink.port
+        try:
+            for load in loads:
+                burners = [ ]
+                if load == "cpu":
+                    for _ in range(num_burners or os.cpu_count() or 1):
+                        burner = multiprocessing.Process(target=bench_cpu_burn, daemon=True)
+                        burner.start()
+                        burners.append(burner)
+                try:
+                    for name, executor_class in schedulers.items():
+                        driver.executor = executor_class(driver)
+                        for delay in delays:
+                            errors = bench_presses(driver, sink, delay, num_presses)
+                            results.append((load, name, delay, bench_error_stats(errors['hold']),
+                                            bench_error_stats(errors['interval'])))
+                finally:
+                    for burner in burners:
+                        burner.terminate()
+                        burner.join()
+        finally:
+            sink.stop()
+            driver.stop()
+    return results
+
+# return the smallest delay in the results for a load and scheduler that is usable (see
+# BENCH_MAX_ERROR), None if no delay is usable.
+#
+def bench_min_delay(results, load, scheduler):
+    usable = [ delay for r_load, r_sched, delay, hold, interval in results
+                     if r_load == load and r_sched == scheduler and
+                        max(hold[2], interval[2]) <= BENCH_MAX_ERROR * delay ]
+    return min(usable) if len(usable) > 0 else None
+
+# return a list of lines with a report on the benchmark results. errors are in milliseconds.
+#
+def bench_report(results):
+    lines = [ f"{'load':<6} {'sched':<9} {'delay':>7} {'hold mean':>10} {'p99':>7} {'max':>7}" +
+              f" {'ivl mean':>10} {'p99':>7} {'max':>7}" ]
+    for load, scheduler, delay, hold, interval in results:
+        lines.append(f"{load:<6} {scheduler:<9} {delay * 1000.0:7.1f} {hold[0] * 1000.0:10.3f}" +
+                     f" {hold[2] * 1000.0:7.3f} {hold[3] * 1000.0:7.3f} {interval[0] * 1000.0:10.3f}" +
+                     f" {interval[2] * 1000.0:7.3f} {interval[3] * 1000.0:7.3f}")
+    lines.append("")
+    lines.append(f"smallest usable delay (p99 error within {BENCH_MAX_ERROR * 100.0:.0f}% of delay):")
+    for load, scheduler in dict.fromkeys([ (r[0], r[1]) for r in results ]):
+        delay = bench_min_delay(results, load, scheduler)
+        text = f"{delay * 1000.0:.1f} ms" if delay is not None else "none of the delays tested"
+        lines.append(f"  {load:<6} {scheduler:<9} {text}")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="driver_bench", description="Benchmark driver press timing")
+    parser.add_argument("--delays", default=",".join([ str(delay) for delay in BENCH_DELAYS ]),
+                        help="comma-separated list of delays to test (seconds)")
+    parser.add_argument("--presses", type=int, default=BENCH_PRESSES, help="presses per delay")
+    parser.add_argument("--burners", type=int, default=None,
+                        help="busy processes for the cpu load (default: one per cpu)")
+    parser.add_argument("--idle-only", action="store_true", help="skip the runs under cpu load")
+    args = parser.parse_args()
+
+    delays = [ float(delay) for delay in args.delays.split(",") ]
+    loads = ("idle",) if args.idle_only else ("idle", "cpu")
+    results = bench_run(delays, args.presses, loads, args.burners)
+    print("\n".join(bench_report(results)))
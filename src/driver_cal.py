@@ -0,0 +1,111 @@
+'''
+*
+*  driver_cal.py: Button delay calibration for airframe drivers
+*
+*  Copyright (C) 2023 twillis/ilominar
+*
+*  This program is free software: you can redistribute it and/or modify
+*  it under the terms of the GNU General Public License as published by
+*  the Free Software Foundation, either version 3 of the License, or
+*  (at your option) any later version.
+*
+*  This program is distributed in the hope that it will be useful,
+*  but WITHOUT ANY WARRANTY; without even the implied warranty of
+*  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+*  GNU General Public License for more details.
+*
+*  You should have received a copy of the GNU General Public License
+*  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+*
+'''
+
+import queue
+
+from time import monotonic
+
+
+# calibration margin applied to the slowest observed latency, and the floor for a calibrated
+# delay. the export stream updates at around 30Hz so latencies are only known to within a
+# frame or so.
+#
+CAL_MARGIN = 1.5
+CAL_FLOOR = 0.05
+
+
+# measures the latency from a press (or release) to the corresponding change in the dcs-bios
+# export stream for each control class a driver has probes for (see Driver.cal_probes). the
+# delays are the slowest latency seen over a number of trials, padded by CAL_MARGIN.
+#
+class DriverCalibrator:
+    def __init__(self, driver, num_trials=4, timeout=1.0):
+        self.driver = driver
+        self.num_trials = num_trials
+        self.timeout = timeout
+
+    def pad(self, latency):
+        return max(round(latency * CAL_MARGIN, 3), CAL_FLOOR)
+
+    # measure the latency of a probe. returns a tuple ( <release>, <after> ) with the latency
+    # from press to acknowledgement and from release to acknowledgement (including a display
+    # update if is_display is True), None if either press or release is not acknowledged
+    # before the timeout.
+    #
+    def measure(self, pacer, press, release, is_display):
+        seq = pacer.mark()
+        t_press = monotonic()
+        self.driver.executor.send(press)
+        if not pacer.wait(press, seq, self.timeout):
+            self.driver.executor.send(release)
+            return None
+        t_release = monotonic()
+        self.driver.executor.send(release)
+        if not pacer.wait(release, seq, self.timeout, is_display=is_display):
+            return None
+        return (t_release - t_press, monotonic() - t_release)
+
+    # run the calibration. returns a dictionary that maps control class onto calibrated
+    # ( <release>, <after> ) delays. classes that could not be calibrated are not included.
+    # see gui_backgrounded_operation() in gui_util.py for details on the queues.
+    #
+    # raises an "Operation Cancelled" exception if the operation is cancelled.
+    #
+    def run(self, command_q=None, progress_q=None):
+        results = dict()
+        pacer = self.driver.setup_ack_pacer()
+        if pacer is None or not pacer.state.wait_for(pacer.state.is_live, 2.0):
+            self.driver.logger.info("Unable to calibrate, no export stream from DCS-BIOS")
+            pacer = None
+
+        prog_step = (1.0 / (len(self.driver.cal_probes) + 1)) * 100.0
+        prog_cur = 0.0
+        for ctrl_class, probes in self.driver.cal_probes.items():
+            if pacer is None:
+                break
+            try:
+                if command_q is not None and command_q.get(False) == "CANCEL":
+                    raise Exception("Operation Cancelled")
+            except queue.Empty:
+                pass
+
+            latencies = [ ]
+            for _ in range(0, self.num_trials):
+                for press, release, is_display in probes:
+                    latencies.append(self.measure(pacer, press, release, is_display))
+            if None not in latencies:
+                results[ctrl_class] = (self.pad(max([ lat[0] for lat in latencies ])),
+                                       self.pad(max([ lat[1] for lat in latencies ])))
+                self.driver.logger.info(f"Calibrated {self.driver.airframe} {ctrl_class}: " +
+                                        f"{results[ctrl_class][0]:.3f}s / {results[ctrl_class][1]:.3f}s")
+            else:
+                self.driver.logger.info(f"Unable to calibrate {self.driver.airframe} {ctrl_class}," +
+                                        " probe not acknowledged")
+
+            if progress_q is not None:
+                prog_cur = min(prog_cur + prog_step, 100.0)
+                progress_q.put(prog_cur)
+
+        if progress_q is not None:
+            progress_q.put(100)
+            progress_q.put("DONE")
+
+        return results
@@ -0,0 +1,587 @@
+'''
+*
+*  driver_plan.py: Command plans for airframe drivers
+*
+*  Copyright (C) 2023 twillis/ilominar
+*
+*  This program is free software: you can redistribute it and/or modify
+*  it under the terms of the GNU General Public License as published by
+*  the Free Software Foundation, either version 3 of the License, or
+*  (at your option) any later version.
+*
+*  This program is distributed in the hope that it will be useful,
+*  but WITHOUT ANY WARRANTY; without even the implied warranty of
+*  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+*  GNU General Public License for more details.
+*
+*  You should have received a copy of the GNU General Public License
+*  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+*
+'''
+
+import keyboard
+import queue
+import threading
+
+from dataclasses import asdict, dataclass, replace
+from time import monotonic, sleep
+
+
+# a driver command plan is an ordered list of commands that enter a profile into the jet.
+# drivers build plans using the same entry methods that would otherwise talk to dcs-bios
+# directly (see Driver in drivers.py). once built, a plan can be inspected, timed, or handed
+# to an executor to send to dcs-bios. commands have one of the following operations,
+#
+#   PRESS   send dcs-bios "press" commands, wait "hold" seconds, send dcs-bios "release"
+#           commands, wait "after" seconds
+#   SEND    send dcs-bios "press" commands, wait "after" seconds (e.g., raw commands)
+#   WAIT    wait "after" seconds
+#   KEY     send keyboard hot key "key" to dcs, wait "after" seconds
+#   STEP    marks the end of a step in the entry (e.g., a waypoint)
+#   PHASE   marks the start of phase "key" of the entry (e.g., "waypoints")
+#   NOTE    logs "key" when the executor reaches it (e.g., "Entering waypoint 1")
+#
+# dcs-bios commands are strings without the trailing newline (e.g., "ICP_BTN_1 1").
+#
+@dataclass(frozen=True)
+class DriverCmd:
+    op: str
+    press: tuple = ()
+    release: tuple = ()
+    hold: float = 0.0
+    after: float = 0.0
+    key: str = None
+
+    @property
+    def duration(self):
+        return self.hold + self.after
+
+    def __str__(self):
+        if self.op == "PRESS":
+            return f"PRESS {' | '.join(self.press)} ({self.hold:.3f}) {' | '.join(self.release)} ({self.after:.3f})"
+        elif self.op == "SEND":
+            return f"SEND  {' | '.join(self.press)} ({self.after:.3f})"
+        elif self.op == "WAIT":
+            return f"WAIT  ({self.after:.3f})"
+        elif self.op == "KEY":
+            return f"KEY   {self.key} ({self.after:.3f})"
+        elif self.op == "PHASE":
+            return f"PHASE {self.key}"
+        elif self.op == "NOTE":
+            return f"NOTE  {self.key}"
+        return self.op
+
+
+# statistics from a plan optimization pass (see DriverPlan.optimize).
+#
+@dataclass
+class DriverPlanOptStats:
+    num_presses: int = 0
+    num_waits: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return f"removed {self.num_presses} presses ({self.seconds:.2f}s), merged {self.num_waits} waits"
+
+
+# timing jitter from running a plan (see DriverPlanExecutor.run). jitter is how late (in
+# seconds) the executor reached each deadline in the plan.
+#
+@dataclass
+class DriverPlanJitter:
+    num_waits: int = 0
+    total: float = 0.0
+    worst: float = 0.0
+
+    @property
+    def mean(self):
+        return self.total / self.num_waits if self.num_waits > 0 else 0.0
+
+    def add(self, late):
+        self.num_waits += 1
+        self.total += late
+        self.worst = max(self.worst, late)
+
+    def __str__(self):
+        return f"{self.num_waits} deadlines, mean {self.mean * 1000.0:.1f}ms late, worst {self.worst * 1000.0:.1f}ms late"
+
+
+# timing for a phase of a plan run (see DriverPlanExecutor.run). a span covers the commands
+# from a PHASE command up to the next PHASE command or the end of the plan. t_send is the time
+# spent sending to dcs-bios (or the keyboard) and t_wait is the time spent waiting on delays
+# or acknowledgements, both in seconds.
+#
+@dataclass
+class DriverPlanSpan:
+    phase: str
+    t_start: float = 0.0
+    duration: float = 0.0
+    planned: float = 0.0
+    num_presses: int = 0
+    t_send: float = 0.0
+    t_wait: float = 0.0
+
+    def to_dict(self):
+        span = asdict(self)
+        del span['t_start']
+        return span
+
+    def __str__(self):
+        return f"{self.phase}: {self.duration:.2f}s ({self.planned:.2f}s planned), {self.num_presses} presses," + \
+               f" {self.t_send:.3f}s sending, {self.t_wait:.2f}s waiting"
+
+
+class DriverPlan:
+    def __init__(self, cmds=None):
+        self.cmds = list() if cmds is None else list(cmds)
+        self.opt_stats = None
+
+    def __len__(self):
+        return len(self.cmds)
+
+    def __iter__(self):
+        return iter(self.cmds)
+
+    def __str__(self):
+        lines = [ f"{t:9.3f}  {cmd}" for t, cmd in self.timeline() ]
+        lines.append(f"{self.duration:9.3f}  END ({self.num_presses} presses, {self.num_steps} steps)")
+        return "\n".join(lines)
+
+    # ================ plan construction
+
+    def append(self, cmd):
+        self.cmds.append(cmd)
+
+    def step(self):
+        self.cmds.append(DriverCmd("STEP"))
+
+    def phase(self, name):
+        self.cmds.append(DriverCmd("PHASE", key=name))
+
+    def note(self, text):
+        self.cmds.append(DriverCmd("NOTE", key=text))
+
+    # ================ plan properties
+
+    @property
+    def num_presses(self):
+        return len([ cmd for cmd in self.cmds if cmd.op in ("PRESS", "SEND", "KEY") ])
+
+    @property
+    def num_steps(self):
+        return len([ cmd for cmd in self.cmds if cmd.op == "STEP" ])
+
+    @property
+    def duration(self):
+        return sum([ cmd.duration for cmd in self.cmds ])
+
+    # ================ plan optimization
+
+    # peephole optimization of the plan. returns a tuple ( <plan>, <stats> ) with the optimized
+    # plan and a DriverPlanOptStats with the presses and time removed (the optimized plan also
+    # keeps the stats in opt_stats). the optimizer,
+    #
+    #   1) drops presses of an idempotent control beyond the number of back-to-back presses
+    #      that have an effect. idempotent maps the "press" commands of a PRESS onto the
+    #      maximum useful run length (e.g., { ("ICP_DATA_RTN_SEQ_SW 0",) : 1 }).
+    #   2) drops back-to-back presses that cancel each other out. inverses maps the "press"
+    #      commands of a PRESS onto the "press" commands of its inverse.
+    #   3) merges adjacent waits into a single wait, folding a WAIT into the "after" delay
+    #      of the command before it where possible.
+    #
+    # presses are back-to-back if only WAIT, STEP, PHASE, or NOTE commands separate them.
+    # removing a press removes its "hold" and "after" delays, explicit waits are preserved.
+    #
+    def optimize(self, idempotent=None, inverses=None):
+        idempotent = dict() if idempotent is None else idempotent
+        inverses = dict() if inverses is None else inverses
+        stats = DriverPlanOptStats()
+
+        cmds = [ ]
+        for cmd in self.cmds:
+            if cmd.op == "PRESS":
+                prev = None
+                run = 0
+                for i in range(len(cmds) - 1, -1, -1):
+                    if cmds[i].op in ("WAIT", "STEP", "PHASE", "NOTE"):
+                        continue
+                    if prev is None:
+                        prev = i
+                    if cmds[i].op != "PRESS" or cmds[i].press != cmd.press:
+                        break
+                    run += 1
+                if cmd.press in idempotent and run >= idempotent[cmd.press]:
+                    stats.num_presses += 1
+                    stats.seconds += cmd.duration
+                    continue
+                if prev is not None and cmds[prev].op == "PRESS" and \
+                   inverses.get(cmd.press) == cmds[prev].press:
+                    stats.num_presses += 2
+                    stats.seconds += cmd.duration + cmds[prev].duration
+                    del cmds[prev]
+                    continue
+            cmds.append(cmd)
+
+        merged = [ ]
+        for cmd in cmds:
+            if cmd.op == "WAIT" and len(merged) > 0 and merged[-1].op in ("PRESS", "SEND", "KEY", "WAIT"):
+                merged[-1] = replace(merged[-1], after=merged[-1].after + cmd.after)
+                stats.num_waits += 1
+            else:
+                merged.append(cmd)
+
+        plan = DriverPlan(merged)
+        plan.opt_stats = stats
+        return plan, stats
+
+    # return a list of ( <time>, <command> ) tuples for the plan where <time> is the offset
+    # (in seconds) from the start of the plan at which the command starts.
+    #
+    def timeline(self):
+        timeline = [ ]
+        t = 0.0
+        for cmd in self.cmds:
+            timeline.append((t, cmd))
+            t += cmd.duration
+        return timeline
+
+
+# the executor spins rather than sleeps for the last EXEC_SPIN seconds before a deadline to
+# avoid os sleep granularity. a deadline reached more than EXEC_MAX_LATE seconds late moves
+# the schedule back so that the executor never shortens a delay by more than EXEC_MAX_LATE
+# seconds to catch up.
+#
+EXEC_SPIN = 0.002
+EXEC_MAX_LATE = 0.005
+
+# dcs-bios accepts several newline-separated commands in a datagram. datagrams the executor
+# coalesces are limited to EXEC_MAX_DATAGRAM bytes.
+#
+EXEC_MAX_DATAGRAM = 1024
+
+
+# executes a plan against the dcs-bios endpoint a driver is bound to, or the ( <host>, <port> )
+# endpoint dest if not None. commands are scheduled
+# against absolute deadlines on the monotonic clock (the planned start time of the command)
+# rather than chained sleeps so that time spent sending and oversleeping does not accumulate
+# over the plan.
+#
+# while running a plan, the executor coalesces dcs-bios commands that are due at the same
+# time into one datagram: the commands of a PRESS or SEND, and commands that are not followed
+# by a delay (e.g., the release of a rocker with no "after" delay) with the commands that
+# follow them, provided they command different controls.
+#
+# when recorder is set (see DriverTraceRecorder in driver_trace.py), the executor records the
+# datagrams it sends and the phases of the plans it runs to a trace.
+#
+# when pacer is set (see DcsBiosAckPacer in dcs_bios_export.py), the executor paces presses on
+# acknowledgements from the dcs-bios export stream, using the "hold" and "after" delays of a
+# PRESS as timeouts rather than fixed delays.
+#
+class DriverPlanExecutor:
+    def __init__(self, driver, dest=None):
+        self.driver = driver
+        self.dest = dest
+        self.pacer = None
+        self.recorder = None
+        self.payloads = dict()
+        self.datagram_cache = dict()
+        self.deferred = ()
+        self.is_coalescing = False
+        self.jitter = DriverPlanJitter()
+        self.spans = [ ]
+        self.t_send = 0.0
+        self.t_wait = 0.0
+
+    # return the udp payload for a dcs-bios command. payloads are encoded once and cached in
+    # payloads (which only holds single commands and may be shared between executors) so that
+    # sending a command only needs a lookup.
+    #
+    def payload(self, cmd):
+        payload = self.payloads.get(cmd)
+        if payload is None:
+            payload = f"{cmd}\n".encode("utf-8")
+            self.payloads[cmd] = payload
+        return payload
+
+    # return the list of datagrams that carry a tuple of dcs-bios commands. datagrams are
+    # built once and cached in datagram_cache. as coalescing builds new tuples of commands,
+    # the cache is cleared at the start of each plan run to keep it from growing over a
+    # session.
+    #
+    def datagrams(self, cmds):
+        datagrams = self.datagram_cache.get(cmds)
+        if datagrams is None:
+            datagrams = [ b"" ]
+            for cmd in cmds:
+                payload = self.payload(cmd)
+                if len(datagrams[-1]) > 0 and len(datagrams[-1]) + len(payload) > EXEC_MAX_DATAGRAM:
+                    datagrams.append(b"")
+                datagrams[-1] += payload
+            self.datagram_cache[cmds] = datagrams
+        return datagrams
+
+    # encode the payloads for the dcs-bios commands in a plan ahead of running the plan.
+    #
+    def prepare(self, plan):
+        for cmd in plan:
+            for dcs_cmds in (cmd.press, cmd.release):
+                if len(dcs_cmds) > 0:
+                    self.datagrams(dcs_cmds)
+
+    # send a tuple of dcs-bios commands to the driver's endpoint, returns True if all
+    # commands were sent in their entirety, False otherwise.
+    #
+    def send(self, cmds):
+        t_start = monotonic()
+        sendto = self.driver.s.sendto
+        dest = self.dest or (self.driver.host, self.driver.port)
+        is_sent = True
+        for datagram in self.datagram_cache.get(cmds) or self.datagrams(tuple(cmds)):
+            if sendto(datagram, dest) != len(datagram):
+                is_sent = False
+            if self.recorder is not None:
+                self.recorder.record(datagram)
+        self.t_send += monotonic() - t_start
+        return is_sent
+
+    def is_independent(self, cmds_a, cmds_b):
+        idents_a = [ cmd.split(" ")[0] for cmd in cmds_a ]
+        return all([ cmd.split(" ")[0] not in idents_a for cmd in cmds_b ])
+
+    # send the deferred dcs-bios commands (see send_before), if any.
+    #
+    def flush(self):
+        deferred = self.deferred
+        self.deferred = ()
+        return self.send(deferred) if len(deferred) > 0 else True
+
+    # send dcs-bios commands now along with the deferred commands (see send_before). deferred
+    # commands that command the same controls go out first in their own datagram.
+    #
+    def send_coalesced(self, cmds):
+        if len(self.deferred) > 0 and not self.is_independent(self.deferred, cmds):
+            self.flush()
+        cmds = self.deferred + cmds
+        self.deferred = ()
+        return self.send(cmds)
+
+    # send dcs-bios commands that are followed by a delay of after seconds. while coalescing,
+    # commands followed by no delay are deferred to go out with the next commands sent.
+    #
+    def send_before(self, cmds, after):
+        if self.is_coalescing and after <= 0.0:
+            if len(self.deferred) > 0 and not self.is_independent(self.deferred, cmds):
+                self.flush()
+            self.deferred = self.deferred + cmds
+            return True
+        return self.send_coalesced(cmds)
+
+    # wait until the deadline, recording how late the deadline was reached. returns the
+    # deadline to schedule from next (see EXEC_MAX_LATE).
+    #
+    def wait_until(self, deadline):
+        t_start = monotonic()
+        delay = deadline - t_start
+        if delay > EXEC_SPIN:
+            sleep(delay - EXEC_SPIN)
+        while monotonic() < deadline:
+            pass
+        now = monotonic()
+        self.t_wait += now - t_start
+        self.jitter.add(now - deadline)
+        return max(deadline, now - EXEC_MAX_LATE)
+
+    # execute a single command scheduled to start at deadline t. returns a tuple ( <deadline>,
+    # <sent> ) with the deadline to start the next command at and True if the dcs-bios
+    # commands the command sends were sent in their entirety, False otherwise.
+    #
+    def run_cmd_at(self, cmd, t):
+        is_sent = True
+        if cmd.op == "PRESS" and self.pacer is not None:
+            seq = self.pacer.mark()
+            is_sent = self.send_coalesced(cmd.press)
+            t_start = monotonic()
+            self.pacer.wait(cmd.press, seq, cmd.hold)
+            self.t_wait += monotonic() - t_start
+            is_sent = self.send(cmd.release) and is_sent
+            t_start = monotonic()
+            self.pacer.wait(cmd.release, seq, cmd.after, is_display=True)
+            now = monotonic()
+            self.t_wait += now - t_start
+            return now, is_sent
+        elif cmd.op == "PRESS":
+            is_sent = self.send_coalesced(cmd.press)
+            t = self.wait_until(t + cmd.hold)
+            is_sent = self.send_before(cmd.release, cmd.after) and is_sent
+        elif cmd.op == "SEND":
+            is_sent = self.send_before(cmd.press, cmd.after)
+        elif cmd.op == "WAIT":
+            is_sent = self.flush()
+        elif cmd.op == "KEY":
+            is_sent = self.flush()
+            t_start = monotonic()
+            keyboard.send(cmd.key)
+            self.t_send += monotonic() - t_start
+        return self.wait_until(t + cmd.after), is_sent
+
+    # execute a single command now, returns True if the dcs-bios commands the command sends
+    # were sent in their entirety, False otherwise.
+    #
+    def run_cmd(self, cmd):
+        _, is_sent = self.run_cmd_at(cmd, monotonic())
+        return is_sent
+
+    def is_cancelled(self, command_q):
+        try:
+            return command_q is not None and command_q.get(False) == "CANCEL"
+        except queue.Empty:
+            return False
+
+    # start a timing span for a phase of the plan, ending the current span (if any).
+    #
+    def span_begin(self, phase):
+        now = monotonic()
+        self.span_end(now)
+        self.spans.append(DriverPlanSpan(phase, t_start=now))
+        self.t_send = 0.0
+        self.t_wait = 0.0
+
+    def span_end(self, now):
+        if len(self.spans) > 0:
+            span = self.spans[-1]
+            span.duration = now - span.t_start
+            span.t_send = self.t_send
+            span.t_wait = self.t_wait
+
+    # execute a plan. on return, the jitter attribute holds the jitter for the run and the
+    # spans attribute holds a list of DriverPlanSpan timing spans, one per phase. cancellation
+    # is checked before every command in the plan. progress is weighted by the planned time of
+    # the commands run so far and is reported as a tuple ( <percent>, <eta> ) each time it
+    # advances by at least a percent. <eta> is the remaining planned time (in seconds), scaled
+    # by how the actual time so far compares to the plan. see gui_backgrounded_operation() in
+    # gui_util.py for details on the queues.
+    #
+    # raises an "Operation Cancelled" exception if the operation is cancelled.
+    #
+    def run(self, plan, command_q=None, progress_q=None):
+        self.datagram_cache = dict()
+        self.prepare(plan)
+        self.jitter = DriverPlanJitter()
+        self.spans = [ ]
+        duration = plan.duration
+        t_plan = 0.0
+        t_start = monotonic()
+        t = t_start
+        prog_last = 0.0
+        if self.recorder is not None:
+            self.recorder.begin(self.driver.airframe)
+        self.span_begin("setup")
+        self.is_coalescing = True
+        try:
+            for cmd in plan:
+                if self.is_cancelled(command_q):
+                    raise Exception("Operation Cancelled")
+                if cmd.op == "PHASE":
+                    self.span_begin(cmd.key)
+                    if self.recorder is not None:
+                        self.recorder.phase(cmd.key)
+                elif cmd.op == "NOTE":
+                    if self.dest is None:
+                        self.driver.logger.info(cmd.key)
+                    else:
+                        self.driver.logger.info(f"{self.dest[0]}:{self.dest[1]}: {cmd.key}")
+                elif cmd.op != "STEP":
+                    t, _ = self.run_cmd_at(cmd, t)
+                    t_plan += cmd.duration
+                    self.spans[-1].planned += cmd.duration
+                    if cmd.op in ("PRESS", "SEND", "KEY"):
+                        self.spans[-1].num_presses += 1
+                    prog_cur = min((t_plan / duration) * 100.0, 100.0) if duration > 0.0 else 100.0
+                    if progress_q is not None and prog_cur - prog_last >= 1.0:
+                        pace = (monotonic() - t_start) / t_plan if t_plan > 0.0 else 1.0
+                        progress_q.put((prog_cur, max(duration - t_plan, 0.0) * pace))
+                        prog_last = prog_cur
+        finally:
+            self.flush()
+            self.is_coalescing = False
+            self.span_end(monotonic())
+            self.spans = [ span for span in self.spans if span.planned > 0.0 or span.num_presses > 0 ]
+            if self.recorder is not None:
+                self.recorder.end()
+
+        if progress_q is not None:
+            progress_q.put((100.0, 0.0))
+            progress_q.put("DONE")
+
+
+# runs plans against several dcs-bios endpoints in parallel, one executor and thread per
+# endpoint. a failure at one endpoint does not affect the others.
+#
+class DriverPlanFanout:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run_endpoint(self, endpoint, executor, plan, command_q, progress_q, results):
+        try:
+            executor.run(plan, command_q=command_q, progress_q=progress_q)
+            self.driver.logger.info(f"Entered at {endpoint[0]}:{endpoint[1]}, jitter: {executor.jitter}")
+            results[endpoint] = True
+        except Exception as e:
+            self.driver.logger.info(f"Entry at {endpoint[0]}:{endpoint[1]} failed: {e}")
+
+    # update the ( <percent>, <eta>, <percent reported> ) progress of each worker from its
+    # progress queue, reporting the progress of workers that have advanced by at least a
+    # percent (or have just finished) as ( <endpoint>, <percent>, <eta> ) tuples.
+    #
+    def poll_workers(self, workers, progress_q):
+        for endpoint, _, _, worker_prog_q, progress in workers:
+            while not worker_prog_q.empty():
+                prog = worker_prog_q.get(False)
+                if type(prog) == tuple:
+                    progress[0], progress[1] = prog
+            is_advanced = ((progress[0] - progress[2] >= 1.0) or
+                           (progress[0] >= 100.0 and progress[2] < 100.0))
+            if progress_q is not None and is_advanced:
+                progress_q.put((endpoint, progress[0], progress[1]))
+                progress[2] = progress[0]
+
+    # run plans, a dictionary that maps ( <host>, <port> ) endpoints onto the plan to run at
+    # the endpoint. a cancel cancels all endpoints. progress is reported as with
+    # DriverPlanExecutor.run for the endpoint that is furthest behind, along with the progress
+    # at each endpoint as ( <endpoint>, <percent>, <eta> ) tuples. returns a dictionary that
+    # maps endpoints onto True if the plan ran to completion at the endpoint, False otherwise.
+    #
+    def run(self, plans, command_q=None, progress_q=None):
+        results = { endpoint : False for endpoint in plans.keys() }
+        workers = [ ]
+        for endpoint, plan in plans.items():
+            executor = DriverPlanExecutor(self.driver, dest=endpoint)
+            executor.payloads = self.driver.executor.payloads
+            worker_cmd_q = queue.Queue()
+            worker_prog_q = queue.Queue()
+            thread = threading.Thread(target=self.run_endpoint, daemon=True,
+                                      args=(endpoint, executor, plan, worker_cmd_q, worker_prog_q, results))
+            workers.append((endpoint, thread, worker_cmd_q, worker_prog_q, [ 0.0, plan.duration, 0.0 ]))
+            thread.start()
+
+        prog_last = 0.0
+        while any([ worker[1].is_alive() for worker in workers ]):
+            if self.driver.executor.is_cancelled(command_q):
+                for worker in workers:
+                    worker[2].put("CANCEL")
+            self.poll_workers(workers, progress_q)
+            prog_cur = min([ worker[4][0] for worker in workers ])
+            if progress_q is not None and prog_cur - prog_last >= 1.0:
+                progress_q.put((prog_cur, max([ worker[4][1] for worker in workers ])))
+                prog_last = prog_cur
+            sleep(0.05)
+        for worker in workers:
+            worker[1].join()
+        self.poll_workers(workers, progress_q)
+
+        if progress_q is not None:
+            progress_q.put((100.0, 0.0))
+            progress_q.put("DONE")
+
+        return results
@@ -0,0 +1,210 @@
+'''
+*
+*  driver_trace.py: Record, replay, and compare traces of driver dcs-bios traffic
+*
+*  Copyright (C) 2023 twillis/ilominar
+*
+*  This program is free software: you can redistribute it and/or modify
+*  it under the terms of the GNU General Public License as published by
+*  the Free Software Foundation, either version 3 of the License, or
+*  (at your option) any later version.
+*
+*  This program is distributed in the hope that it will be useful,
+*  but WITHOUT ANY WARRANTY; without even the implied warranty of
+*  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+*  GNU General Public License for more details.
+*
+*  You should have received a copy of the GNU General Public License
+*  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+*
+'''
+
+import argparse
+import mmap
+import os
+import socket
+import struct
+
+from time import monotonic, sleep
+
+
+# a trace file starts with a header, { <magic> <version> }, followed by records. each record
+# is encoded as { <time> <kind> <len> <data> } where <time> is a double with the monotonic
+# time of the record, <kind> is a byte with the record kind, <len> is a 2-byte data length,
+# and <data> is <len> bytes of record data. all values are little-endian. records are only
+# ever appended so that several loads can be recorded to the same file. record kinds are,
+#
+#   BEGIN   start of a load, data is the airframe
+#   SEND    dcs-bios datagram sent to the jet, data is the datagram
+#   PHASE   start of an entry phase (e.g., "waypoints"), data is the phase name
+#   END     end of a load
+#
+TRACE_MAGIC = b"DCSWETRC"
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct("<8sI")
+TRACE_RECORD = struct.Struct("<dBH")
+
+TRACE_BEGIN = 0
+TRACE_SEND = 1
+TRACE_PHASE = 2
+TRACE_END = 3
+
+DRIVER_TRACE_PATH = "trace.bin"
+
+
+# load the records from a trace file. returns a list of loads where each load is a list of
+# ( <time>, <kind>, <data> ) tuples with <time> relative to the start of the load. raises
+# ValueError if the file is not a trace file.
+#
+def driver_trace_load_all(path):
+    loads = [ ]
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mem:
+        magic, version = TRACE_HEADER.unpack_from(mem, 0)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise ValueError(f"{path} is not a trace file")
+        i = TRACE_HEADER.size
+        t_begin = 0.0
+        while i + TRACE_RECORD.size <= len(mem):
+            t, kind, length = TRACE_RECORD.unpack_from(mem, i)
+            i += TRACE_RECORD.size
+            data = bytes(mem[i:i+length])
+            i += length
+            if kind == TRACE_BEGIN:
+                t_begin = t
+                loads.append([ ])
+            if len(loads) > 0:
+                loads[-1].append((t - t_begin, kind, data))
+    return loads
+
+# load a single load from a trace file, the last load by default (index works like a list
+# index). see driver_trace_load_all.
+#
+def driver_trace_load(path, index=-1):
+    return driver_trace_load_all(path)[index]
+
+# return the dcs-bios commands sent in a load from a trace. a datagram may carry several
+# newline-terminated commands (see DriverPlanExecutor).
+#
+def driver_trace_cmds(records):
+    return [ cmd for _, kind, data in records if kind == TRACE_SEND for cmd in data.splitlines() ]
+
+# return statistics for a load from a trace. returns a dictionary with the airframe, the number
+# of dcs-bios commands ("num_cmds") and datagrams ("num_sends") sent, the duration of the load,
+# and a dictionary that maps phases onto the time spent in the phase ("phases").
+#
+def driver_trace_stats(records):
+    stats = { 'airframe' : None, 'num_cmds' : 0, 'num_sends' : 0, 'duration' : 0.0, 'phases' : dict() }
+    phase = None
+    t_phase = 0.0
+    for t, kind, data in records:
+        if kind == TRACE_BEGIN:
+            stats['airframe'] = data.decode("utf-8")
+        elif kind == TRACE_SEND:
+            stats['num_cmds'] += len(data.splitlines())
+            stats['num_sends'] += 1
+        elif kind in (TRACE_PHASE, TRACE_END) and phase is not None:
+            stats['phases'][phase] = stats['phases'].get(phase, 0.0) + (t - t_phase)
+            phase = None
+        if kind == TRACE_PHASE:
+            phase = data.decode("utf-8")
+            t_phase = t
+        stats['duration'] = t
+    if phase is not None:
+        stats['phases'][phase] = stats['phases'].get(phase, 0.0) + (stats['duration'] - t_phase)
+    return stats
+
+# compare two loads from traces. returns a list of lines describing the differences in commands,
+# datagrams, time, and per-phase time, along with whether the two loads send the same commands.
+# commands are compared rather than datagrams as coalescing may pack the same commands into
+# different datagrams.
+#
+def driver_trace_diff(records_a, records_b):
+    stats_a = driver_trace_stats(records_a)
+    stats_b = driver_trace_stats(records_b)
+
+    def diff_line(name, val_a, val_b, fmt):
+        return f"{name:<16} {val_a:{fmt}} {val_b:{fmt}} {val_b - val_a:+{fmt}}"
+
+    lines = [ f"{'':<16} {'A':>10} {'B':>10} {'B - A':>10}",
+              diff_line("commands", stats_a['num_cmds'], stats_b['num_cmds'], "10d"),
+              diff_line("datagrams", stats_a['num_sends'], stats_b['num_sends'], "10d"),
+              diff_line("time (s)", stats_a['duration'], stats_b['duration'], "10.3f") ]
+    phases = list(stats_a['phases'].keys())
+    phases += [ phase for phase in stats_b['phases'].keys() if phase not in phases ]
+    for phase in phases:
+        lines.append(diff_line(f"  {phase}", stats_a['phases'].get(phase, 0.0),
+                               stats_b['phases'].get(phase, 0.0), "10.3f"))
+    is_same = driver_trace_cmds(records_a) == driver_trace_cmds(records_b)
+    lines.append("same commands" if is_same else "different commands")
+    return lines
+
+# replay a load from a trace to a dcs-bios endpoint, sending each datagram at its recorded
+# time scaled by scale (e.g., 0.5 replays at twice the original speed).
+#
+def driver_trace_replay(records, host="127.0.0.1", port=7778, scale=1.0):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        t_start = monotonic()
+        for t, kind, data in records:
+            if kind == TRACE_SEND:
+                delay = t_start + (t * scale) - monotonic()
+                if delay > 0.0:
+                    sleep(delay)
+                sock.sendto(data, (host, port))
+    finally:
+        sock.close()
+
+
+# records the dcs-bios traffic from a driver to a trace file. see DriverPlanExecutor.
+#
+class DriverTraceRecorder:
+    def __init__(self, path=DRIVER_TRACE_PATH):
+        self.path = path
+        self.file = None
+
+    def write(self, kind, data):
+        if self.file is not None:
+            self.file.write(TRACE_RECORD.pack(monotonic(), kind, len(data)) + data)
+
+    def begin(self, airframe):
+        self.file = open(self.path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+        self.write(TRACE_BEGIN, (airframe or "").encode("utf-8"))
+
+    def record(self, payload):
+        self.write(TRACE_SEND, payload)
+
+    def phase(self, name):
+        self.write(TRACE_PHASE, name.encode("utf-8"))
+
+    def end(self):
+        if self.file is not None:
+            self.write(TRACE_END, b"")
+            self.file.close()
+            self.file = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="driver_trace", description="Replay or compare driver traces")
+    subparsers = parser.add_subparsers(dest="tool", required=True)
+    replay = subparsers.add_parser("replay", help="replay a load from a trace to a DCS-BIOS endpoint")
+    replay.add_argument("trace")
+    replay.add_argument("--index", type=int, default=-1, help="load in the trace (default: last)")
+    replay.add_argument("--host", default="127.0.0.1")
+    replay.add_argument("--port", type=int, default=7778)
+    replay.add_argument("--scale", type=float, default=1.0, help="time scale (default: 1.0)")
+    diff = subparsers.add_parser("diff", help="compare loads from two traces")
+    diff.add_argument("trace_a")
+    diff.add_argument("trace_b")
+    diff.add_argument("--index-a", type=int, default=-1, help="load in trace_a (default: last)")
+    diff.add_argument("--index-b", type=int, default=-1, help="load in trace_b (default: last)")
+    args = parser.parse_args()
+
+    if args.tool == "replay":
+        records = driver_trace_load(args.trace, args.index)
+        print(f"Replaying {os.path.basename(args.trace)} to {args.host}:{args.port}...")
+        driver_trace_replay(records, args.host, args.port, args.scale)
+    else:
+        print("\n".join(driver_trace_diff(driver_trace_load(args.trace_a, args.index_a),
+                                          driver_trace_load(args.trace_b, args.index_b))))
@@ -20,19 +20,42 @@
 *
 '''
 
-import keyboard
+import json
+import logging
 import re
 import socket
-import queue
+import threading
 
-from time import sleep
+from datetime import datetime
 
+from src.dcs_bios_export import DcsBiosAckPacer, dcs_bios_export_state, dcs_bios_load_control_ref
+from src.driver_plan import DriverCmd, DriverPlan, DriverPlanExecutor, DriverPlanFanout
+from src.driver_trace import DRIVER_TRACE_PATH, DriverTraceRecorder
+
+
+# timing spans for the phases of each load are appended to this json-lines file, next to the
+# log, see Driver.log_spans.
+#
+DRIVER_SPANS_PATH = "spans.jsonl"
 
 
 class DriverException(Exception):
     pass
 
 
+# logging filter that drops the records logged from the thread that created the filter, used
+# to quiet the driver logger while a plan is built for an estimate (see Driver.build_plan)
+# without losing records from a load running on another thread.
+#
+class DriverQuietFilter(logging.Filter):
+    def __init__(self):
+        super().__init__()
+        self.thread = threading.get_ident()
+
+    def filter(self, record):
+        return record.thread != self.thread
+
+
 def latlon_tostring(latlong, decimal_minutes_mode=False, easting_zfill=2, zfill_minutes=2, one_digit_seconds=False, precision=4):
 
     if not decimal_minutes_mode:
@@ -100,42 +123,103 @@ class Driver:
         self.medium_delay = float(self.prefs.dcs_btn_rel_delay_medium)
         self.long_delay = float(2.00 * self.medium_delay)
 
-        self.bkgnd_prog_cur = 0
-        self.bkgnd_prog_step = 0
+        # rules for the plan optimizer, see DriverPlan.optimize in driver_plan.py. keys and
+        # values are tuples of the dcs-bios "press" commands for a control.
+        #
+        self.press_idempotent = dict()
+        self.press_inverses = dict()
+
+        # button delay calibration, see driver_cal.py. cal_probes maps a control class onto a
+        # list of harmless probe presses that leave the avionics in the state they started in.
+        # each probe is a ( <press>, <release>, <is_display> ) tuple with the dcs-bios commands
+        # to press and release and a flag that is True if the probe changes a display.
+        # calibrated delays are kept in the preferences by airframe and control class. drivers
+        # without probes (see is_cal_supported) do not support calibration.
+        #
+        self.airframe = None
+        self.cal_probes = dict()
+
+        # export stream details for pacing presses on acknowledgements, see setup_ack_pacer.
+        # exp_control_ref is the name of the DCS-BIOS control reference .json file for the
+        # airframe, exp_displays lists the identifiers of the displays that presses update.
+        #
+        self.exp_control_ref = None
+        self.exp_displays = [ ]
+        self.ack_pacer = None
+
+        # maps key onto the ( <press>, <release> ) dcs-bios commands press_with_delay uses.
+        #
+        self.press_cmds = dict()
+
+        # state of the jet from a previous load for delta loading, see snapshot.
+        #
+        self.baseline = None
+
+        self.plan = None
+        self.executor = DriverPlanExecutor(self)
+
+    # emit a command. while a plan is being built (see build_plan), the command is added to the
+    # plan, otherwise it is executed immediately. returns True if the command was successfully
+    # added or sent.
+    #
+    def emit(self, cmd):
+        if self.plan is not None:
+            self.plan.append(cmd)
+            return True
+        return self.executor.run_cmd(cmd)
+
+    def wait(self, delay):
+        if delay > 0.0:
+            self.emit(DriverCmd("WAIT", after=delay))
 
     def keyboard_key_with_delay(self, key, delay_after=None):
         if delay_after is None:
             delay_after = self.medium_delay
-        keyboard.send(key)
-        sleep(delay_after)
+        self.emit(DriverCmd("KEY", key=key, after=delay_after))
+
+    # returns True if the driver has probes to calibrate the button delays of its control
+    # classes, see driver_cal.py.
+    #
+    @property
+    def is_cal_supported(self):
+        return len(self.cal_probes) > 0
+
+    # return the ( <release>, <after> ) delays for a press of a control in a control class. the
+    # delays come from the calibration for the airframe and class if there is one, otherwise
+    # the release delay is the short delay and the after delay is dflt_after (short delay by
+    # default).
+    #
+    def btn_delays(self, ctrl_class, dflt_after=None):
+        cal_delays = self.prefs.dcs_btn_cal_delays_map.get((self.airframe, ctrl_class))
+        if cal_delays is not None:
+            return cal_delays
+        return (self.short_delay, self.short_delay if dflt_after is None else dflt_after)
 
-    def press_with_delay(self, key, delay_after=None, delay_release=None, raw=False):
+    def press_with_delay(self, key, delay_after=None, delay_release=None, raw=False, ctrl_class=None):
         if not key:
             return False
 
+        cal_release, cal_after = self.btn_delays(ctrl_class)
+
         if delay_after is None:
-            delay_after = self.short_delay
+            delay_after = cal_after
 
         if delay_release is None:
-            delay_release = self.short_delay
+            delay_release = cal_release
 
-        encoded_str = key.replace("OSB", "OS").encode("utf-8")
-
-        # TODO get rid of the OSB -> OS replacement
         if not raw:
-            sent = self.s.sendto(f"{key} 1\n".replace("OSB", "OS").encode(
-                "utf-8"), (self.host, self.port))
-            sleep(delay_release)
-
-            self.s.sendto(f"{key} 0\n".replace("OSB", "OS").encode(
-                "utf-8"), (self.host, self.port))
-            strlen = len(encoded_str) + 3
+            press_cmds = self.press_cmds.get(key)
+            if press_cmds is None:
+                # TODO get rid of the OSB -> OS replacement
+                ctrl = key.replace("OSB", "OS")
+                press_cmds = ((f"{ctrl} 1",), (f"{ctrl} 0",))
+                self.press_cmds[key] = press_cmds
+            cmd = DriverCmd("PRESS", press=press_cmds[0], release=press_cmds[1],
+                            hold=delay_release, after=delay_after)
         else:
-            sent = self.s.sendto(f"{key}\n".encode("utf-8"), (self.host, self.port))
-            strlen = len(encoded_str) + 1
+            cmd = DriverCmd("SEND", press=(key,), after=delay_after)
 
-        sleep(delay_after)
-        return sent == strlen
+        return self.emit(cmd)
 
     def validate_waypoint(self, waypoint):
         try:
@@ -149,24 +233,147 @@ class Driver:
                 waypoints.remove(waypoint)
         return sorted(waypoints, key=lambda wp: wp.wp_type)
 
-    # bkgnd_advance will raise an "Operation Cancelled" exception if the operation is cancelled
+    # bkgnd_advance marks a progress step in the plan.
+    #
+    def bkgnd_advance(self):
+        if self.plan is not None:
+            self.plan.step()
+
+    # phase marks the start of a phase of the entry (e.g., "waypoints") in the plan.
+    #
+    def phase(self, name):
+        if self.plan is not None:
+            self.plan.phase(name)
+
+    # note adds a note to the plan that the executor logs when it reaches the note, so the log
+    # follows the entry as it runs rather than when the plan is built.
     #
-    def bkgnd_advance(self, command_q, progress_q, is_done=False):
+    def note(self, text):
+        if self.plan is not None:
+            self.plan.note(text)
+        else:
+            self.logger.info(text)
+
+    # build the command plan to enter a profile into the jet. entry methods add commands to
+    # the plan rather than sending them to dcs-bios while the plan is built. derived classes
+    # implement enter_profile to drive the entry methods for a profile.
+    #
+    # when is_optimized is True, the plan is run through the peephole optimizer to remove
+    # redundant presses and merge waits. when baseline is not None, it is the snapshot of the
+    # jet from a previous load (see snapshot) and drivers that support delta loading only enter
+    # what has changed. when is_quiet is True, nothing is logged while the plan is built.
+    #
+    def build_plan(self, profile, is_optimized=True, baseline=None, is_quiet=False):
+        self.plan = DriverPlan()
+        self.baseline = baseline
+        quiet_filter = DriverQuietFilter() if is_quiet else None
+        if quiet_filter is not None:
+            self.logger.addFilter(quiet_filter)
         try:
-            if command_q is not None and command_q.get(False) == "CANCEL":
-                raise Exception("Operation Cancelled")
-        except queue.Empty:
-            pass
-
-        if progress_q is not None and is_done:
-            progress_q.put(100)
-            progress_q.put("DONE")
-        elif progress_q is not None:
-            self.bkgnd_prog_cur = self.bkgnd_prog_cur + self.bkgnd_prog_step
-            progress_q.put(self.bkgnd_prog_cur)
-            if self.bkgnd_prog_cur > 100:
-                self.bkgnd_prog_cur = 100
-    
+            self.enter_profile(profile)
+            plan = self.plan
+        finally:
+            self.plan = None
+            self.baseline = None
+            if quiet_filter is not None:
+                self.logger.removeFilter(quiet_filter)
+        if is_optimized:
+            plan, _ = plan.optimize(idempotent=self.press_idempotent, inverses=self.press_inverses)
+        return plan
+
+    def enter_profile(self, profile):
+        raise NotImplementedError
+
+    # return a snapshot of the state of the jet after a profile is loaded on top of the state in
+    # baseline (a snapshot from a previous load, None if unknown). the snapshot is passed back to
+    # build_plan as the baseline for the next load. returns None if the driver does not support
+    # delta loading.
+    #
+    def snapshot(self, profile, baseline=None):
+        return None
+
+    # set up the pacer that paces presses on acknowledgements from the dcs-bios export stream.
+    # the pacer uses the control reference from the DCS-BIOS installation to map commands onto
+    # the export stream. returns the pacer, None if the airframe or installation does not
+    # support pacing.
+    #
+    def setup_ack_pacer(self):
+        if self.ack_pacer is None and self.exp_control_ref is not None:
+            path = self.prefs.path_dcs + "Scripts\\DCS-BIOS\\doc\\json\\" + self.exp_control_ref
+            controls, strings = dcs_bios_load_control_ref(path)
+            if len(controls) > 0:
+                displays = [ strings[ident] for ident in self.exp_displays if ident in strings ]
+                self.ack_pacer = DcsBiosAckPacer(dcs_bios_export_state, controls, displays)
+            else:
+                self.logger.info(f"Unable to pace on export stream, no control reference at {path}")
+        if self.ack_pacer is not None and self.prefs.is_disable_export_bool:
+            dcs_bios_export_state.listen()
+        return self.ack_pacer
+
+    # enter a profile into the jet, see build_plan for baseline. returns True if the profile
+    # was entered, False if the entry failed or was cancelled.
+    #
+    def enter_all(self, profile, command_q=None, progress_q=None, baseline=None):
+        try:
+            if self.prefs.is_btn_ack_pacing_bool:
+                self.executor.pacer = self.setup_ack_pacer()
+            else:
+                self.executor.pacer = None
+            if self.prefs.is_trace_record_bool:
+                self.executor.recorder = DriverTraceRecorder(DRIVER_TRACE_PATH)
+            else:
+                self.executor.recorder = None
+            plan = self.build_plan(profile, baseline=baseline)
+            if plan.opt_stats is not None:
+                self.logger.info(f"Entry plan optimized: {plan.opt_stats}")
+            self.logger.info(f"Entry plan: {plan.num_presses} presses, {plan.num_steps} steps," +
+                             f" {plan.duration:.1f}s")
+            self.executor.run(plan, command_q=command_q, progress_q=progress_q)
+            self.logger.info(f"Entry plan jitter: {self.executor.jitter}")
+            self.log_spans(True)
+            return True
+        except Exception as e:
+            self.logger.debug(f"Exception raised: {e}")
+            self.log_spans(False)
+            return False
+
+    # append the timing spans from the last plan the executor ran to DRIVER_SPANS_PATH (one
+    # json object per span) and summarize them in the log.
+    #
+    def log_spans(self, is_entered):
+        spans = self.executor.spans
+        if len(spans) == 0:
+            return
+        try:
+            stamp = datetime.now().isoformat(timespec="seconds")
+            with open(DRIVER_SPANS_PATH, "a", encoding="utf-8") as f:
+                for span in spans:
+                    f.write(json.dumps(dict(time=stamp, airframe=self.airframe, entered=is_entered,
+                                            **span.to_dict())) + "\n")
+        except Exception as e:
+            self.logger.debug(f"Unable to write spans: {e}")
+        self.logger.info(f"Entry timing: {sum([ span.duration for span in spans ]):.1f}s")
+        for span in sorted(spans, key=lambda span: span.duration, reverse=True):
+            self.logger.info(f"  {span}")
+
+    # enter a profile into the jets at a list of ( <host>, <port> ) endpoints in parallel, see
+    # DriverPlanFanout. baselines maps endpoints onto the baseline for the endpoint (see
+    # build_plan). presses are not paced on the export stream as the stream only reflects one
+    # jet. returns a dictionary that maps endpoints onto True if the profile was entered at the
+    # endpoint, False otherwise.
+    #
+    def enter_all_endpoints(self, profile, endpoints, command_q=None, progress_q=None, baselines=None):
+        baselines = dict() if baselines is None else baselines
+        try:
+            plans = { endpoint : self.build_plan(profile, baseline=baselines.get(endpoint))
+                      for endpoint in endpoints }
+            self.logger.info(f"Entry plans for {len(plans)} endpoints: " +
+                             f"{max([ plan.duration for plan in plans.values() ]):.1f}s")
+        except Exception as e:
+            self.logger.debug(f"Exception raised: {e}")
+            return { endpoint : False for endpoint in endpoints }
+        return DriverPlanFanout(self).run(plans, command_q=command_q, progress_q=progress_q)
+
     def stop(self):
         self.s.close()
 
@@ -182,21 +389,41 @@ class HornetDriver(Driver):
     def __init__(self, logger, config):
         super().__init__(logger, config)
         self.limits = dict(WP=None, MSN=6)
+        self.airframe = "hornet"
+
+        # first CLR clears the scratchpad, second clears the option display. further CLR
+        # presses have no effect.
+        #
+        self.press_idempotent = { ("UFC_CLR 1",) : 2 }
+
+        self.exp_control_ref = "FA-18C_hornet.json"
+        self.exp_displays = [ "UFC_SCRATCHPAD_STRING_1_DISPLAY", "UFC_SCRATCHPAD_STRING_2_DISPLAY",
+                              "UFC_SCRATCHPAD_NUMBER_DISPLAY", "UFC_OPTION_DISPLAY_1",
+                              "UFC_OPTION_DISPLAY_2", "UFC_OPTION_DISPLAY_3", "UFC_OPTION_DISPLAY_4",
+                              "UFC_OPTION_DISPLAY_5" ]
+
+        # CLR clears the scratchpad, and has no effect on an empty scratchpad. OSB presses
+        # change the DDI and AMPCD formats, so the OSB class is probed with the AMPCD SYM
+        # rocker, which shares the AMPCD bezel and is stepped up and back down.
+        #
+        self.cal_probes = { "ufc" : [ (("UFC_CLR 1",), ("UFC_CLR 0",), False) ],
+                            "osb" : [ (("AMPCD_SYM_SW 2",), ("AMPCD_SYM_SW 1",), False),
+                                      (("AMPCD_SYM_SW 0",), ("AMPCD_SYM_SW 1",), False) ] }
 
     def ufc(self, num, delay_after=None, delay_release=None):
         key = f"UFC_{num}"
         self.press_with_delay(key, delay_after=delay_after,
-                              delay_release=delay_release)
+                              delay_release=delay_release, ctrl_class="ufc")
 
     def lmdi(self, pb, delay_after=None, delay_release=None):
         key = f"LEFT_DDI_PB_{pb.zfill(2)}"
         self.press_with_delay(key, delay_after=delay_after,
-                              delay_release=delay_release)
+                              delay_release=delay_release, ctrl_class="osb")
 
     def ampcd(self, pb, delay_after=None, delay_release=None):
         key = f"AMPCD_PB_{pb.zfill(2)}"
         self.press_with_delay(key, delay_after=delay_after,
-                              delay_release=delay_release)
+                              delay_release=delay_release, ctrl_class="osb")
 
     def ensure_decimal(self, number):
         if str(number).find(".") == -1:
@@ -228,21 +455,21 @@ class HornetDriver(Driver):
         lon_str = self.ensure_decimal(lon_str)
 
         if not pp:
-            self.logger.info(f"Entering coords string (W): {lat_str}, {lon_str}")
+            self.note(f"Entering coords string (W): {lat_str}, {lon_str}")
 
             if latlong.lat.degree > 0:
                 self.ufc("2", delay_release=self.medium_delay)
             else:
                 self.ufc("8", delay_release=self.medium_delay)
             self.enter_number(lat_str, two_enters=True)
-            sleep(0.5)
+            self.wait(0.5)
 
             if latlong.lon.degree > 0:
                 self.ufc("6", delay_release=self.medium_delay)
             else:
                 self.ufc("4", delay_release=self.medium_delay)
             self.enter_number(lon_str, two_enters=True)
-            sleep(0.5)
+            self.wait(0.5)
 
             # For non-pre-planned waypoints skip elevations less than 0 (effectively
             # clamping them to 0). For navagation <0 does not make sense.
@@ -256,7 +483,7 @@ class HornetDriver(Driver):
             self.enter_number(elev)
 
         else:
-            self.logger.info(f"Entering coords string (M): {lat_str}, {lon_str}")
+            self.note(f"Entering coords string (M): {lat_str}, {lon_str}")
 
             self.ufc("OSB1")
             if latlong.lat.degree > 0:
@@ -287,15 +514,7 @@ class HornetDriver(Driver):
                 self.ufc("0", delay_release=self.medium_delay)
             self.enter_number(elev)
 
-    def count_steps_enter_wypts(self, wps, sequences):
-        count = 0
-        if wps:
-            count = len(wps)
-            for _, waypointslist in sequences.items():
-                count = count + len(waypointslist)
-        return count
-
-    def enter_waypoints(self, wps, sequences, command_q=None, progress_q=None):
+    def enter_waypoints(self, wps, sequences):
         if not wps:
             return
 
@@ -307,12 +526,12 @@ class HornetDriver(Driver):
         self.ufc("CLR")
 
         for i, wp in enumerate(wps):
-            self.bkgnd_advance(command_q, progress_q)
+            self.bkgnd_advance()
 
             if not wp.name:
-                self.logger.info(f"Entering waypoint {i+1}")
+                self.note(f"Entering waypoint {i+1}")
             else:
-                self.logger.info(f"Entering waypoint {i+1} - {wp.name}")
+                self.note(f"Entering waypoint {i+1} - {wp.name}")
 
             self.ampcd("12")
             self.ampcd("5")
@@ -320,6 +539,7 @@ class HornetDriver(Driver):
             self.enter_coords(wp.position, wp.elevation, pp=False, decimal_minutes_mode=True)
             self.ufc("CLR")
 
+        self.phase("sequences")
         for sequencenumber, waypointslist in sequences.items():
             if canceled:
                 break
@@ -333,7 +553,7 @@ class HornetDriver(Driver):
             self.ampcd("1")
 
             for waypoint in waypointslist:
-                self.bkgnd_advance(command_q, progress_q)
+                self.bkgnd_advance()
 
                 self.ufc("OSB4")
                 self.enter_number(waypoint)
@@ -346,9 +566,9 @@ class HornetDriver(Driver):
 
     def enter_pp_msn(self, msn, n):
         if msn.name:
-            self.logger.info(f"Entering PP mission {n} - {msn.name}")
+            self.note(f"Entering PP mission {n} - {msn.name}")
         else:
-            self.logger.info(f"Entering PP mission {n}")
+            self.note(f"Entering PP mission {n}")
 
         if n > 1:
             self.lmdi(f"{n + 5}")
@@ -360,7 +580,7 @@ class HornetDriver(Driver):
         self.ufc("CLR")
         self.ufc("CLR")
 
-    def enter_missions(self, missions, command_q=None, progress_q=None):
+    def enter_missions(self, missions):
         def stations_order(x):
             if x == 8:
                 return 0
@@ -391,31 +611,23 @@ class HornetDriver(Driver):
 
             n = 1
             for msn in msns:
-                self.bkgnd_advance(command_q, progress_q)
+                self.bkgnd_advance()
 
                 self.enter_pp_msn(msn, n)
                 n += 1
 
             self.lmdi("13")
 
-    def enter_all(self, profile, command_q=None, progress_q=None):
+    def enter_profile(self, profile):
         missions = self.validate_waypoints(profile.msns_as_list)
         waypoints = self.validate_waypoints(profile.waypoints_as_list)
 
-        steps = self.count_steps_enter_wypts(waypoints, profile.sequences_dict) + len(missions)
-
-        self.bkgnd_prog_step = (1.0 / (steps + 2)) * 100.0
-        self.bkgnd_prog_cur = 0
-
-        try:
-            self.enter_missions(missions, command_q=command_q, progress_q=progress_q)
-            self.bkgnd_advance(command_q, progress_q)
-            sleep(1)
-            self.enter_waypoints(waypoints, profile.sequences_dict, command_q=command_q,
-                                progress_q=progress_q)
-            self.bkgnd_advance(command_q, progress_q, is_done=True)
-        except Exception as e:
-            self.logger.debug(f"Exception raised: {e}")
+        self.phase("missions")
+        self.enter_missions(missions)
+        self.bkgnd_advance()
+        self.wait(1)
+        self.phase("waypoints")
+        self.enter_waypoints(waypoints, profile.sequences_dict)
 
 '''
 ***********************************************************************************************************************
@@ -429,6 +641,8 @@ class HarrierDriver(Driver):
     def __init__(self, logger, config):
         super().__init__(logger, config)
         self.limits = dict(WP=None)
+        self.airframe = "harrier"
+        self.exp_control_ref = "AV8BNA.json"
 
     def ufc(self, num, delay_after=None, delay_release=None):
         if num not in ("ENT", "CLR"):
@@ -440,16 +654,17 @@ class HarrierDriver(Driver):
         else:
             key = f"UFC_{num}"
         self.press_with_delay(key, delay_after=delay_after,
-                              delay_release=delay_release)
+                              delay_release=delay_release, ctrl_class="ufc")
 
     def odu(self, num, delay_after=None, delay_release=None):
         key = f"ODU_OPT{num}"
         self.press_with_delay(key, delay_after=delay_after,
-                              delay_release=delay_release)
+                              delay_release=delay_release, ctrl_class="odu")
 
     def lmpcd(self, pb, delay_after=None, delay_release=None):
         key = f"MPCD_L_{pb}"
-        self.press_with_delay(key, delay_after=delay_after, delay_release=delay_release)
+        self.press_with_delay(key, delay_after=delay_after, delay_release=delay_release,
+                              ctrl_class="osb")
 
     def enter_number(self, number, two_enters=False):
         for num in str(number):
@@ -472,7 +687,7 @@ class HarrierDriver(Driver):
 
     def enter_coords(self, latlong, elev):
         lat_str, lon_str = latlon_tostring(latlong, decimal_minutes_mode=False, easting_zfill=3)
-        self.logger.info(f"Entering coords string: {lat_str}, {lon_str}")
+        self.note(f"Entering coords string: {lat_str}, {lon_str}")
 
         if latlong.lat.degree > 0:
             self.ufc("2", delay_release=self.medium_delay)
@@ -496,11 +711,11 @@ class HarrierDriver(Driver):
                 elev = 0
             self.enter_number(elev)
 
-    def enter_waypoints(self, wps, command_q=None, progress_q=None):
+    def enter_waypoints(self, wps):
         self.lmpcd("2")
 
         for wp in wps:
-            self.bkgnd_advance(command_q, progress_q)
+            self.bkgnd_advance()
 
             self.ufc("7")
             self.ufc("7")
@@ -511,17 +726,11 @@ class HarrierDriver(Driver):
 
         self.lmpcd("2")
 
-    def enter_all(self, profile, command_q=None, progress_q=None):
+    def enter_profile(self, profile):
         waypoints = self.validate_waypoints(profile.all_waypoints_as_list)
 
-        self.bkgnd_prog_step = (1.0 / (len(waypoints) + 1)) * 100.0
-        self.bkgnd_prog_cur = 0
-
-        try:
-            self.enter_waypoints(waypoints, command_q=command_q, progress_q=progress_q)
-            self.bkgnd_advance(command_q, progress_q, is_done=True)
-        except Exception as e:
-            self.logger.debug(f"Exception raised: {e}")
+        self.phase("waypoints")
+        self.enter_waypoints(waypoints)
 
 '''
 ***********************************************************************************************************************
@@ -535,6 +744,8 @@ class MirageDriver(Driver):
     def __init__(self, logger, config):
         super().__init__(logger, config)
         self.limits = dict(WP=9)
+        self.airframe = "mirage"
+        self.exp_control_ref = "M-2000C.json"
 
     def pcn(self, num, delay_after=None, delay_release=None):
         if num in ("ENTER", "CLR"):
@@ -544,7 +755,8 @@ class MirageDriver(Driver):
         else:
             key = f"INS_BTN_{num}"
 
-        self.press_with_delay(key, delay_after=delay_after, delay_release=delay_release)
+        self.press_with_delay(key, delay_after=delay_after, delay_release=delay_release,
+                              ctrl_class="pcn")
 
     def enter_number(self, number):
         for num in str(number):
@@ -554,7 +766,7 @@ class MirageDriver(Driver):
 
     def enter_coords(self, latlong):
         lat_str, lon_str = latlon_tostring(latlong, decimal_minutes_mode=True, easting_zfill=3)
-        self.logger.info(f"Entering coords string: {lat_str[:-2]}, {lon_str[:-2]}")
+        self.note(f"Entering coords string: {lat_str[:-2]}, {lon_str[:-2]}")
 
         self.pcn("1")
         if latlong.lat.degree > 0:
@@ -571,9 +783,9 @@ class MirageDriver(Driver):
             self.pcn("4", delay_release=self.medium_delay)
         self.enter_number(lon_str[:-2])
 
-    def enter_waypoints(self, wps, command_q=None, progress_q=None):
+    def enter_waypoints(self, wps):
         for i, wp in enumerate(wps, 1):
-            self.bkgnd_advance(command_q, progress_q)
+            self.bkgnd_advance()
 
             self.pcn("PREP")
             self.pcn("0")
@@ -581,17 +793,11 @@ class MirageDriver(Driver):
             self.enter_coords(wp.position)
             self.pcn("ENTER")
 
-    def enter_all(self, profile, command_q=None, progress_q=None):
+    def enter_profile(self, profile):
         waypoints = self.validate_waypoints(profile.all_waypoints_as_list)
 
-        self.bkgnd_prog_step = (1.0 / (len(waypoints) + 1)) * 100.0
-        self.bkgnd_prog_cur = 0
-
-        try:
-            self.enter_waypoints(waypoints, command_q=command_q, progress_q=progress_q)
-            self.bkgnd_advance(command_q, progress_q, is_done=True)
-        except Exception as e:
-            self.logger.debug(f"Exception raised: {e}")
+        self.phase("waypoints")
+        self.enter_waypoints(waypoints)
 
 '''
 ***********************************************************************************************************************
@@ -605,6 +811,8 @@ class TomcatDriver(Driver):
     def __init__(self, logger, config):
         super().__init__(logger, config)
         self.limits = dict(WP=3, FP=1, IP=1, ST=1, HA=1, DP=1, HB=1)
+        self.airframe = "tomcat"
+        self.exp_control_ref = "F-14.json"
 
     def cap(self, num, delay_after=None, delay_release=None):
         raw = False
@@ -624,7 +832,8 @@ class TomcatDriver(Driver):
             raw = True
         else:
             key = f"{cap_key_names.get(num, 'RIO_CAP_')}{num}"
-        self.press_with_delay(key, delay_after=delay_after, delay_release=delay_release, raw=raw)
+        self.press_with_delay(key, delay_after=delay_after, delay_release=delay_release, raw=raw,
+                              ctrl_class="cap")
 
     def enter_number(self, number):
         for num in str(number):
@@ -634,7 +843,7 @@ class TomcatDriver(Driver):
 
     def enter_coords(self, latlong, elev):
         lat_str, lon_str = latlon_tostring(latlong, one_digit_seconds=True)
-        self.logger.info(f"Entering coords string: {lat_str}, {lon_str}")
+        self.note(f"Entering coords string: {lat_str}, {lon_str}")
 
         self.cap("1")
         if latlong.lat.degree > 0:
@@ -660,7 +869,7 @@ class TomcatDriver(Driver):
                 elev = 0
             self.enter_number(elev)
 
-    def enter_waypoints(self, wps, command_q=None, progress_q=None):
+    def enter_waypoints(self, wps):
         cap_wp_type_buttons = dict(
             FP=4,
             IP=5,
@@ -671,7 +880,7 @@ class TomcatDriver(Driver):
         )
         self.cap("TAC")
         for wp in wps:
-            self.bkgnd_advance(command_q, progress_q)
+            self.bkgnd_advance()
 
             if wp.wp_type == "WP":
                 self.cap(f"BTN_{wp.number}")
@@ -681,17 +890,11 @@ class TomcatDriver(Driver):
             self.enter_coords(wp.position, wp.elevation)
             self.cap("CLEAR")
 
-    def enter_all(self, profile, command_q=None, progress_q=None):
+    def enter_profile(self, profile):
         waypoints = self.validate_waypoints(profile.all_waypoints_as_list)
 
-        self.bkgnd_prog_step = (1.0 / (len(waypoints) + 1)) * 100.0
-        self.bkgnd_prog_cur = 0
-
-        try:
-            self.enter_waypoints(waypoints, command_q=command_q, progress_q=progress_q)
-            self.bkgnd_advance(command_q, progress_q, is_done=True)
-        except Exception as e:
-            self.logger.debug(f"Exception raised: {e}")
+        self.phase("waypoints")
+        self.enter_waypoints(waypoints)
 
 '''
 ***********************************************************************************************************************
@@ -705,12 +908,15 @@ class WarthogDriver(Driver):
     def __init__(self, logger, config):
         super().__init__(logger, config)
         self.limits = dict(WP=99)
+        self.airframe = "warthog"
+        self.exp_control_ref = "A-10C.json"
 
     def cdu(self, num, delay_after=None, delay_release=None):
         if num == " ":
             num = "SPC"
         key = f"CDU_{num}"
-        self.press_with_delay(key, delay_after=delay_after, delay_release=delay_release)
+        self.press_with_delay(key, delay_after=delay_after, delay_release=delay_release,
+                              ctrl_class="cdu")
 
     def clear_input(self, repeat=3):
         for i in range(0, repeat):
@@ -739,7 +945,7 @@ class WarthogDriver(Driver):
 
     def enter_coords(self, latlong):
         lat_str, lon_str = latlon_tostring(latlong, decimal_minutes_mode=True, easting_zfill=3, precision=3)
-        self.logger.info(f"Entering coords string: {lat_str}, {lon_str}")
+        self.note(f"Entering coords string: {lat_str}, {lon_str}")
 
         self.clear_input(repeat=2)
 
@@ -770,14 +976,14 @@ class WarthogDriver(Driver):
         self.cdu("LSK_5L")
         self.clear_input(repeat=2)
 
-    def enter_waypoints(self, wps, command_q=None, progress_q=None):
+    def enter_waypoints(self, wps):
         self.cdu("WP", self.short_delay)
         self.cdu("LSK_3L", self.medium_delay)
         self.logger.debug("Number of waypoints: " + str(len(wps)))
         ret_wp = -1
         cur_wp = 1
         for wp in wps:
-            self.bkgnd_advance(command_q, progress_q)
+            self.bkgnd_advance()
 
             self.logger.debug(f"Entering WP: {wp}")
             self.cdu("LSK_7R", self.short_delay)
@@ -799,17 +1005,11 @@ class WarthogDriver(Driver):
             self.enter_number(ret_wp)
             self.cdu("LSK_3L")
 
-    def enter_all(self, profile, command_q=None, progress_q=None):
+    def enter_profile(self, profile):
         waypoints = self.validate_waypoints(profile.all_waypoints_as_list)
 
-        self.bkgnd_prog_step = (1.0 / (len(waypoints) + 1)) * 100.0
-        self.bkgnd_prog_cur = 0
-
-        try:
-            self.enter_waypoints(waypoints, command_q=command_q, progress_q=progress_q)
-            self.bkgnd_advance(command_q, progress_q, is_done=True)
-        except Exception as e:
-            self.logger.debug(f"Exception raised: {e}")
+        self.phase("waypoints")
+        self.enter_waypoints(waypoints)
 
 '''
 ***********************************************************************************************************************
@@ -823,19 +1023,67 @@ class ViperDriver(Driver):
     def __init__(self, logger, config):
         super().__init__(logger, config)
         self.limits = dict(WP=127)
+        self.airframe = "viper"
 
-    def push_btn(self, key, delay_after=None, delay_release=None):
-        if delay_release is None:
-            delay_release = self.short_delay
-        self.press_with_delay(key, delay_after=delay_after, delay_release=delay_release)
+        # RTN always returns the DED to the CNI page. DED and DATA rockers step through
+        # values/fields cyclically, so an UP undoes a DN and vice-versa.
+        #
+        self.press_idempotent = { ("ICP_DATA_RTN_SEQ_SW 0",) : 1 }
+        self.press_inverses = { ("ICP_DED_SW 2",) : ("ICP_DED_SW 0",),
+                                ("ICP_DED_SW 0",) : ("ICP_DED_SW 2",),
+                                ("ICP_DATA_UP_DN_SW 2",) : ("ICP_DATA_UP_DN_SW 0",),
+                                ("ICP_DATA_UP_DN_SW 0",) : ("ICP_DATA_UP_DN_SW 2",) }
+
+        # ( <press>, <release> ) dcs-bios commands for the DED and DATA rockers. a release only
+        # returns the switch that was moved to center.
+        #
+        self.icp_ded_cmds = { "DN" : (("ICP_DED_SW 0",), ("ICP_DED_SW 1",)),
+                              "UP" : (("ICP_DED_SW 2",), ("ICP_DED_SW 1",)) }
+        self.icp_data_cmds = { "DN" : (("ICP_DATA_UP_DN_SW 0",), ("ICP_DATA_UP_DN_SW 1",)),
+                               "UP" : (("ICP_DATA_UP_DN_SW 2",), ("ICP_DATA_UP_DN_SW 1",)),
+                               "RTN" : (("ICP_DATA_RTN_SEQ_SW 0",), ("ICP_DATA_RTN_SEQ_SW 1",)),
+                               "SEQ" : (("ICP_DATA_RTN_SEQ_SW 2",), ("ICP_DATA_RTN_SEQ_SW 1",)) }
+        self.dgft_sw_cmds = { "DGFT" : "DOGFIGHT_SW 2", "CTR" : "DOGFIGHT_SW 1", "MSL" : "DOGFIGHT_SW 0" }
+
+        self.exp_control_ref = "F-16C_50.json"
+        self.exp_displays = [ "DED_LINE_1", "DED_LINE_2", "DED_LINE_3", "DED_LINE_4", "DED_LINE_5" ]
+
+        # probes assume the DED starts on the CNI page. ICP probe selects the STPT page and
+        # returns to CNI, rocker probe steps the CNI steerpoint up and back down. OSB presses
+        # change the MFD formats, so the OSB class is probed with the MFD SYM rocker, which
+        # shares the MFD bezel and has no lasting effect. HOTAS probe moves the DOGFIGHT switch
+        # to DOGFIGHT and back to center.
+        #
+        self.cal_probes = { "icp" : [ (("ICP_BTN_4 1",), ("ICP_BTN_4 0",), True),
+                                      (("ICP_DATA_RTN_SEQ_SW 0",), ("ICP_DATA_RTN_SEQ_SW 1",), True) ],
+                            "rocker" : [ (("ICP_DED_SW 2",), ("ICP_DED_SW 1",), True),
+                                         (("ICP_DED_SW 0",), ("ICP_DED_SW 1",), True) ],
+                            "osb" : [ (("MFD_L_SYM 2",), ("MFD_L_SYM 1",), False),
+                                      (("MFD_L_SYM 0",), ("MFD_L_SYM 1",), False) ],
+                            "hotas" : [ (("DOGFIGHT_SW 2",), ("DOGFIGHT_SW 1",), False) ] }
+
+    def push_btn(self, key, delay_after=None, delay_release=None, ctrl_class=None):
+        self.press_with_delay(key, delay_after=delay_after, delay_release=delay_release,
+                              ctrl_class=ctrl_class)
         if delay_after is not None:
-            sleep(delay_after)
+            self.wait(delay_after)
 
     def ehsi_btn(self, btn, delay_after=None, delay_release=None):
         self.push_btn(f"EHSI_{btn}", delay_after=delay_after, delay_release=delay_release)
 
     def mfd_btn(self, lr, num, delay_after=None, delay_release=None):
-        self.push_btn(f"MFD_{lr}_{num}", delay_after=delay_after, delay_release=delay_release)
+        self.push_btn(f"MFD_{lr}_{num}", delay_after=delay_after, delay_release=delay_release,
+                      ctrl_class="osb")
+
+    # set the HOTAS DOGFIGHT switch, a maintained three-position switch, to a position: "DGFT"
+    # (DOGFIGHT), "CTR" (center), or "MSL" (MSL OVRD). the switch is set through dcs-bios so
+    # the position is absolute and dcs does not need to have focus.
+    #
+    def dgft_sw(self, pos, delay_after=None):
+        _, cal_after = self.btn_delays("hotas")
+        if delay_after is None:
+            delay_after = cal_after
+        self.emit(DriverCmd("SEND", press=(self.dgft_sw_cmds[pos],), after=delay_after))
 
     def icp_btn(self, num, delay_after=None, delay_release=None):
         # print(f"icp_btn {num}")
@@ -850,53 +1098,31 @@ class ViperDriver(Driver):
             key = "ICP_LIST_BTN"
         elif num == "RCL":
             key = "ICP_RCL_BTN"
-        self.push_btn(key, delay_after=delay_after, delay_release=delay_release)
+        self.push_btn(key, delay_after=delay_after, delay_release=delay_release, ctrl_class="icp")
 
     def icp_ded(self, num, delay_after=None, delay_release=None):
         # print(f"icp_ded {num}")
+        cal_release, cal_after = self.btn_delays("rocker", dflt_after=0.0)
+        if delay_after is None:
+            delay_after = cal_after
         if delay_release is None:
-            delay_release = self.short_delay
-
-        if num == "DN":
-            self.s.sendto(f"ICP_DED_SW 0\n".replace("OSB", "OS").encode(
-                "utf-8"), (self.host, self.port))
-        elif num == "UP":
-            self.s.sendto(f"ICP_DED_SW 2\n".replace("OSB", "OS").encode(
-                "utf-8"), (self.host, self.port))
+            delay_release = cal_release
 
-        sleep(delay_release)
-        self.s.sendto(f"ICP_DED_SW 1\n".replace("OSB", "OS").encode(
-            "utf-8"), (self.host, self.port))
-
-        if delay_after is not None:
-            sleep(delay_after)
+        press, release = self.icp_ded_cmds.get(num, ((), ()))
+        self.emit(DriverCmd("PRESS", press=press, release=release,
+                            hold=delay_release, after=delay_after))
 
     def icp_data(self, num, delay_after=None, delay_release=None):
         # print(f"icp_data {num}")
+        cal_release, cal_after = self.btn_delays("rocker", dflt_after=0.0)
+        if delay_after is None:
+            delay_after = cal_after
         if delay_release is None:
-            delay_release = self.short_delay
-
-        if num == "DN":
-            self.s.sendto(f"ICP_DATA_UP_DN_SW 0\n".replace("OSB", "OS").encode(
-                "utf-8"), (self.host, self.port))
-        elif num == "UP":
-            self.s.sendto(f"ICP_DATA_UP_DN_SW 2\n".replace("OSB", "OS").encode(
-                "utf-8"), (self.host, self.port))
-        elif num == "RTN":
-            self.s.sendto(f"ICP_DATA_RTN_SEQ_SW 0\n".replace("OSB", "OS").encode(
-                "utf-8"), (self.host, self.port))
-        elif num == "SEQ":
-            self.s.sendto(f"ICP_DATA_RTN_SEQ_SW 2\n".replace("OSB", "OS").encode(
-                "utf-8"), (self.host, self.port))
-
-        sleep(delay_release)
-        self.s.sendto(f"ICP_DATA_UP_DN_SW 1\n".replace("OSB", "OS").encode(
-            "utf-8"), (self.host, self.port))
-        self.s.sendto(f"ICP_DATA_RTN_SEQ_SW 1\n".replace("OSB", "OS").encode(
-            "utf-8"), (self.host, self.port))
+            delay_release = cal_release
 
-        if delay_after is not None:
-            sleep(delay_after)
+        press, release = self.icp_data_cmds.get(num, ((), ()))
+        self.emit(DriverCmd("PRESS", press=press, release=release,
+                            hold=delay_release, after=delay_after))
 
     def enter_number(self, number, delay_after=None, delay_release=None):
         # print(f"enter_number {number}")
@@ -917,7 +1143,7 @@ class ViperDriver(Driver):
 
     def enter_coords(self, latlong):
         lat_str, lon_str = latlon_tostring(latlong, decimal_minutes_mode=True, easting_zfill=3, zfill_minutes=2, one_digit_seconds=False, precision=3)
-        self.logger.info(f"Entering coords string: {lat_str}, {lon_str}")
+        self.note(f"Entering coords string: {lat_str}, {lon_str}")
 
         if latlong.lat.degree > 0:
             self.icp_btn("2")
@@ -946,48 +1172,106 @@ class ViperDriver(Driver):
             self.mfd_btn(lr, osb, delay_after=0.1)      # Enter format select mode
             self.mfd_btn(lr, format, delay_after=0.1)   # Select format
 
-    def enter_waypoints(self, wps, command_q=None, progress_q=None):
+    # steerpoint the current steerpoint is set to after entering waypoints: the first
+    # waypoint marked is_set_cur, or the last waypoint if none are marked.
+    #
+    def stpt_target(self, wps):
+        for i in range(0, len(wps)):
+            if wps[i].is_set_cur:
+                return i + 1
+        return len(wps)
+
+    # key that identifies what entering a waypoint puts in a steerpoint.
+    #
+    def stpt_key(self, wp):
+        lat_str, lon_str = latlon_tostring(wp.position, decimal_minutes_mode=True, easting_zfill=3, zfill_minutes=2, one_digit_seconds=False, precision=3)
+        return f"{'N' if wp.position.lat.degree > 0 else 'S'}{lat_str} {'E' if wp.position.lon.degree > 0 else 'W'}{lon_str} {wp.elevation}"
+
+    # move the steerpoint selected on the STPT page from stpt_from to stpt_to with the STPT
+    # number field active. the steerpoint is either stepped to with the DED rocker or addressed
+    # directly by entering its number, whichever takes less time given the button delays. when
+    # stpt_from is None (the selected steerpoint is not known), stpt_to is addressed directly.
+    #
+    def stpt_step(self, stpt_from, stpt_to):
+        rocker_release, rocker_after = self.btn_delays("rocker", dflt_after=0.0)
+        icp_release, icp_after = self.btn_delays("icp")
+        t_direct = (len(str(stpt_to)) + 1) * (icp_release + icp_after)
+        if stpt_from is None or t_direct < abs(stpt_to - stpt_from) * (rocker_release + rocker_after):
+            self.enter_number(stpt_to)
+            self.icp_btn("ENTR")                        # Select STPT number
+            return
+        for _ in range(stpt_from, stpt_to):
+            self.icp_ded("UP")                          # Increment STPT number
+        for _ in range(stpt_to, stpt_from):
+            self.icp_ded("DN")                          # Decrement STPT number
+
+    # enter a waypoint into the steerpoint selected on the STPT page with the STPT number
+    # field active. the STPT number field is active after entry.
+    #
+    def enter_waypoint(self, wp):
+        self.icp_data("DN")                             # To MAN/AUTO
+        self.icp_data("DN")                             # To LAT
+
+        self.bkgnd_advance()
+
+        self.enter_coords(wp.position)
+        if wp.elevation != 0:
+            self.enter_elevation(wp.elevation)
+
+        self.icp_data("UP")                             # To LON
+        self.icp_data("UP")                             # To LAT
+        self.icp_data("UP")                             # To MAN/AUTO
+        self.icp_data("UP")                             # To STPT number
+
+    def enter_waypoints(self, wps):
         if len(wps) > 0:
             self.icp_data("RTN")
 
             self.icp_btn("4", delay_after=0.1)          # Select STPT
 
-            is_cur_seen = False
-            num_backups = 1
             for wp in wps:
-                self.icp_data("DN")                     # To MAN/AUTO
-                self.icp_data("DN")                     # To LAT
-
-                self.bkgnd_advance(command_q, progress_q)
-
-                self.enter_coords(wp.position)
-                if wp.elevation != 0:
-                    self.enter_elevation(wp.elevation)
-                if is_cur_seen:
-                    num_backups += 1
-                elif wp.is_set_cur:
-                    is_cur_seen = True
-
-                self.icp_data("UP")                     # To LON
-                self.icp_data("UP")                     # To LAT
-                self.icp_data("UP")                     # To MAN/AUTO
-                self.icp_data("UP")                     # To STPT number
+                self.enter_waypoint(wp)
                 self.icp_ded("UP")                      # Increment STPT number
 
-            # "backup" the current steerpoint to select the steerpoint marked is_cur_seen.
+            # "backup" the current steerpoint to select the steerpoint marked is_set_cur.
             # if there is no such marked steerpoint, select the last one entered.
             #
-            for _ in range(0, num_backups):
-                self.icp_ded("DN")                      # Decrement STPT number
+            self.stpt_step(len(wps) + 1, self.stpt_target(wps))
             self.icp_data("RTN")
 
-    def enter_tacan(self, spec, command_q=None, progress_q=None):
+    # enter only the waypoints whose steerpoints differ from base_stpts (steerpoint keys from
+    # a previous load, see stpt_key). stpt_cur is the current steerpoint the previous load
+    # left selected. as the pilot may have changed the current steerpoint since then, the
+    # first steerpoint visited is addressed directly rather than stepped to from stpt_cur.
+    # the DED is stepped over steerpoints that have not changed after that.
+    #
+    def enter_waypoints_delta(self, wps, base_stpts, stpt_cur):
+        changed = [ i for i in range(0, len(wps))
+                    if i >= len(base_stpts) or self.stpt_key(wps[i]) != base_stpts[i] ]
+        stpt_tgt = self.stpt_target(wps) if len(wps) > 0 else stpt_cur
+        if len(changed) > 0 or stpt_tgt != stpt_cur:
+            self.note(f"Entering {len(changed)} of {len(wps)} waypoints")
+
+            self.icp_data("RTN")
+
+            self.icp_btn("4", delay_after=0.1)          # Select STPT
+
+            stpt_sel = None
+            for i in changed:
+                self.stpt_step(stpt_sel, i + 1)
+                stpt_sel = i + 1
+                self.enter_waypoint(wps[i])
+            self.stpt_step(stpt_sel, stpt_tgt)
+
+            self.icp_data("RTN")
+
+    def enter_tacan(self, spec):
         if spec is not None:
-            self.bkgnd_advance(command_q, progress_q)
+            self.bkgnd_advance()
 
             self.icp_data("RTN")
 
-            self.logger.info(f"Entering TACAN: {spec} A/A mode; EHSI TACAN")
+            self.note(f"Entering TACAN: {spec} A/A mode; EHSI TACAN")
 
             fields = [ str(field) for field in spec.split(",") ]
 
@@ -1011,17 +1295,19 @@ class ViperDriver(Driver):
 
             self.icp_data("RTN")
 
-    def enter_mfd(self, mode, spec, spec_dflt, command_q=None, progress_q=None):
-        if spec is not None:
-            self.bkgnd_advance(command_q, progress_q)
+    # enter the mfd formats for a mode. fmt_osb_list and fmt_osb_list_dflt are the parsed setup
+    # and default (see av_setup_parse_mfd).
+    #
+    def enter_mfd(self, mode, fmt_osb_list, fmt_osb_list_dflt):
+        if fmt_osb_list is not None:
+            self.bkgnd_advance()
 
-            self.logger.info(f"Entering MFD: {mode}, spec [ {spec} ]")
+            self.note(f"Entering MFD: {mode}, spec [ {','.join(fmt_osb_list)} ]")
 
             if mode == "DGFT_D":
-                self.keyboard_key_with_delay(self.prefs.hotkey_dgft_cycle)
+                self.dgft_sw("DGFT")                    # Select DOGFIGHT override
             elif mode == "DGFT_M":
-                self.keyboard_key_with_delay(self.prefs.hotkey_dgft_cycle)
-                self.keyboard_key_with_delay(self.prefs.hotkey_dgft_cycle)
+                self.dgft_sw("MSL")                     # Select MSL OVRD override
             elif mode != "NAV":
                 self.icp_btn(mode)
 
@@ -1036,9 +1322,6 @@ class ViperDriver(Driver):
             # TODO: Would work better if we could detect what is selected. Then, we could
             # TODO: act appropriately in enter_mfd_format.
             #
-            fmt_osb_list = [ str(osb) for osb in spec.split(",") ]
-            fmt_osb_list_dflt = [ str(osb) for osb in spec_dflt.split(",") ]
-
             self.enter_mfd_format("R", "12", fmt_osb_list[5], fmt_osb_list_dflt[5])
             self.enter_mfd_format("R", "13", fmt_osb_list[4], fmt_osb_list_dflt[4])
             self.enter_mfd_format("R", "14", fmt_osb_list[3], fmt_osb_list_dflt[3])
@@ -1047,11 +1330,8 @@ class ViperDriver(Driver):
             self.enter_mfd_format("L", "13", fmt_osb_list[1], fmt_osb_list_dflt[1])
             self.enter_mfd_format("L", "14", fmt_osb_list[0], fmt_osb_list_dflt[0])
 
-            if mode == "DGFT_D":
-                self.keyboard_key_with_delay(self.prefs.hotkey_dgft_cycle)
-                self.keyboard_key_with_delay(self.prefs.hotkey_dgft_cycle)
-            elif mode == "DGFT_M":
-                self.keyboard_key_with_delay(self.prefs.hotkey_dgft_cycle)
+            if mode in ("DGFT_D", "DGFT_M"):
+                self.dgft_sw("CTR")                     # Clear override
             elif mode != "NAV":
                 self.icp_btn(mode)
 
@@ -1067,61 +1347,90 @@ class ViperDriver(Driver):
                         else:
                             self.mfd_btn("L", osb_index[i])
 
-    def enter_cmds_prog_elem(self, field, dflt):
-        if field != dflt:
-            self.enter_number(field)                        # Enter field value
-            self.icp_btn("ENTR", delay_release=0.15)        # Commit field value
-        self.icp_data('DN', delay_after=0.15)               # Advance to next field
-
-    def enter_cmds_prog(self, prog_num, type, prog, dflt, command_q=None, progress_q=None):
-        if prog is not None and prog != dflt:
-            self.bkgnd_advance(command_q, progress_q)
-
-            self.logger.info(f"Entering CMDS program P{prog_num} {type}: <{prog}>, <{dflt}> default")
-            fields = prog.split(",")
-            dflts = dflt.split(",")
-
-            self.enter_cmds_prog_elem(fields[0], dflts[0])  # BQ field
-            self.enter_cmds_prog_elem(fields[1], dflts[1])  # BI field
-            self.enter_cmds_prog_elem(fields[2], dflts[2])  # SQ field
-            self.enter_cmds_prog_elem(fields[3], dflts[3])  # SI field
-
+    # return the CMDS fields that need to be entered as a dictionary that maps ( <type>,
+    # <program> ) onto a list of ( <field>, <value> ) tuples for the fields (0: BQ, 1: BI, 2: SQ,
+    # 3: SI) of the program that differ from the default. progs is a list of ( <setup>,
+    # <default> ) tuples of parsed programs (see av_setup_parse_cmds) in program order, see
+    # enter_profile.
+    #
+    def cmds_changes(self, progs):
+        changes = dict()
+        for prog_num, (prog, dflt) in enumerate(progs or [ ], 1):
+            if prog is None:
+                continue
+            for type_idx, type in enumerate([ "Chaff", "Flare" ]):
+                fields = prog[type_idx]
+                dflts = dflt[type_idx]
+                changed = [ (field, fields[field]) for field in range(0, 4) if fields[field] != dflts[field] ]
+                if len(changed) > 0:
+                    changes[(type, prog_num)] = changed
+        return changes
+
+    # move a wrapping DED selection with n items from cur to tgt, pressing fwd or back to move
+    # the selection forward or back, whichever takes fewer presses.
+    #
+    def ded_wrap_step(self, cur, tgt, n, fwd, back):
+        delta = (tgt - cur) % n
+        if delta <= n - delta:
+            for _ in range(0, delta):
+                fwd()
         else:
-            self.logger.info(f"Skipping unchanged CMDS program P{prog_num} {type}")
-            sleep(0.35)
-
-        self.icp_ded("UP", delay_after=0.25)            # Increment program number
-
-    def enter_cmds(self, progs, command_q=None, progress_q=None):
-        num_update = 0
-        if progs is not None:
-            for prog in progs:
-                if prog[0] is not None:
-                    num_update += 1
-        if num_update > 0:
-            self.icp_btn('LIST')                        # Select CMDS DED page
-            self.icp_btn('7')
-            self.icp_data('SEQ', delay_after=0.35)      # BINGO --> CHAFF
-
-            types = [ "Chaff", "Flare" ]
-            for type in types:
-                prog_num = 1
-                for prog in progs:
-                    if prog[0] is not None:
-                        self.enter_cmds_prog(prog_num, type,
-                                             prog[0].split(";")[types.index(type)],
-                                             prog[1].split(";")[types.index(type)],
-                                             command_q=command_q, progress_q=progress_q)
-                    else:
-                        self.enter_cmds_prog(prog_num, type, None, None,
-                                             command_q=command_q, progress_q=progress_q)
-                    prog_num += 1
-                if type == "Chaff":
-                    self.icp_data('SEQ', delay_after=0.35)  # CHAFF --> FLARE
-
-            self.icp_data("RTN")
+            for _ in range(0, n - delta):
+                back()
+
+    def cmds_prog_step(self, prog_cur, prog_tgt):
+        self.ded_wrap_step(prog_cur - 1, prog_tgt - 1, 6,
+                           lambda: self.icp_ded("UP"),          # Increment program number
+                           lambda: self.icp_ded("DN"))          # Decrement program number
+
+    def cmds_field_step(self, field_cur, field_tgt):
+        self.ded_wrap_step(field_cur, field_tgt, 4,
+                           lambda: self.icp_data("DN"),         # Advance to next field
+                           lambda: self.icp_data("UP"))         # Back to previous field
+
+    # enter the CMDS programs. only the fields that change are visited, taking the shortest
+    # path through the programs and fields. programs are changed with the cursor on the BQ
+    # field and each type is left on program 1, as the CMDS page starts.
+    #
+    def enter_cmds(self, progs):
+        changes = self.cmds_changes(progs)
+        if len(changes) == 0:
+            self.note("Skipping unchanged CMDS programs")
+            return
 
-    def enter_bulls(self, bulls, command_q=None, progress_q=None):
+        self.icp_btn('LIST')                            # Select CMDS DED page
+        self.icp_btn('7')
+        self.icp_data('SEQ', delay_after=0.35)          # BINGO --> CHAFF
+
+        for type in [ "Chaff", "Flare" ]:
+            self.phase(f"cmds.{type.lower()}")
+            prog_nums = [ prog_num for prog_num in range(1, 7) if (type, prog_num) in changes ]
+            if type == "Flare":
+                if len(prog_nums) == 0:
+                    break
+                self.icp_data('SEQ', delay_after=0.35)  # CHAFF --> FLARE
+
+            prog_cur = 1
+            for prog_num in prog_nums:
+                self.bkgnd_advance()
+
+                fields = changes[(type, prog_num)]
+                self.note(f"Entering CMDS program P{prog_num} {type}: {fields}")
+                self.cmds_prog_step(prog_cur, prog_num)
+                prog_cur = prog_num
+
+                field_cur = 0
+                for field, value in fields:
+                    self.cmds_field_step(field_cur, field)
+                    field_cur = field
+                    self.enter_number(value)            # Enter field value
+                    self.icp_btn("ENTR", delay_release=0.15)
+                self.cmds_field_step(field_cur, 0)
+            self.cmds_prog_step(prog_cur, 1)
+
+        self.icp_data("RTN")
+
+    def enter_bulls(self, bulls):
         if bulls is not None:
             self.icp_btn('LIST')                        # Select BULLS DED page
             self.icp_btn('0')
@@ -1129,11 +1438,11 @@ class ViperDriver(Driver):
 
             if bulls == "1":
                 self.icp_btn('0')                       # Set OWNSHIP mode
-            self.bkgnd_advance(command_q, progress_q)
+            self.bkgnd_advance()
 
             self.icp_data("RTN")
 
-    def enter_jhmcs(self, jhmcs, command_q=None, progress_q=None):
+    def enter_jhmcs(self, jhmcs):
         if jhmcs is not None:
             self.icp_btn('LIST')                        # Select HMCS DED page
             self.icp_btn('0')
@@ -1156,46 +1465,73 @@ class ViperDriver(Driver):
             if bool(fields[2]) == False:
                 self.icp_btn('0', delay_after=0.15)     # Disable RWR, advance
 
-            self.bkgnd_advance(command_q, progress_q)
+            self.bkgnd_advance()
 
             self.icp_data("RTN")
 
-    def enter_all(self, profile, command_q=None, progress_q=None):
+    # return the avionics setup items the driver enters for a profile as a dictionary. keys
+    # are "tacan", "mfd_<mode>", "cmds_p<n>", "bulls", and "jhmcs", values are the setups from
+    # an AvionicsSetup, parsed for the mfd setups and cmds programs.
+    #
+    def avs_items(self, av_setup):
+        avs_dict = av_setup.avs_dict
+        avs_parsed = av_setup.avs_parsed
+        items = { 'tacan' : avs_dict.get('tacan_yard'),
+                  'bulls' : avs_dict.get('f16_bulls_setup'),
+                  'jhmcs' : avs_dict.get('f16_jhmcs_setup') }
+        for mode in [ 'nav', 'air', 'gnd', 'dog' ]:
+            items[f"mfd_{mode}"] = avs_parsed.get(f"f16_mfd_setup_{mode}")
+        for pgm_num in range(1,7):
+            items[f"cmds_p{pgm_num}"] = avs_parsed.get(f"f16_cmds_setup_p{pgm_num}")
+        return items
+
+    # snapshot is a dictionary with the steerpoint keys of the steerpoints entered ("stpts"),
+    # the current steerpoint ("stpt_cur"), and the avionics setup items entered ("avs", see
+    # avs_items). items the profile does not set keep their values from the baseline.
+    #
+    def snapshot(self, profile, baseline=None):
+        waypoints = self.validate_waypoints(profile.all_waypoints_as_list)
+        snapshot = { 'stpts' : [ ], 'stpt_cur' : None, 'avs' : dict() }
+        if baseline is not None:
+            snapshot = { 'stpts' : list(baseline['stpts']), 'stpt_cur' : baseline['stpt_cur'],
+                         'avs' : dict(baseline['avs']) }
+        if len(waypoints) > 0:
+            stpts = [ self.stpt_key(wp) for wp in waypoints ]
+            snapshot['stpts'] = stpts + snapshot['stpts'][len(stpts):]
+            snapshot['stpt_cur'] = self.stpt_target(waypoints)
+        for key, value in self.avs_items(profile.av_setup).items():
+            if value is not None:
+                snapshot['avs'][key] = value
+        return snapshot
+
+    def enter_profile(self, profile):
         waypoints = self.validate_waypoints(profile.all_waypoints_as_list)
 
-        # roughly speaking, one element in the avs_dict corresponds to one step in the setup
-        # process. adjust here based on deviations from that.
-        #
-        # 1) DGFT MFD setup requires 2 steps, though there is one avs_dict entry
+        av_setup = profile.av_setup
+        avs_dict = av_setup.avs_dict
+        avs_items = self.avs_items(av_setup)
+
+        # with a baseline, drop avionics setup items that match what is already in the jet and
+        # use the baseline in place of the defaults for the rest.
         #
-        avs_dict = profile.av_setup.to_dict()
-        num_steps = len(avs_dict)
-        if avs_dict.get('f16_mfd_setup_dog') is not None:
-            num_steps += 1
-        if avs_dict.get('f16_bulls_setup') is not None:
-            bulls_setup = avs_dict.get('f16_bulls_setup')
-            num_steps += 1
-        else:
-            bulls_setup = None
-        if avs_dict.get('f16_jhmcs_setup') is not None:
-            jhmcs_setup = avs_dict.get('f16_jhmcs_setup')
-            num_steps += 1
-        else:
-            jhmcs_setup = None
+        base_avs = dict() if self.baseline is None else self.baseline['avs']
+        for key, value in avs_items.items():
+            if value is not None and value == base_avs.get(key):
+                avs_items[key] = None
 
         # build array of tuples ( setup, default ) for each cmds program. array is in program
         # order and set up according to optimized setting.
         #
         cmds_progs = [ ]
         for pgm_num in range(1,7):
-            pgm_name = f"f16_cmds_setup_p{pgm_num}"
             dfl_name = f"f16_cmds_setup_p{pgm_num}_dflt"
-            if avs_dict.get('f16_cmds_setup_opt') == True:
-                dfl = avs_dict.get(dfl_name)
+            if base_avs.get(f"cmds_p{pgm_num}") is not None:
+                dfl = base_avs.get(f"cmds_p{pgm_num}")
+            elif avs_dict.get('f16_cmds_setup_opt') == True:
+                dfl = av_setup.avs_parsed.get(dfl_name)
             else:
-                dfl = "-1,-1,-1,-1;-1,-1,-1,-1"
-            cmds_progs.append((avs_dict.get(pgm_name), dfl))
-        print(cmds_progs)
+                dfl = (("-1",) * 4,) * 2
+            cmds_progs.append((avs_items[f"cmds_p{pgm_num}"], dfl))
 
         # build dictionary of tuples ( setup, default ) for each mfd setup. dictionary is set
         # up according to optimized setting.
@@ -1204,26 +1540,29 @@ class ViperDriver(Driver):
                       'DGFT_D' : ('dog', 'dog'), 'DGFT_M' : ('air', 'dog') }
         mfd_progs = { }
         for mode in mfd_modes.keys():
-            pgm_name = f"f16_mfd_setup_{mfd_modes[mode][0]}"
+            pgm_name = f"mfd_{mfd_modes[mode][0]}"
             dfl_name = f"f16_mfd_setup_{mfd_modes[mode][1]}_dflt"
-            if avs_dict.get('f16_mfd_setup_opt') == True:
-                dfl = avs_dict.get(dfl_name)
+            if base_avs.get(pgm_name) is not None:
+                dfl = base_avs.get(pgm_name)
+            elif avs_dict.get('f16_mfd_setup_opt') == True:
+                dfl = av_setup.avs_parsed.get(dfl_name)
             else:
-                dfl = "0,0,0,0,0,0"
-            mfd_progs[mode] = (avs_dict.get(pgm_name), dfl)
-
-        self.bkgnd_prog_step = (1.0 / (len(waypoints) + num_steps + 1)) * 100.0
-        self.bkgnd_prog_cur = 0
+                dfl = ("0",) * 6
+            mfd_progs[mode] = (avs_items[pgm_name], dfl)
 
-        try:
-            self.enter_waypoints(waypoints, command_q=command_q, progress_q=progress_q)
-            self.enter_tacan(avs_dict.get('tacan_yard'), command_q=command_q, progress_q=progress_q)
-            for mode in [ 'NAV', 'AA_MODE', 'AG_MODE', 'DGFT_D', 'DGFT_M' ]:
-                self.enter_mfd(mode, mfd_progs[mode][0], mfd_progs[mode][1],
-                               command_q=command_q, progress_q=progress_q)
-            self.enter_cmds(cmds_progs, command_q=command_q, progress_q=progress_q)
-            self.enter_bulls(bulls_setup, command_q=command_q, progress_q=progress_q)
-            self.enter_jhmcs(jhmcs_setup, command_q=command_q, progress_q=progress_q)
-            self.bkgnd_advance(command_q, progress_q, is_done=True)
-        except Exception as e:
-            self.logger.debug(f"Exception raised: {e}")
+        self.phase("waypoints")
+        if self.baseline is None:
+            self.enter_waypoints(waypoints)
+        else:
+            self.enter_waypoints_delta(waypoints, self.baseline['stpts'], self.baseline['stpt_cur'] or 1)
+        self.phase("tacan")
+        self.enter_tacan(avs_items['tacan'])
+        for mode in [ 'NAV', 'AA_MODE', 'AG_MODE', 'DGFT_D', 'DGFT_M' ]:
+            self.phase(f"mfd.{mode.lower()}")
+            self.enter_mfd(mode, mfd_progs[mode][0], mfd_progs[mode][1])
+        self.phase("cmds")
+        self.enter_cmds(cmds_progs)
+        self.phase("bulls")
+        self.enter_bulls(avs_items['bulls'])
+        self.phase("jhmcs")
+        self.enter_jhmcs(avs_items['jhmcs'])
@@ -27,42 +27,11 @@ import queue
 from time import sleep
 from win32gui import GetWindowText, GetForegroundWindow
 
+from src.airframes import airframe_map, airframe_list, airframe_ui_text_to_type, airframe_type_to_ui_text
 from src.logger import get_logger
 
 logger = get_logger(__name__)
 
-# maps UI text : internal type for airframe pulldown menus in the ui.
-#
-airframe_map = { "A-10C Warthog" : "warthog",
-                 "AV-8B Harrier" : "harrier",
-                 "F-14A/B Tomcat" : "tomcat",
-                 "F-16C Viper" : "viper",
-                 "F/A-18C Hornet" : "hornet",
-                 "M-2000C Mirage" : "mirage"
-}
-
-
-# return list of supported airframes. second token (" " separated) of items is internal name.
-#
-def airframe_list():
-    return list(airframe_map.keys())
-
-# convert ui airframe text to internal airframe type.
-#  
-def airframe_ui_text_to_type(ui_text):
-    type = airframe_map[ui_text]
-    if type is None:
-        type = "viper"
-    return type
-
-# convert interanl airframe type to text suitable for ui
-#
-def airframe_type_to_ui_text(type):
-    hits = [k for k,v in airframe_map.items() if v == type]
-    if (len(hits) == 0):
-        hits = ["F-16C Viper"]
-    return hits[0]
-
 # add strike-through in gui-text
 #
 def gui_text_strike(text):
@@ -158,13 +127,32 @@ def gui_verify_dcs_running(message=None, is_notify=True):
         PyGUI.Popup(f"{message}DCS is not currently running.", title="Error")
     return is_running
 
+# format a time estimate (in seconds) for display, "" if there is no estimate.
+#
+def gui_format_eta(eta):
+    if eta is None:
+        return ""
+    eta = int(round(eta))
+    return f"{eta // 60}:{eta % 60:02d}"
+
+# format per-endpoint progress from a { <endpoint> : <percent> } dictionary for display in
+# the progress ui, where <endpoint> is a ( <host>, <port> ) tuple.
+#
+def gui_format_endpoints(endpoints):
+    return "   ".join([ f"{host}:{port} {pct:3.0f}%"
+                        for (host, port), pct in sorted(endpoints.items()) ])
+
 # run a background operation with a modal progress ui.
 #
 # the backgrounded operation (bop_fn) must take two named args: progress_q and cancel_q in
 # addition to any unamed arguments given by the tuple in bop_args.
 #
 #   progress_q (queue)  operation puts numbers on [0,100] representing the completion
-#                       percentage, "DONE" when the operation has finished or is cancelled
+#                       percentage, or ( <percent>, <eta> ) tuples where <eta> is the time
+#                       remaining in seconds, ( <endpoint>, <percent>, <eta> ) tuples for
+#                       progress on a single ( <host>, <port> ) endpoint of an operation that
+#                       fans out to several endpoints, "DONE" when the operation has finished
+#                       or is cancelled
 #   command_q (queue)   gui puts "CANCEL" in this queue to indicate the operation should
 #                       stop processing, clean up, and exit
 #
@@ -176,9 +164,13 @@ def gui_backgrounded_operation(title, bop_fn=None, bop_args=None):
     #
     layout = [[PyGUI.Text("Progress:", size=(8,1), justification="right"),
                PyGUI.ProgressBar(100, key='ux_progress', size=(25,16)),
-               PyGUI.Button("Cancel", key='ux_cancel', size=(10,1), pad=(6,16))]]
+               PyGUI.Text("", key='ux_eta', size=(8,1)),
+               PyGUI.Button("Cancel", key='ux_cancel', size=(10,1), pad=(6,16))],
+              [PyGUI.Text("", key='ux_endpoints', size=(64,1), visible=False)]]
     window = None
     progress = 0
+    eta = None
+    endpoints = dict()
 
     # launch a background thread to run the backgrounded work in the background.
     #
@@ -204,6 +196,9 @@ def gui_backgrounded_operation(title, bop_fn=None, bop_args=None):
             logger.debug(f"Build progress window, fg {GetWindowText(GetForegroundWindow())}")
             window = PyGUI.Window(title, layout, modal=True, finalize=True, disable_close=True)
             window['ux_progress'].update(progress)
+            window['ux_eta'].update(gui_format_eta(eta))
+            if len(endpoints) > 1:
+                window['ux_endpoints'].update(gui_format_endpoints(endpoints), visible=True)
 
         if window is not None:
             event, _ = window.read(timeout=250, timeout_key='ux_timeout')
@@ -212,17 +207,39 @@ def gui_backgrounded_operation(title, bop_fn=None, bop_args=None):
             event = 'ux_timeout'
 
         if event == 'ux_timeout':
-            try:
-                progress = progress_q.get(False)
-                if progress == "DONE":
-                    logger.debug(f"Backgrounded op progress: DONE")
+
+            # the operation may report progress faster than we poll the queue, so drain the
+            # queue each poll and only show the latest progress it holds. per-endpoint progress
+            # is tracked separately from the overall progress.
+            #
+            is_done = False
+            latest = None
+            is_endpoints_dirty = False
+            while not is_done:
+                try:
+                    item = progress_q.get(False)
+                except queue.Empty:
                     break
+                if item == "DONE":
+                    is_done = True
+                elif type(item) == tuple and len(item) == 3:
+                    endpoints[item[0]] = item[1]
+                    is_endpoints_dirty = True
                 else:
-                    logger.debug(f"Backgrounded op progress: {progress:.2f}")
-                    if window is not None:
-                        window['ux_progress'].update(progress)
-            except queue.Empty:
-                pass
+                    latest = item
+            if is_endpoints_dirty and window is not None and len(endpoints) > 1:
+                window['ux_endpoints'].update(gui_format_endpoints(endpoints), visible=True)
+            if latest is not None:
+                progress = latest
+                if type(progress) == tuple:
+                    progress, eta = progress
+                logger.debug(f"Backgrounded op progress: {progress:.2f}")
+                if window is not None:
+                    window['ux_progress'].update(progress)
+                    window['ux_eta'].update(gui_format_eta(eta))
+            if is_done:
+                logger.debug(f"Backgrounded op progress: DONE")
+                break
         elif event == 'ux_cancel':
             logger.debug("Sending cancel to backgrounded op, waiting for join")
             window['ux_cancel'].update(text="Cancelling...", disabled=True)
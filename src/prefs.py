@@ -24,7 +24,8 @@ import re
 
 from configparser import ConfigParser
 from pathlib import Path
-from src.gui_util import airframe_type_to_ui_text
+from src.airframes import airframe_type_to_ui_text
+from src.db import DB_STORAGE_PROFILES
 from src.logger import get_logger
 
 
@@ -126,6 +127,54 @@ class Preferences:
             raise ValueError("Medium button release delay must be larger than zero")
         self._dcs_btn_rel_delay_medium = value
 
+    # additional dcs-bios endpoints to fan loads out to are encoded as a ","-separated list of
+    # "<host>:<port>" entries (e.g., "10.0.0.12:7778, 10.0.0.13:7778"). the list form is a list
+    # of ( <host>, <port> ) tuples.
+    #
+    @property
+    def dcs_bios_endpoints(self):
+        return self._dcs_bios_endpoints
+
+    @property
+    def dcs_bios_endpoints_list(self):
+        return self._dcs_bios_endpoints_list
+
+    @dcs_bios_endpoints.setter
+    def dcs_bios_endpoints(self, value):
+        endpoints = [ ]
+        for entry in [ entry.strip() for entry in value.split(",") if entry.strip() != "" ]:
+            host, port = entry.rsplit(":", 1)
+            if host == "" or int(port) <= 0 or int(port) > 65535:
+                raise ValueError("Invalid DCS-BIOS endpoint")
+            endpoints.append((host, int(port)))
+        self._dcs_bios_endpoints = value
+        self._dcs_bios_endpoints_list = endpoints
+
+    # calibrated button delays are encoded as a ";"-separated list of entries of the form
+    # "<airframe>.<class>=<release>/<after>" (e.g., "viper.icp=0.060/0.090"). the map form
+    # maps ( <airframe>, <class> ) tuples onto ( <release>, <after> ) float tuples.
+    #
+    @property
+    def dcs_btn_cal_delays(self):
+        return self._dcs_btn_cal_delays
+
+    @property
+    def dcs_btn_cal_delays_map(self):
+        return self._dcs_btn_cal_delays_map
+
+    @dcs_btn_cal_delays.setter
+    def dcs_btn_cal_delays(self, value):
+        cal_map = dict()
+        for entry in [ entry for entry in value.split(";") if entry != "" ]:
+            key, delays = entry.split("=")
+            airframe, ctrl_class = key.split(".")
+            release, after = [ float(delay) for delay in delays.split("/") ]
+            if release <= 0.0 or after < 0.0:
+                raise ValueError("Calibrated button delays must be larger than zero")
+            cal_map[(airframe, ctrl_class)] = (release, after)
+        self._dcs_btn_cal_delays = value
+        self._dcs_btn_cal_delays_map = cal_map
+
     @property
     def hotkey_capture(self):
         return self._hotkey_capture
@@ -186,16 +235,6 @@ class Preferences:
             raise ValueError("Invalid hotkey")
         self._hotkey_item_sel_advance = value
 
-    @property
-    def hotkey_dgft_cycle(self):
-        return self._hotkey_dgft_cycle
-    
-    @hotkey_dgft_cycle.setter
-    def hotkey_dgft_cycle(self, value):
-        if not self.is_hotkey_valid(value):
-            raise ValueError("Invalid hotkey")
-        self._hotkey_dgft_cycle = value
-
     @property
     def airframe_default(self):
         return self._airframe_default
@@ -308,6 +347,58 @@ class Preferences:
             value = "true" if value else "false"
         self._is_disable_export = value
 
+    @property
+    def is_btn_ack_pacing(self):
+        return self._is_btn_ack_pacing
+
+    @property
+    def is_btn_ack_pacing_bool(self):
+        return True if self._is_btn_ack_pacing == "true" else False
+
+    @is_btn_ack_pacing.setter
+    def is_btn_ack_pacing(self, value):
+        if type(value) == bool or type(value) == int or type(value) == float:
+            value = "true" if value else "false"
+        self._is_btn_ack_pacing = value
+
+    @property
+    def is_trace_record(self):
+        return self._is_trace_record
+
+    @property
+    def is_trace_record_bool(self):
+        return True if self._is_trace_record == "true" else False
+
+    @is_trace_record.setter
+    def is_trace_record(self, value):
+        if type(value) == bool or type(value) == int or type(value) == float:
+            value = "true" if value else "false"
+        self._is_trace_record = value
+
+    @property
+    def db_storage(self):
+        return self._db_storage
+
+    @db_storage.setter
+    def db_storage(self, value):
+        if value not in DB_STORAGE_PROFILES:
+            raise ValueError("Unknown storage profile")
+        self._db_storage = value
+
+    @property
+    def is_delta_load(self):
+        return self._is_delta_load
+
+    @property
+    def is_delta_load_bool(self):
+        return True if self._is_delta_load == "true" else False
+
+    @is_delta_load.setter
+    def is_delta_load(self, value):
+        if type(value) == bool or type(value) == int or type(value) == float:
+            value = "true" if value else "false"
+        self._is_delta_load = value
+
     @property
     def last_profile_sel(self):
         return self._last_profile_sel
@@ -318,6 +409,18 @@ class Preferences:
 
     # ================ general methods
 
+    # set the calibrated button delays for a control class on an airframe, must persist via
+    # persist_prefs to save. delays of None clear the calibration.
+    #
+    def set_dcs_btn_cal_delays(self, airframe, ctrl_class, release=None, after=None):
+        cal_map = dict(self.dcs_btn_cal_delays_map)
+        if release is None or after is None:
+            cal_map.pop((airframe, ctrl_class), None)
+        else:
+            cal_map[(airframe, ctrl_class)] = (release, after)
+        self.dcs_btn_cal_delays = ";".join([ f"{key[0]}.{key[1]}={val[0]:.3f}/{val[1]:.3f}"
+                                             for key, val in sorted(cal_map.items()) ])
+
     # validate a hot key sequence
     #
     def is_hotkey_valid(self, hotkey):
@@ -346,17 +449,18 @@ class Preferences:
     #
     def reset_prefs(self):
         self.path_dcs = f"{str(Path.home())}\\Saved Games\\DCS.openbeta" + "\\"
-        self.path_tesseract = f"{os.environ['PROGRAMW6432']}\\Tesseract-OCR\\tesseract.exe"
+        path_programs = os.environ.get("PROGRAMW6432", "C:\\Program Files")
+        self.path_tesseract = f"{path_programs}\\Tesseract-OCR\\tesseract.exe"
         self.path_mission = f"{str(Path.home())}\\Desktop\\cf_mission.xml"
         self.dcs_btn_rel_delay_short = "0.15"
         self.dcs_btn_rel_delay_medium = "0.40"
+        self.dcs_btn_cal_delays = ""
         self.hotkey_capture = "ctrl+t"
         self.hotkey_capture_mode = "ctrl+shift+t"
         self.hotkey_enter_profile = "ctrl+alt+t"
         self.hotkey_enter_mission = "ctrl+alt+shift+t"
         self.hotkey_item_sel_type_toggle = "ctrl+alt+a"
         self.hotkey_item_sel_advance = "ctrl+alt+z"
-        self.hotkey_dgft_cycle = "left ctrl+3"
         self.airframe_default = "viper"
         self.av_setup_default = "DCS Default"
         self.callsign_default = "Colt1-1"
@@ -366,6 +470,11 @@ class Preferences:
         self.is_f10_elev_clamped = "true"
         self.is_load_auto_quit = "false"
         self.is_disable_export = "false"
+        self.is_btn_ack_pacing = "false"
+        self.is_delta_load = "false"
+        self.is_trace_record = "false"
+        self.dcs_bios_endpoints = ""
+        self.db_storage = "safe"
         self.last_profile_sel = ""
 
     # synchronize the preferences the backing store file
@@ -380,13 +489,13 @@ class Preferences:
             self.path_mission = self.prefs["PREFERENCES"]["path_mission"]
             self.dcs_btn_rel_delay_short = self.prefs["PREFERENCES"]["dcs_btn_rel_delay_short"]
             self.dcs_btn_rel_delay_medium = self.prefs["PREFERENCES"]["dcs_btn_rel_delay_medium"]
+            self.dcs_btn_cal_delays = self.prefs["PREFERENCES"]["dcs_btn_cal_delays"]
             self.hotkey_capture = self.prefs["PREFERENCES"]["hotkey_capture"]
             self.hotkey_capture_mode = self.prefs["PREFERENCES"]["hotkey_capture_mode"]
             self.hotkey_enter_profile = self.prefs["PREFERENCES"]["hotkey_enter_profile"]
             self.hotkey_enter_mission = self.prefs["PREFERENCES"]["hotkey_enter_mission"]
             self.hotkey_item_sel_type_toggle = self.prefs["PREFERENCES"]["hotkey_item_sel_type_toggle"]
             self.hotkey_item_sel_advance = self.prefs["PREFERENCES"]["hotkey_item_sel_advance"]
-            self.hotkey_dgft_cycle = self.prefs["PREFERENCES"]["hotkey_dgft_cycle"]
             self.airframe_default = self.prefs["PREFERENCES"]["airframe_default"]
             self.av_setup_default = self.prefs["PREFERENCES"]["av_setup_default"]
             self.callsign_default = self.prefs["PREFERENCES"]["callsign_default"]
@@ -396,6 +505,11 @@ class Preferences:
             self.is_f10_elev_clamped = self.prefs["PREFERENCES"]["is_f10_elev_clamped"]
             self.is_load_auto_quit = self.prefs["PREFERENCES"]["is_load_auto_quit"]
             self.is_disable_export = self.prefs["PREFERENCES"]["is_disable_export"]
+            self.is_btn_ack_pacing = self.prefs["PREFERENCES"]["is_btn_ack_pacing"]
+            self.is_delta_load = self.prefs["PREFERENCES"]["is_delta_load"]
+            self.is_trace_record = self.prefs["PREFERENCES"]["is_trace_record"]
+            self.dcs_bios_endpoints = self.prefs["PREFERENCES"]["dcs_bios_endpoints"]
+            self.db_storage = self.prefs["PREFERENCES"]["db_storage"]
             self.last_profile_sel = self.prefs["PREFERENCES"]["last_profile_sel"]
         except:
             logger.error("Synchronize failed, resetting preferences to defaults")
@@ -409,13 +523,13 @@ class Preferences:
         self.prefs["PREFERENCES"]["path_mission"] = self.path_mission
         self.prefs["PREFERENCES"]["dcs_btn_rel_delay_short"] = self.dcs_btn_rel_delay_short
         self.prefs["PREFERENCES"]["dcs_btn_rel_delay_medium"] = self.dcs_btn_rel_delay_medium
+        self.prefs["PREFERENCES"]["dcs_btn_cal_delays"] = self.dcs_btn_cal_delays
         self.prefs["PREFERENCES"]["hotkey_capture"] = self.hotkey_capture
         self.prefs["PREFERENCES"]["hotkey_capture_mode"] = self.hotkey_capture_mode
         self.prefs["PREFERENCES"]["hotkey_enter_profile"] = self.hotkey_enter_profile
         self.prefs["PREFERENCES"]["hotkey_enter_mission"] = self.hotkey_enter_mission
         self.prefs["PREFERENCES"]["hotkey_item_sel_type_toggle"] = self.hotkey_item_sel_type_toggle
         self.prefs["PREFERENCES"]["hotkey_item_sel_advance"] = self.hotkey_item_sel_advance
-        self.prefs["PREFERENCES"]["hotkey_dgft_cycle"] = self.hotkey_dgft_cycle
         self.prefs["PREFERENCES"]["airframe_default"] = self.airframe_default
         self.prefs["PREFERENCES"]["av_setup_default"] = self.av_setup_default
         self.prefs["PREFERENCES"]["callsign_default"] = self.callsign_default
@@ -425,6 +539,11 @@ class Preferences:
         self.prefs["PREFERENCES"]["is_f10_elev_clamped"] = self.is_f10_elev_clamped
         self.prefs["PREFERENCES"]["is_load_auto_quit"] = self.is_load_auto_quit
         self.prefs["PREFERENCES"]["is_disable_export"] = self.is_disable_export
+        self.prefs["PREFERENCES"]["is_btn_ack_pacing"] = self.is_btn_ack_pacing
+        self.prefs["PREFERENCES"]["is_delta_load"] = self.is_delta_load
+        self.prefs["PREFERENCES"]["is_trace_record"] = self.is_trace_record
+        self.prefs["PREFERENCES"]["dcs_bios_endpoints"] = self.dcs_bios_endpoints
+        self.prefs["PREFERENCES"]["db_storage"] = self.db_storage
         self.prefs["PREFERENCES"]["last_profile_sel"] = self.last_profile_sel
 
         if do_write:
@@ -26,6 +26,7 @@ import requests
 
 from src.comp_dcs_bios import dcs_bios_vers_install, dcs_bios_vers_latest, dcs_bios_is_current
 from src.comp_dcs_bios import dcs_bios_install
+from src.db import DB_STORAGE_PROFILES
 from src.db_models import AvionicsSetupModel
 from src.gui_util import airframe_list, airframe_ui_text_to_type, airframe_type_to_ui_text
 from src.logger import get_logger
@@ -67,6 +68,11 @@ class PreferencesGUI:
         except:
             errors = errors + "default airframe, "
 
+        try:
+            self.prefs.db_storage = values.get('ux_db_storage')
+        except:
+            errors = errors + "profile database storage, "
+
         try:
             self.prefs.av_setup_default = values.get('ux_av_setup_default')
             if self.prefs.av_setup_default not in AvionicsSetupModel.list_all_names():
@@ -84,6 +90,11 @@ class PreferencesGUI:
         except:
             errors = errors + "medium release, "
 
+        try:
+            self.prefs.dcs_bios_endpoints = values.get('ux_dcs_bios_endpoints')
+        except:
+            errors = errors + "additional endpoints, "
+
         try:
             self.prefs.hotkey_capture = values.get('ux_hotkey_capture')
         except:
@@ -114,17 +125,15 @@ class PreferencesGUI:
         except:
             errors = errors + "'Item Select Advance' hotkey, "
 
-        try:
-            self.prefs.hotkey_dgft_cycle = values.get('ux_hotkey_dgft_cycle')
-        except:
-            errors = errors + "'DGFT Cycle' hotkey, "
-
         self.prefs.is_auto_upd_check = values.get('ux_is_auto_upd_check')
         self.prefs.is_tesseract_debug = values.get('ux_is_tesseract_debug')
         self.prefs.is_av_setup_for_unk = values.get('ux_av_setup_unknown')
         self.prefs.is_f10_elev_clamped = values.get('ux_is_f10_elev_clamped')
         self.prefs.is_load_auto_quit = values.get('ux_is_load_auto_quit')
         self.prefs.is_disable_export = values.get('ux_is_disable_export')
+        self.prefs.is_btn_ack_pacing = values.get('ux_is_btn_ack_pacing')
+        self.prefs.is_delta_load = values.get('ux_is_delta_load')
+        self.prefs.is_trace_record = values.get('ux_is_trace_record')
 
         self.prefs.persist_prefs()
 
@@ -139,6 +148,9 @@ class PreferencesGUI:
         is_f10_elev_clamped = self.prefs.is_f10_elev_clamped_bool
         is_load_auto_quit = self.prefs.is_load_auto_quit_bool
         is_disable_export = self.prefs.is_disable_export_bool
+        is_btn_ack_pacing = self.prefs.is_btn_ack_pacing_bool
+        is_delta_load = self.prefs.is_delta_load_bool
+        is_trace_record = self.prefs.is_trace_record_bool
         dcs_bios_ver = dcs_bios_vers_install(self.prefs.path_dcs)
         try:
             as_tmplts = [ "DCS Default" ] + AvionicsSetupModel.list_all_names()
@@ -213,22 +225,10 @@ class PreferencesGUI:
 
         ]
 
-        layout_hk_dcs = [
-            [PyGUI.Text("", font="Helvetica 6", pad=(0,0))],
-
-            [PyGUI.Text("F-16 HOTAS / DOGFIGHT Cycle:", (26,1), justification="right"),
-             PyGUI.Input(self.prefs.hotkey_dgft_cycle, key='ux_hotkey_dgft_cycle',
-                         enable_events=True, size=(54,1), pad=((0,20),0))],
-
-            [PyGUI.Text("", font="Helvetica 6", pad=(0,0))],
-        ]
-
         layout_hotkeys_tab = [
             PyGUI.Tab("Keyboard",
                       [[PyGUI.Text("", font="Helvetica 6", pad=(0,0))],
                        [PyGUI.Frame("DCSWE Hot Keys", layout_hk_dcswe)],
-                       [PyGUI.Text("", font="Helvetica 6", pad=(0,0))],
-                       [PyGUI.Frame("DCS Aircraft Control Key Binds", layout_hk_dcs)],
                        [PyGUI.Text("", font="Helvetica 6", pad=(0,0))]])
         ]
 
@@ -249,6 +249,22 @@ class PreferencesGUI:
              PyGUI.Checkbox("", default=is_disable_export, key='ux_is_disable_export'),
              PyGUI.Text("(restart DCSWE to apply changes to this preference)", pad=((0,14),0))],
 
+            [PyGUI.Text("Pace presses on export stream:", (26,1), justification="right"),
+             PyGUI.Checkbox("", default=is_btn_ack_pacing, key='ux_is_btn_ack_pacing'),
+             PyGUI.Text("(button press delays become upper bounds)", pad=((0,14),0))],
+
+            [PyGUI.Text("Only load changes since last load:", (26,1), justification="right"),
+             PyGUI.Checkbox("", default=is_delta_load, key='ux_is_delta_load'),
+             PyGUI.Text("(supported airframes only, not across respawns)", pad=((0,14),0))],
+
+            [PyGUI.Text("Record load traces:", (26,1), justification="right"),
+             PyGUI.Checkbox("", default=is_trace_record, key='ux_is_trace_record'),
+             PyGUI.Text("(appends to trace.bin, see driver_trace.py)", pad=((0,14),0))],
+
+            [PyGUI.Text("Also load to endpoints:", (26,1), justification="right"),
+             PyGUI.Input(self.prefs.dcs_bios_endpoints, key='ux_dcs_bios_endpoints', enable_events=True),
+             PyGUI.Text("(<host>:<port>, ...)", justification="left", pad=((0,14),0))],
+
             [PyGUI.Text("", font="Helvetica 6", pad=(0,0))],
 
             [PyGUI.Text("DCS-BIOS:", (22,1), justification="right"),
@@ -289,6 +305,11 @@ class PreferencesGUI:
             [PyGUI.Text("Check for updates at launch:", (27,1), justification="right", pad=(6,6)),
              PyGUI.Checkbox("", default=is_auto_upd_check, key='ux_is_auto_upd_check', pad=(0,6))],
 
+            [PyGUI.Text("Profile database storage:", (27,1), justification="right"),
+             PyGUI.Combo(values=list(DB_STORAGE_PROFILES.keys()), default_value=self.prefs.db_storage,
+                         key='ux_db_storage', readonly=True, size=(8,1)),
+             PyGUI.Text("(restart DCSWE to apply changes to this preference)", pad=((0,14),0))],
+
             [PyGUI.Text("", font="Helvetica 6", pad=(0,0))],
         ]
 
@@ -381,9 +402,6 @@ class PreferencesGUI:
     def validate_item_sel_adv_hot_key(self, value, quiet=False):
         self.core_validate_hot_key(value, "Item Advance", quiet)
 
-    def validate_dog_cycle_hot_key(self, value, quiet=False):
-        self.core_validate_hot_key(value, "DGFT Cycle", quiet)
-
     def core_validate_duration(self, value, type, quiet=False):
         try:
             if float(value) <= 0.0:
@@ -418,7 +436,6 @@ class PreferencesGUI:
                               'ux_hotkey_enter_mission' : self.validate_enter_mission_hot_key,
                               'ux_hotkey_item_sel_type_toggle' : self.validate_item_sel_adv_typ_hot_key,
                               'ux_hotkey_item_sel_advance' : self.validate_item_sel_adv_hot_key,
-                              'ux_hotkey_dgft_cycle' : self.validate_dog_cycle_hot_key,
                               'ux_dcs_btn_rel_delay_short' : self.validate_rds_duration,
                               'ux_dcs_btn_rel_delay_medium' : self.validate_rdm_duration
         }
@@ -0,0 +1,448 @@
+'''
+*
+*  viper_sim.py: Offline F-16C ICP/DED avionics simulator that speaks DCS-BIOS
+*
+*  Copyright (C) 2023 twillis/ilominar
+*
+*  This program is free software: you can redistribute it and/or modify
+*  it under the terms of the GNU General Public License as published by
+*  the Free Software Foundation, either version 3 of the License, or
+*  (at your option) any later version.
+*
+*  This program is distributed in the hope that it will be useful,
+*  but WITHOUT ANY WARRANTY; without even the implied warranty of
+*  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+*  GNU General Public License for more details.
+*
+*  You should have received a copy of the GNU General Public License
+*  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+*
+'''
+
+import json
+import socket
+import sys
+import threading
+
+from time import monotonic, sleep
+
+
+# the simulator stands in for dcs and dcs-bios when testing the viper driver. it accepts the
+# dcs-bios commands the driver sends (by default on udp 7778), runs them against a model of the
+# ICP/DED pages the driver uses (CNI, STPT, T-ILS, LIST/MISC, CMDS, BULLS, HMCS) and the MFD
+# format selection (including the HOTAS DOGFIGHT switch overrides), and publishes the cockpit
+# state as a dcs-bios export stream (by default on udp 7777).
+#
+# the export stream layout is the simulator's own, described by a control reference in the
+# same format as the DCS-BIOS .json control references (see control_ref). every control gets
+# a 16-bit word for its integer output; the DED lines are strings.
+#
+# like dcs-bios, the simulator applies the commands received since the last frame in order once
+# per frame. with is_sampled, the simulator instead samples the state of each control once per
+# frame, so a press that is released within the same frame is never seen. this gives a worst
+# case for testing how short presses can be held.
+
+
+VIPER_SIM_BUTTONS = [ f"ICP_BTN_{num}" for num in range(0, 10) ] + \
+                    [ "ICP_ENTR_BTN", "ICP_RCL_BTN", "ICP_LIST_BTN", "ICP_AA_MODE_BTN",
+                      "ICP_AG_MODE_BTN", "EHSI_MODE" ] + \
+                    [ f"MFD_{lr}_{num}" for lr in ("L", "R") for num in range(1, 21) ]
+
+VIPER_SIM_SWITCHES = [ "ICP_DATA_UP_DN_SW", "ICP_DATA_RTN_SEQ_SW", "ICP_DED_SW", "MFD_L_SYM",
+                       "MFD_R_SYM", "DOGFIGHT_SW" ]
+
+VIPER_SIM_MAINTAINED = [ "DOGFIGHT_SW" ]
+
+VIPER_SIM_DED_LINES = [ f"DED_LINE_{num}" for num in range(1, 6) ]
+
+VIPER_SIM_DED_WIDTH = 29
+
+VIPER_SIM_ADDR_INT = 0x4400
+VIPER_SIM_ADDR_STR = 0x4600
+
+VIPER_SIM_ICP_PAGES = { "1" : "TILS", "4" : "STPT" }
+
+VIPER_SIM_MASTER_MODES = [ "NAV", "AA", "AG", "DGFT" ]
+
+
+# model of the viper avionics the driver interacts with. the model is driven by transitions of
+# the cockpit controls, see press().
+#
+class ViperSimAvionics:
+    def __init__(self):
+        self.page = "CNI"
+        self.field = 0
+        self.scratch = ""
+
+        self.stpt_cur = 1
+        self.stpt_sel = 1
+        self.stpts = dict()
+
+        self.tacan_band = "X"
+        self.tacan_chan = 1
+        self.tacan_mode = "REC"
+
+        self.cmds_sub = "BINGO"
+        self.cmds_prog = 1
+        self.cmds = { "CHAFF" : dict(), "FLARE" : dict() }
+
+        self.bulls = False
+        self.hmcs = { "HUD BLNK" : True, "CKPT BLNK" : True, "DECLUTTER" : 1, "RWR" : True }
+
+        self.master_mode = "NAV"
+        self.dgft = 1
+        self.mfd_menu = None
+        self.mfd_sel = { (mode, lr) : "14" for mode in VIPER_SIM_MASTER_MODES for lr in ("L", "R") }
+        self.mfd_fmts = { (mode, lr, osb) : None for mode in VIPER_SIM_MASTER_MODES
+                                                 for lr in ("L", "R") for osb in ("12", "13", "14") }
+
+        self.num_presses = 0
+
+    # ================ control transitions
+
+    # handle a transition of a control to a new (non-idle) value. buttons transition to 1 when
+    # pressed, switches to 0 (DN/RTN) or 2 (UP/SEQ) when moved off center. maintained switches
+    # (e.g., the DOGFIGHT switch) also transition when moved back to center (1).
+    #
+    def press(self, ident, value):
+        self.num_presses += 1
+        if ident == "ICP_DATA_UP_DN_SW":
+            self.data_up_dn(1 if value == 2 else -1)
+        elif ident == "ICP_DATA_RTN_SEQ_SW" and value == 0:
+            self.page = "CNI"
+            self.field = 0
+            self.scratch = ""
+        elif ident == "ICP_DATA_RTN_SEQ_SW" and value == 2:
+            self.data_seq()
+        elif ident == "ICP_DED_SW":
+            self.ded_up_dn(1 if value == 2 else -1)
+        elif ident.startswith("ICP_BTN_"):
+            self.icp_digit(ident[-1])
+        elif ident == "ICP_ENTR_BTN":
+            self.icp_entr()
+        elif ident == "ICP_LIST_BTN":
+            self.page = "LIST"
+            self.field = 0
+            self.scratch = ""
+        elif ident == "ICP_RCL_BTN":
+            self.icp_rcl()
+        elif ident in ("ICP_AA_MODE_BTN", "ICP_AG_MODE_BTN"):
+            mode = ident[4:6]
+            self.master_mode = "NAV" if self.master_mode == mode else mode
+            self.mfd_menu = None
+        elif ident == "DOGFIGHT_SW":
+            self.dgft = value
+            self.mfd_menu = None
+        elif ident.startswith("MFD_") and ident[4] in ("L", "R") and ident[6:].isdigit():
+            self.mfd_osb(ident[4], ident[6:])
+
+    def fields(self):
+        return { "STPT" : [ "STPT", "MAN", "LAT", "LNG", "ELEV" ],
+                 "TILS" : [ "BAND", "CHAN" ],
+                 "CMDS" : [ "BQ", "BI", "SQ", "SI" ],
+                 "HMCS" : [ "HUD BLNK", "CKPT BLNK", "DECLUTTER", "RWR" ] }.get(self.page, [ None ])
+
+    def data_up_dn(self, delta):
+        self.scratch = ""
+        self.field = (self.field + (-delta)) % len(self.fields())
+
+    def data_seq(self):
+        if self.page == "TILS":
+            modes = [ "REC", "T/R", "A/A TR" ]
+            self.tacan_mode = modes[(modes.index(self.tacan_mode) + 1) % len(modes)]
+        elif self.page == "CMDS":
+            subs = [ "BINGO", "CHAFF", "FLARE", "OTHER1", "OTHER2" ]
+            self.cmds_sub = subs[(subs.index(self.cmds_sub) + 1) % len(subs)]
+
+    def ded_up_dn(self, delta):
+        if self.page == "CNI":
+            self.stpt_cur = ((self.stpt_cur - 1 + delta) % 127) + 1
+        elif self.page == "STPT" and self.field == 0:
+            self.stpt_sel = ((self.stpt_sel - 1 + delta) % 127) + 1
+            self.stpt_cur = self.stpt_sel
+        elif self.page == "CMDS" and self.cmds_sub in ("CHAFF", "FLARE"):
+            self.cmds_prog = ((self.cmds_prog - 1 + delta) % 6) + 1
+
+    def icp_rcl(self):
+        if self.page == "MISC":
+            self.page = "HMCS"
+            self.field = 0
+        else:
+            self.scratch = ""
+
+    def icp_digit(self, digit):
+        field = self.fields()[self.field]
+        if self.page == "CNI":
+            self.page = VIPER_SIM_ICP_PAGES.get(digit, f"CNI_{digit}")
+            self.field = 0
+            if self.page == "STPT":
+                self.stpt_sel = self.stpt_cur
+        elif self.page == "LIST":
+            self.page = { "0" : "MISC", "7" : "CMDS" }.get(digit, f"LIST_{digit}")
+            self.field = 0
+            if self.page == "CMDS":
+                self.cmds_sub = "BINGO"
+        elif self.page == "MISC":
+            self.page = { "8" : "BULLS" }.get(digit, f"MISC_{digit}")
+            self.field = 0
+        elif self.page == "BULLS" and digit == "0":
+            self.bulls = not self.bulls
+        elif self.page == "HMCS" and field == "DECLUTTER" and digit == "1":
+            self.hmcs["DECLUTTER"] = (self.hmcs["DECLUTTER"] % 3) + 1
+        elif self.page == "HMCS" and field != "DECLUTTER" and digit == "0":
+            self.hmcs[field] = not self.hmcs[field]
+            self.field = (self.field + 1) % len(self.fields())
+        else:
+            self.scratch += digit
+
+    def icp_entr(self):
+        field = self.fields()[self.field]
+        scratch = self.scratch
+        self.scratch = ""
+        if scratch == "":
+            return
+        if self.page == "STPT" and field == "STPT":
+            self.stpt_sel = min(max(int(scratch), 1), 127)
+            self.stpt_cur = self.stpt_sel
+        elif self.page == "STPT" and field in ("LAT", "LNG") and scratch[0] in "2846":
+            sign = -1.0 if scratch[0] in "84" else 1.0
+            num_deg = 2 if field == "LAT" else 3
+            digits = scratch[1:]
+            if len(digits) > num_deg:
+                deg = float(digits[:num_deg]) + float(digits[num_deg:]) / 60000.0
+                self.stpts.setdefault(self.stpt_sel, dict())[field] = sign * deg
+        elif self.page == "STPT" and field == "ELEV":
+            elev = -int(scratch[1:] or "0") if len(scratch) > 1 and scratch[0] == "0" else int(scratch)
+            self.stpts.setdefault(self.stpt_sel, dict())["ELEV"] = elev
+        elif self.page == "TILS" and field == "BAND" and scratch == "0":
+            self.tacan_band = "Y" if self.tacan_band == "X" else "X"
+        elif self.page == "TILS" and field == "CHAN":
+            self.tacan_chan = int(scratch)
+        elif self.page == "CMDS" and self.cmds_sub in ("CHAFF", "FLARE"):
+            self.cmds[self.cmds_sub].setdefault(self.cmds_prog, dict())[field] = scratch
+
+    # the MFD formats follow the master mode unless the DOGFIGHT switch overrides it, MSL OVRD
+    # uses the AA formats.
+    #
+    def mfd_mode(self):
+        return { 2 : "DGFT", 0 : "AA" }.get(self.dgft, self.master_mode)
+
+    def mfd_osb(self, lr, osb):
+        mode = self.mfd_mode()
+        if self.mfd_menu is not None and self.mfd_menu[0] == lr:
+            self.mfd_fmts[(mode, lr, self.mfd_menu[1])] = osb
+            self.mfd_menu = None
+        elif osb in ("12", "13", "14"):
+            if self.mfd_sel[(mode, lr)] == osb:
+                self.mfd_menu = (lr, osb)
+            else:
+                self.mfd_sel[(mode, lr)] = osb
+
+    # ================ display
+
+    # return the five lines of the DED for the current page. the active field is marked
+    # with "*" and shows the scratchpad while an entry is in progress.
+    #
+    def ded_lines(self):
+        def fld(name, text):
+            if self.fields()[self.field] == name:
+                return f"*{self.scratch if self.scratch != '' else text}*"
+            return f" {text} "
+
+        if self.page == "STPT":
+            stpt = self.stpts.get(self.stpt_sel, dict())
+            lat = stpt.get("LAT", 0.0)
+            lng = stpt.get("LNG", 0.0)
+            lines = [ f"     STPT {fld('STPT', str(self.stpt_sel))}   {fld('MAN', 'AUTO')}",
+                      f"      LAT {fld('LAT', ('N' if lat >= 0 else 'S') + f'{abs(lat):.5f}')}",
+                      f"      LNG {fld('LNG', ('E' if lng >= 0 else 'W') + f'{abs(lng):.5f}')}",
+                      f"     ELEV {fld('ELEV', str(stpt.get('ELEV', 0)) + 'FT')}",
+                      f"      TOS  00:00:00" ]
+        elif self.page == "TILS":
+            lines = [ f"TCN {self.tacan_mode}      ILS ON",
+                      f"             {fld('BAND', self.tacan_band)}",
+                      f"  CHAN {fld('CHAN', str(self.tacan_chan))}", "", "" ]
+        elif self.page == "CMDS" and self.cmds_sub in ("CHAFF", "FLARE"):
+            prog = self.cmds[self.cmds_sub].get(self.cmds_prog, dict())
+            lines = [ f"    {self.cmds_sub} {self.cmds_prog}",
+                      f"  BQ {fld('BQ', prog.get('BQ', '-'))}",
+                      f"  BI {fld('BI', prog.get('BI', '-'))}",
+                      f"  SQ {fld('SQ', prog.get('SQ', '-'))}",
+                      f"  SI {fld('SI', prog.get('SI', '-'))}" ]
+        elif self.page == "CMDS":
+            lines = [ f"    {self.cmds_sub}", "", "", "", "" ]
+        elif self.page == "BULLS":
+            lines = [ "     BULLSEYE", f"     {'*BULLSEYE*' if self.bulls else ' BULLSEYE '}",
+                      "", "", "" ]
+        elif self.page == "HMCS":
+            lines = [ "    HMCS DISPLAY",
+                      f" HUD BLNK {fld('HUD BLNK', 'ON' if self.hmcs['HUD BLNK'] else 'OFF')}",
+                      f"CKPT BLNK {fld('CKPT BLNK', 'ON' if self.hmcs['CKPT BLNK'] else 'OFF')}",
+                      f"DECLUTTER {fld('DECLUTTER', 'LVL' + str(self.hmcs['DECLUTTER']))}",
+                      f"      RWR {fld('RWR', 'ON' if self.hmcs['RWR'] else 'OFF')}" ]
+        elif self.page == "CNI":
+            lines = [ f"UHF   242.00  STPT  {self.stpt_cur:>3}", "", f"VHF  1     {self.master_mode}", "",
+                      f"M1 3 C 1200  {self.tacan_chan}{self.tacan_band}" ]
+        else:
+            lines = [ f"     {self.page}", "", "", "", "" ]
+        return [ line[:VIPER_SIM_DED_WIDTH].ljust(VIPER_SIM_DED_WIDTH) for line in lines ]
+
+
+# simulator that connects a ViperSimAvionics model to dcs-bios style udp sockets. commands are
+# received on (host, port), the export stream is sent to (exp_host, exp_port). port 0 picks an
+# unused port, see the port attribute after start().
+#
+class ViperSim:
+    def __init__(self, host="127.0.0.1", port=7778, exp_host="127.0.0.1", exp_port=7777, frame_rate=30,
+                 is_sampled=False):
+        self.host, self.port = host, port
+        self.exp_host, self.exp_port = exp_host, exp_port
+        self.frame_rate = frame_rate
+        self.is_sampled = is_sampled
+
+        self.avionics = ViperSimAvionics()
+
+        self.int_controls = VIPER_SIM_BUTTONS + VIPER_SIM_SWITCHES
+        self.ctrl_addr = { ident : VIPER_SIM_ADDR_INT + 2 * i for i, ident in enumerate(self.int_controls) }
+        self.ctrl_state = { ident : 1 if ident in VIPER_SIM_SWITCHES else 0 for ident in self.int_controls }
+        self.str_addr = { ident : VIPER_SIM_ADDR_STR + (VIPER_SIM_DED_WIDTH + 1) * i
+                          for i, ident in enumerate(VIPER_SIM_DED_LINES) }
+
+        self.pending = [ ]
+        self.lock = threading.Lock()
+        self.sock = None
+        self.exp_sock = None
+        self.threads = [ ]
+        self.is_running = False
+        self.mem_sent = None
+        self.num_frames = 0
+
+    # return a control reference for the simulator export stream in the DCS-BIOS .json format.
+    #
+    def control_ref(self):
+        ref = { "ICP" : dict(), "DED" : dict() }
+        for ident in self.int_controls:
+            ref["ICP"][ident] = { "outputs" : [ { "address" : self.ctrl_addr[ident], "mask" : 0xffff,
+                                                  "shift_by" : 0, "type" : "integer" } ] }
+        for ident in VIPER_SIM_DED_LINES:
+            ref["DED"][ident] = { "outputs" : [ { "address" : self.str_addr[ident],
+                                                  "max_length" : VIPER_SIM_DED_WIDTH,
+                                                  "type" : "string" } ] }
+        return ref
+
+    def write_control_ref(self, path):
+        with open(path, "w") as f:
+            json.dump(self.control_ref(), f, indent=2)
+
+    # ================ simulation
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.settimeout(0.25)
+        self.sock.bind((self.host, self.port))
+        self.port = self.sock.getsockname()[1]
+        self.exp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.is_running = True
+        self.threads = [ threading.Thread(target=self.recv_thread_fn, daemon=True),
+                         threading.Thread(target=self.frame_thread_fn, daemon=True) ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.is_running = False
+        for thread in self.threads:
+            thread.join()
+        self.threads = [ ]
+        self.sock.close()
+        self.exp_sock.close()
+
+    def recv_thread_fn(self):
+        while self.is_running:
+            try:
+                data, _ = self.sock.recvfrom(4096)
+            except socket.error:
+                continue
+            with self.lock:
+                for line in data.decode("utf-8", errors="ignore").splitlines():
+                    tokens = line.strip().split(" ")
+                    if len(tokens) == 2 and tokens[0] in self.ctrl_state and tokens[1].isdigit():
+                        self.pending.append((tokens[0], int(tokens[1])))
+
+    def frame_thread_fn(self):
+        t_frame = monotonic()
+        while self.is_running:
+            self.frame()
+            t_frame += 1.0 / self.frame_rate
+            sleep(max(t_frame - monotonic(), 0.0))
+
+    # run one frame of the simulation: apply (or sample) the commands received since the last
+    # frame, run the transitions of controls that changed state, and send the export stream.
+    #
+    def frame(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = [ ]
+            if self.is_sampled:
+                pending = list(dict(pending).items())
+            for ident, value in pending:
+                if self.ctrl_state[ident] != value:
+                    self.ctrl_state[ident] = value
+                    if value != (1 if ident in VIPER_SIM_SWITCHES else 0) or ident in VIPER_SIM_MAINTAINED:
+                        self.avionics.press(ident, value)
+        self.send_export()
+
+    # build the export memory image for the current state.
+    #
+    def export_mem(self):
+        mem = bytearray(VIPER_SIM_ADDR_STR + (VIPER_SIM_DED_WIDTH + 1) * len(VIPER_SIM_DED_LINES) -
+                        VIPER_SIM_ADDR_INT)
+        for ident, addr in self.ctrl_addr.items():
+            value = self.ctrl_state[ident]
+            mem[addr - VIPER_SIM_ADDR_INT] = value & 0xff
+            mem[addr - VIPER_SIM_ADDR_INT + 1] = value >> 8
+        for ident, line in zip(VIPER_SIM_DED_LINES, self.avionics.ded_lines()):
+            addr = self.str_addr[ident] - VIPER_SIM_ADDR_INT
+            mem[addr:addr + VIPER_SIM_DED_WIDTH] = line.encode("ascii", errors="replace")
+        return mem
+
+    # send the export stream for a frame. frames carry the words that changed since the last
+    # frame, with the entire image resent once a second.
+    #
+    def send_export(self):
+        mem = self.export_mem()
+        is_full = self.mem_sent is None or (self.num_frames % self.frame_rate) == 0
+        frame = bytearray(b"\x55\x55\x55\x55")
+        i = 0
+        while i < len(mem):
+            j = i
+            while j < len(mem) and (is_full or mem[j:j+2] != self.mem_sent[j:j+2]):
+                j += 2
+            if j > i:
+                addr = VIPER_SIM_ADDR_INT + i
+                frame += bytes([ addr & 0xff, addr >> 8, (j - i) & 0xff, (j - i) >> 8 ]) + mem[i:j]
+                i = j
+            else:
+                i += 2
+        self.mem_sent = mem
+        self.num_frames += 1
+        if self.exp_sock is not None:
+            try:
+                self.exp_sock.sendto(frame, (self.exp_host, self.exp_port))
+            except socket.error:
+                pass
+
+
+# run the simulator from the command line: python -m src.viper_sim [ <control_ref_path> ].
+# if a path is given, the control reference for the export stream is written there.
+#
+if __name__ == "__main__":
+    sim = ViperSim()
+    if len(sys.argv) > 1:
+        sim.write_control_ref(sys.argv[1])
+    sim.start()
+    print(f"Viper simulator listening on {sim.host}:{sim.port}, exporting to {sim.exp_host}:{sim.exp_port}")
+    try:
+        while True:
+            sleep(1.0)
+    except KeyboardInterrupt:
+        sim.stop()
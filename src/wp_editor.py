@@ -26,6 +26,7 @@ from src.db import DatabaseInterface
 from src.db_objects import default_bases
 from src.drivers import HornetDriver, HarrierDriver, MirageDriver, TomcatDriver, DriverException
 from src.drivers import WarthogDriver, ViperDriver
+from src.driver_cal import DriverCalibrator
 from src.logger import get_logger
 
 
@@ -34,7 +35,7 @@ class WaypointEditor:
     def __init__(self, prefs):
         self.logger = get_logger("drivers")
         self.prefs = prefs
-        self.db = DatabaseInterface(self.prefs.path_profile_db)
+        self.db = DatabaseInterface(self.prefs.path_profile_db, self.prefs.db_storage)
         self.default_bases = default_bases
         self.drivers = dict(hornet=HornetDriver(self.logger, self.prefs),
                             harrier=HarrierDriver(self.logger, self.prefs),
@@ -44,20 +45,106 @@ class WaypointEditor:
                             viper=ViperDriver(self.logger, self.prefs))
         self.driver = self.drivers["viper"]
 
+        # snapshots of the state of the jet after the last successful load, keyed by the tuple
+        # ( <airframe>, <host>, <port> ). see Driver.snapshot.
+        #
+        self.loaded = dict()
+
     def set_driver(self, driver_name):
         try:
             self.driver = self.drivers[driver_name]
         except KeyError:
             raise DriverException(f"Undefined driver: {driver_name}")
 
-    def enter_all(self, profile, command_q=None, progress_q=None):
+    # build the command plan the current driver would send to enter a profile, nothing is sent
+    # to dcs-bios.
+    #
+    def build_plan(self, profile):
+        return self.driver.build_plan(profile)
+
+    # estimate the time (in seconds) it will take the current driver to enter a profile into
+    # the jet. with pacing on the export stream, this is an upper bound. the plan is built
+    # without logging.
+    #
+    def estimate(self, profile):
+        return self.driver.build_plan(profile, baseline=self.baseline(profile), is_quiet=True).duration
+
+    def loaded_key(self, profile, endpoint=None):
+        if endpoint is None:
+            endpoint = (self.driver.host, self.driver.port)
+        return (profile.aircraft, endpoint[0], endpoint[1])
+
+    # return the snapshot of the jet at an endpoint (the driver's endpoint if None) from the
+    # last load to use as the baseline for delta loading a profile, None if there is no
+    # baseline or delta loading is off.
+    #
+    def baseline(self, profile, endpoint=None):
+        if not self.prefs.is_delta_load_bool:
+            return None
+        return self.loaded.get(self.loaded_key(profile, endpoint))
+
+    # return the ( <host>, <port> ) endpoints to load to: the driver's endpoint followed by
+    # any additional endpoints from the preferences.
+    #
+    def endpoints(self):
+        endpoints = [ (self.driver.host, self.driver.port) ]
+        for endpoint in self.prefs.dcs_bios_endpoints_list:
+            if endpoint not in endpoints:
+                endpoints.append(endpoint)
+        return endpoints
+
+    # forget the state of the jet from previous loads so that the next load enters the full
+    # profile (e.g., after a respawn).
+    #
+    def forget_loaded(self):
+        self.loaded = dict()
+
+    # enter a profile into the jets at a list of ( <host>, <port> ) endpoints, see endpoints()
+    # if None. with more than one endpoint, the jets are loaded in parallel. when delta
+    # loading, only what changed since the last load is entered. a failed or cancelled load
+    # leaves the jet in an unknown state, so the snapshot from the last load is dropped.
+    # returns True if the profile was entered at all endpoints.
+    #
+    def enter_all(self, profile, command_q=None, progress_q=None, endpoints=None):
         self.logger.info(f"Entering waypoints for aircraft: {profile.aircraft}")
-        self.driver.enter_all(profile, command_q=command_q, progress_q=progress_q)
+        endpoints = self.endpoints() if endpoints is None else endpoints
+        baselines = { endpoint : self.baseline(profile, endpoint) for endpoint in endpoints }
+        for endpoint in endpoints:
+            self.loaded.pop(self.loaded_key(profile, endpoint), None)
+        if endpoints == [ (self.driver.host, self.driver.port) ]:
+            is_entered = self.driver.enter_all(profile, command_q=command_q, progress_q=progress_q,
+                                               baseline=baselines[endpoints[0]])
+            results = { endpoints[0] : is_entered }
+        else:
+            results = self.driver.enter_all_endpoints(profile, endpoints, command_q=command_q,
+                                                      progress_q=progress_q, baselines=baselines)
+        for endpoint, is_entered in results.items():
+            snapshot = self.driver.snapshot(profile, baselines[endpoint]) if is_entered else None
+            if snapshot is not None:
+                self.loaded[self.loaded_key(profile, endpoint)] = snapshot
+        return all(results.values())
+
+    # calibrate the button delays for the current driver and save them to the preferences.
+    # see gui_backgrounded_operation() in gui_util.py for details on the queues.
+    #
+    def calibrate(self, command_q=None, progress_q=None):
+        self.logger.info(f"Calibrating button delays for aircraft: {self.driver.airframe}")
+        try:
+            results = DriverCalibrator(self.driver).run(command_q=command_q, progress_q=progress_q)
+        except Exception as e:
+            self.logger.debug(f"Exception raised: {e}")
+            return
+        for ctrl_class, delays in results.items():
+            self.prefs.set_dcs_btn_cal_delays(self.driver.airframe, ctrl_class, delays[0], delays[1])
+        if len(results) > 0:
+            self.prefs.persist_prefs()
 
     def reset_db(self):
         self.db.close()
-        os.remove(self.prefs.path_profile_db)
-        self.db = DatabaseInterface(self.prefs.path_profile_db)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.prefs.path_profile_db + suffix):
+                os.remove(self.prefs.path_profile_db + suffix)
+        self.db = DatabaseInterface(self.prefs.path_profile_db, self.prefs.db_storage)
 
     def stop(self):
         self.db.close()
@@ -47,7 +47,9 @@ from src.comp_dcs_we import dcs_we_is_current, dcs_we_vers_install, dcs_we_vers_
 from src.db_models import ProfileModel, AvionicsSetupModel
 from src.dcs_button_hook import dcs_exp_parse_thread
 from src.dcs_f10_capture import dcs_f10_capture_map_coords, dcs_f10_parse_map_coords_string
+from src.drivers import DriverException
 from src.gui_util import gui_update_request, gui_backgrounded_operation, gui_verify_dcs_running
+from src.gui_util import gui_format_eta
 from src.gui_util import gui_select_from_list, gui_text_strike, gui_text_unstrike
 from src.gui_util import gui_is_dcs_foreground, airframe_list, airframe_type_to_ui_text, airframe_ui_text_to_type
 from src.logger import get_logger
@@ -95,6 +97,8 @@ class WaypointEditorGUI:
         self.values = None
         self.selected_wp_type = "WP"
         self.selected_profile = None
+        self.load_est = ""
+        self.load_est_key = None
 
         self.tts_voice = wincom.Dispatch("SAPI.SpVoice")
 
@@ -135,7 +139,7 @@ class WaypointEditorGUI:
             self.profile.av_setup_name = self.editor.prefs.av_setup_default
         else:
             self.profile = Profile.load(name)
-        if (self.profile.av_setup_name not in AvionicsSetupModel.list_all_names() and
+        if (not AvionicsSetupModel.name_index.contains(self.profile.av_setup_name) and
             self.profile.av_setup_name != "DCS Default"):
             self.profile.av_setup_name = "DCS Default"
         self.is_profile_dirty = False
@@ -184,7 +188,7 @@ class WaypointEditorGUI:
                 profile.av_setup_name = self.editor.prefs.av_setup_default
         else:
             profile = Profile.from_json_string(str)
-            if (profile.av_setup_name not in AvionicsSetupModel.list_all_names() and
+            if (not AvionicsSetupModel.name_index.contains(profile.av_setup_name) and
                 profile.av_setup_name != "DCS Default" and
                 self.editor.prefs.is_av_setup_for_unk_bool):
                 profile.av_setup_name = self.editor.prefs.av_setup_default
@@ -303,7 +307,9 @@ class WaypointEditorGUI:
                                    PyGUI.Combo(values=airframe_list(), default_value=arfm_ui_text,
                                                readonly=True, enable_events=True,
                                                key='ux_prof_afrm_select', size=(37,1))],
-                                  [PyGUI.Text("Waypoints in Profile:")],
+                                  [PyGUI.Text("Waypoints in Profile:", size=(24,1)),
+                                   PyGUI.Text("", key='ux_prof_load_est', size=(21,1),
+                                              justification="right")],
                                   [PyGUI.Listbox(values=list(), size=(48,14),
                                                  select_mode=PyGUI.LISTBOX_SELECT_MODE_BROWSE,
                                                  enable_events=True, key='ux_prof_wypt_list')],
@@ -583,9 +589,15 @@ class WaypointEditorGUI:
     # HACK: visual artifacts on updates.
     #
     def update_gui_menu_enable_state(self):
-        self.tk_menu_dcswe.delete(0, 4)
+        self.tk_menu_dcswe.delete(0, 7)
         self.tk_menu_dcswe.add_command(label='Preferences...', command=self.menu_preferences)
         self.tk_menu_dcswe.add('separator')
+        is_cal_enabled = self.dcs_bios_version is not None and self.editor.driver.is_cal_supported
+        self.tk_menu_dcswe.add_command(label='Calibrate Button Delays...', command=self.menu_calibrate,
+                                       state=('normal' if is_cal_enabled else 'disabled'))
+        self.tk_menu_dcswe.add_command(label='Forget Loaded Jet State', command=self.menu_forget_loaded,
+                                       state=('normal' if len(self.editor.loaded) > 0 else 'disabled'))
+        self.tk_menu_dcswe.add('separator')
         self.tk_menu_dcswe.add_command(label='Check for Updates...', command=self.menu_check_updates)
         self.tk_menu_dcswe.add('separator')
         self.tk_menu_dcswe.add_command(label='Quit', command=self.menu_quit)
@@ -646,6 +658,23 @@ class WaypointEditorGUI:
         self.tk_menu_mission.add_command(label="Load Mission File into Jet",
                                          command=self.menu_mission_load_jet, state=mission_norm)
 
+    # return the text for the load time estimate of the current profile. building the plan for
+    # the estimate is too costly for every gui update, so the estimate is only redone when the
+    # profile, its avionics setup (which is replaced in the cache when edited), the driver, or
+    # the state of the jet from the last load changes.
+    #
+    def estimate_load_time(self):
+        key = (str(self.profile), self.profile.av_setup, self.editor.driver,
+               self.editor.baseline(self.profile))
+        if key != self.load_est_key:
+            self.load_est_key = key
+            try:
+                self.load_est = f"Load time about {gui_format_eta(self.editor.estimate(self.profile))}"
+            except (DriverException, ValueError, IndexError, KeyError, TypeError) as e:
+                self.logger.debug(f"Unable to estimate load time: {e}")
+                self.load_est = ""
+        return self.load_est
+
     # update gui state for control enables based on current internal state.
     #
     def update_gui_control_enable_state(self):
@@ -661,11 +690,13 @@ class WaypointEditorGUI:
 
         if self.profile.has_waypoints or (self.profile.av_setup_name is not None and
                                           self.profile.av_setup_name != "DCS Default"):
+            self.window['ux_prof_load_est'].update(self.estimate_load_time())
             if self.dcs_bios_version is not None:
                 self.window['ux_prof_enter'].update(disabled=False)
             else:
                 self.window['ux_prof_enter'].update(disabled=True)
         else:
+            self.window['ux_prof_load_est'].update("")
             self.window['ux_prof_enter'].update(disabled=True)
 
         posn, elev, _ = self.validate_coords()
@@ -742,7 +773,7 @@ class WaypointEditorGUI:
             blank = ""
         name = PyGUI.PopupGetText(f"New Profile Name{blank}", title=title, default_text=default_name)
         if name is not None and len(name) > 0:
-            if len([obj for obj in ProfileModel.list_all() if obj.name == name]) != 0:
+            if ProfileModel.name_index.contains(name):
                 result = PyGUI.PopupOKCancel(f"There is already a profile named '{name}' in the " +
                                              f"profile database. Replace it?",
                                              title="Profile Exists")
@@ -765,6 +796,12 @@ class WaypointEditorGUI:
     def menu_preferences(self):
         self.menu_pend_q.put(self.do_menu_preferences)
 
+    def menu_calibrate(self):
+        self.menu_pend_q.put(self.do_menu_calibrate)
+
+    def menu_forget_loaded(self):
+        self.menu_pend_q.put(self.do_menu_forget_loaded)
+
     def menu_check_updates(self):
         self.menu_pend_q.put(self.do_menu_check_updates)
     
@@ -847,6 +884,25 @@ class WaypointEditorGUI:
 
         self.update_gui_enable_state()
     
+    def do_menu_calibrate(self):
+        if gui_verify_dcs_running("Unable to calibrate button delays. ") and \
+           self.dcs_bios_version is not None and self.editor.driver.is_cal_supported:
+            airframe = self.window['ux_prof_afrm_select'].get()
+            if PyGUI.PopupOKCancel(f"Calibration will press buttons in the {airframe} cockpit. The" +
+                                   " jet should be powered up with the avionics on their default" +
+                                   " pages. Continue?", title="Calibrate Button Delays?") == "OK":
+                gui_backgrounded_operation(f"Calibrating Button Delays for {airframe}...",
+                                           bop_fn=self.editor.calibrate, bop_args=())
+        else:
+            winsound.PlaySound(UX_SND_ERROR, flags=winsound.SND_FILENAME)
+
+    # the next load after forgetting enters the full profile, use after a respawn or when the
+    # jet has been changed by hand since the last load.
+    #
+    def do_menu_forget_loaded(self):
+        self.editor.forget_loaded()
+        self.update_gui_enable_state()
+
     def do_menu_check_updates(self):
         path_dcs = self.editor.prefs.path_dcs
         is_db_current = dcs_bios_is_current(path_dcs)
@@ -1018,7 +1074,7 @@ class WaypointEditorGUI:
             mpack_name, _ = os.path.splitext(mpack_path)
             mpack_name = ((os.path.split(mpack_name))[1]).replace(" ", "-")
 
-            if mpack_name in ProfileModel.list_all_names() and \
+            if ProfileModel.name_index.contains(mpack_name) and \
                PyGUI.PopupOKCancel(f"There is already a profile named '{mpack_name}'. Replace it?",
                                    title="Duplicate Profile Name") == "Cancel":
                 return
@@ -1418,24 +1474,22 @@ class WaypointEditorGUI:
             self.hkey_clear_pendings()
 
     def do_hk_item_sel_advance(self):
+        # "DCS Default" and the empty profile come before the templates and profiles in the
+        # database, in name order.
+        #
         if self.is_pa_tgt_avionics:
-            av_tmplts = [ "DCS Default" ] + AvionicsSetupModel.list_all_names()
-            new_index = av_tmplts.index(self.profile.av_setup_name) + 1
-            if new_index >= len(av_tmplts):
-                new_index = 0
-            new_name = av_tmplts[new_index]
+            cur_name = self.profile.av_setup_name
+            if cur_name == "DCS Default":
+                cur_name = ""
+            new_name = AvionicsSetupModel.name_index.name_after(cur_name or "") or "DCS Default"
             self.values['ux_prof_av_setup_combo'] = new_name
             self.do_profile_av_setup_select()
 
         else:
-            profiles = [ "" ] + ProfileModel.list_all_names()
-            new_index = profiles.index(self.profile.profilename) + 1
-            if new_index >= len(profiles):
-                new_index = 0
+            new_name = ProfileModel.name_index.name_after(self.profile.profilename or "")
+            self.values['ux_prof_select'] = new_name or ""
+            if new_name is None:
                 new_name = "Empty Profile"
-            else:
-                new_name = profiles[new_index]
-            self.values['ux_prof_select'] = profiles[new_index]
             self.do_profile_select(True)
 
         self.logger.info(f"Setting profile/avionics to {new_name}")
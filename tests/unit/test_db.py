@@ -0,0 +1,100 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+
+from src.db import DB_OPTIMIZE_SAVES, DB_VERSION, DatabaseInterface
+from src.db_models import ProfileModel, db
+from src.db_objects import Profile
+
+
+class TestDatabaseInterface(unittest.TestCase):
+    def setUp(self) -> None:
+        self.path = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.path.name, "profiles.db")
+
+    def tearDown(self) -> None:
+        DatabaseInterface.close()
+        self.path.cleanup()
+
+    def test_new(self):
+        dbi = DatabaseInterface(self.db_name)
+        self.assertEqual(dbi.db_version, DB_VERSION)
+        self.assertEqual(db.pragma('user_version'), DB_VERSION)
+        dbi.close()
+        self.assertEqual(DatabaseInterface(self.db_name).db_version, DB_VERSION)
+
+    def test_legacy(self):
+        # v1 schema, from before the version was kept in user_version.
+        conn = sqlite3.connect(self.db_name)
+        conn.executescript("""
+            CREATE TABLE profilemodel (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, aircraft VARCHAR(255) NOT NULL);
+            CREATE UNIQUE INDEX profilemodel_name ON profilemodel (name);
+            CREATE TABLE sequencemodel (id INTEGER PRIMARY KEY, identifier INTEGER NOT NULL, profile_id INTEGER NOT NULL);
+            CREATE TABLE waypointmodel (id INTEGER PRIMARY KEY, name VARCHAR(255), latitude REAL NOT NULL,
+                                        longitude REAL NOT NULL, elevation INTEGER NOT NULL, profile_id INTEGER NOT NULL,
+                                        sequence_id INTEGER, wp_type VARCHAR(255) NOT NULL, station INTEGER NOT NULL);
+            INSERT INTO profilemodel (name, aircraft) VALUES ('old', 'viper');
+            INSERT INTO waypointmodel (name, latitude, longitude, elevation, profile_id, wp_type, station)
+                VALUES ('WP1', 36.5, -115.5, 1000, 1, 'WP', 0);
+        """)
+        conn.close()
+
+        dbi = DatabaseInterface(self.db_name)
+        self.assertEqual(dbi.db_version, DB_VERSION)
+        self.assertIn('f16_cmds_setup_opt', [ column.name for column in db.get_columns('AvionicsSetupModel') ])
+        profile = Profile.load("old")
+        self.assertEqual(len(profile.waypoints), 1)
+        self.assertEqual(profile.waypoints[0].elevation, 1000)
+        self.assertFalse(profile.waypoints[0].is_set_cur)
+
+    def test_storage(self):
+        dbi = DatabaseInterface(self.db_name, "fast")
+        self.assertEqual(db.pragma('journal_mode'), "wal")
+        self.assertEqual(db.pragma('synchronous'), 1)
+        dbi.close()
+        dbi = DatabaseInterface(self.db_name, "safe")
+        self.assertEqual(db.pragma('journal_mode'), "delete")
+        self.assertEqual(db.pragma('synchronous'), 2)
+
+    def test_name_index(self):
+        DatabaseInterface(self.db_name)
+        for name in [ "charlie", "alpha", "delta" ]:
+            ProfileModel.create(name=name, aircraft="viper")
+        index = ProfileModel.name_index
+        self.assertEqual(ProfileModel.list_all_names(), [ "alpha", "charlie", "delta" ])
+        self.assertEqual(index.name_after(""), "alpha")
+        self.assertEqual(index.name_after("bravo"), "charlie")
+        self.assertEqual(index.name_before("charlie"), "alpha")
+        self.assertIsNone(index.name_after("delta"))
+
+        ProfileModel.create(name="bravo", aircraft="viper")
+        profile = ProfileModel.get(ProfileModel.name == "delta")
+        profile.name = "echo"
+        profile.save()
+        ProfileModel.get(ProfileModel.name == "alpha").delete_instance()
+        self.assertEqual(ProfileModel.list_all_names(), [ "bravo", "charlie", "echo" ])
+
+        profile = ProfileModel.create(name="foxtrot", aircraft="viper")
+        profile.name = "golf"
+        profile.save()
+        profile.aircraft = "hornet"
+        profile.save()
+        self.assertEqual(ProfileModel.list_all_names(), [ "bravo", "charlie", "echo", "golf" ])
+        profile.delete_instance()
+        self.assertEqual(ProfileModel.list_all_names(), [ "bravo", "charlie", "echo" ])
+        index.invalidate()
+        self.assertEqual(ProfileModel.list_all_names(), [ "bravo", "charlie", "echo" ])
+        self.assertFalse(index.contains(None))
+
+    def test_optimize_schedule(self):
+        DatabaseInterface(self.db_name)
+        for i in range(DB_OPTIMIZE_SAVES - 1):
+            ProfileModel.create(name=f"profile {i}", aircraft="viper")
+        self.assertEqual(DatabaseInterface.num_saves, DB_OPTIMIZE_SAVES - 1)
+        ProfileModel.create(name="last", aircraft="viper")
+        self.assertEqual(DatabaseInterface.num_saves, 0)
+
+        DatabaseInterface.t_optimized -= 60 * 60
+        ProfileModel.create(name="later", aircraft="viper")
+        self.assertEqual(DatabaseInterface.num_saves, 0)
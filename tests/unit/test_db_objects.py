@@ -0,0 +1,93 @@
+import unittest
+import os
+import tempfile
+
+from LatLon23 import LatLon, Longitude, Latitude
+
+from src.db import DatabaseInterface
+from src.db_models import AvionicsSetupModel, SequenceModel, WaypointModel
+from src.db_objects import MSN, Profile, Waypoint, av_setup_cache, profile_cache
+
+
+def make_waypoints(num_wps, sequence=0):
+    return [ Waypoint(LatLon(Latitude(36.0 + i * 0.01), Longitude(-115.0 - i * 0.01)), elevation=100 * i,
+                      name=f"WP{i}", sequence=sequence) for i in range(num_wps) ]
+
+
+class TestProfileSave(unittest.TestCase):
+    def setUp(self) -> None:
+        self.path = tempfile.TemporaryDirectory()
+        self.db = DatabaseInterface(os.path.join(self.path.name, "profiles.db"))
+
+    def tearDown(self) -> None:
+        self.db.close()
+        self.path.cleanup()
+
+    def check_round_trip(self, profile):
+        loaded = Profile.load(profile.profilename)
+        self.assertEqual(loaded.to_dict(), profile.to_dict())
+
+    def test_save_load(self):
+        msn = MSN(LatLon(Latitude(35.5), Longitude(-114.5)), elevation=50, name="TGT", station=2)
+        profile = Profile("test", waypoints=make_waypoints(10, sequence=1) + [ msn ], aircraft="hornet")
+        profile.save()
+        self.check_round_trip(profile)
+        self.assertEqual(SequenceModel.select().count(), 1)
+
+    def test_save_diff(self):
+        profile = Profile("test", waypoints=make_waypoints(20, sequence=1), aircraft="viper")
+        profile.save()
+        ids = [ wp.id for wp in WaypointModel.select().order_by(WaypointModel.id) ]
+
+        profile.waypoints[3].elevation = 9999
+        profile.waypoints[3].sequence = 2
+        profile.waypoints = profile.waypoints[:15]
+        profile.save()
+        self.check_round_trip(profile)
+        self.assertEqual([ wp.id for wp in WaypointModel.select().order_by(WaypointModel.id) ], ids[:15])
+        self.assertEqual(SequenceModel.select().count(), 2)
+
+        profile.waypoints = make_waypoints(25)
+        profile.update_waypoint_numbers()
+        profile.save()
+        self.check_round_trip(profile)
+        self.assertEqual(WaypointModel.select().count(), 25)
+        self.assertEqual(SequenceModel.select().count(), 0)
+
+    def test_cache(self):
+        for i in range(3):
+            Profile(f"test {i}", waypoints=make_waypoints(5), aircraft="viper").save()
+        for i in range(3):
+            Profile.load(f"test {i}")
+        hits, misses = profile_cache.hits, profile_cache.misses
+        profile = Profile.load("test 1")
+        self.assertEqual((profile_cache.hits, profile_cache.misses), (hits + 1, misses))
+
+        profile.waypoints[0].elevation = 9999
+        self.assertEqual(Profile.load("test 1").waypoints[0].elevation, 0)
+        profile.save()
+        self.assertEqual(Profile.load("test 1").waypoints[0].elevation, 9999)
+        self.assertEqual(profile_cache.misses, misses + 1)
+
+        Profile.delete("test 2")
+        with self.assertRaises(Exception):
+            Profile.load("test 2")
+
+    def test_av_setup_cache(self):
+        model = AvionicsSetupModel.create(name="setup", tacan_yard="38,Y,L")
+        profile = Profile("test", aircraft="viper", av_setup_name="setup")
+        setup = profile.av_setup
+        self.assertIs(profile.av_setup, setup)
+        self.assertEqual(setup.to_dict()['tacan_yard'], "38,Y,L")
+        self.assertEqual(setup.to_dict()['f16_mfd_setup_nav_dflt'], "20,9,8,6,7,1")
+        self.assertEqual(setup.avs_parsed['f16_mfd_setup_nav_dflt'], ("20", "9", "8", "6", "7", "1"))
+        self.assertEqual(setup.avs_parsed['f16_cmds_setup_p6_dflt'], (("1", "0.020", "1", "0.50"),) * 2)
+        self.assertEqual(Profile("test", aircraft="viper").av_setup.to_dict(), dict())
+
+        setup.to_dict()['tacan_yard'] = "1,X,L"
+        self.assertEqual(profile.av_setup.to_dict()['tacan_yard'], "38,Y,L")
+
+        model.tacan_yard = "12,X,W"
+        model.save()
+        av_setup_cache.invalidate("setup")
+        self.assertEqual(profile.av_setup.to_dict()['tacan_yard'], "12,X,W")
@@ -1,19 +1,317 @@
 import unittest
 import logging
 import configparser
+import os
+import queue
+import threading
+import time
 import src.drivers as drivers
 
+from types import SimpleNamespace
+from LatLon23 import LatLon, Longitude, Latitude
+
+from src.dcs_bios_export import DcsBiosAckPacer, DcsBiosExportState
+from src.driver_bench import DriverBenchSink, DriverBenchSleepExecutor, bench_error_stats, bench_presses
+from src.db_objects import Profile, Waypoint
+
 logger = logging.getLogger()
 config = configparser.ConfigParser()
-config.read("../fixtures/settings.ini")
+config.read(os.path.join(os.path.dirname(__file__), "../fixtures/settings.ini"))
+
+prefs = SimpleNamespace(dcs_btn_rel_delay_short=config["PREFERENCES"]["button_release_short_delay"],
+                        dcs_btn_rel_delay_medium=config["PREFERENCES"]["button_release_medium_delay"],
+                        is_btn_ack_pacing_bool=False, is_disable_export_bool=True,
+                        dcs_btn_cal_delays_map=dict(),
+                        is_trace_record_bool=False)
+
+
+def make_profile(num_wps, aircraft="viper"):
+    wps = [ Waypoint(LatLon(Latitude(36.0 + i * 0.01), Longitude(-115.0 - i * 0.01)), elevation=1000 * i,
+                     name=f"WP{i}") for i in range(num_wps) ]
+    return Profile("test", waypoints=wps, aircraft=aircraft)
 
 
 class TestBaseDriver(unittest.TestCase):
     def setUp(self) -> None:
-        self.driver = drivers.Driver(logger, config)
+        self.driver = drivers.Driver(logger, prefs)
 
     def test_send(self):
         self.assertTrue(self.driver.press_with_delay("UFC_1"))
 
     def test_send_raw(self):
         self.assertTrue(self.driver.press_with_delay("RIO_CAP_CATRGORY 3"))
+
+
+class TestDriverPlan(unittest.TestCase):
+    def setUp(self) -> None:
+        self.driver = drivers.ViperDriver(logger, prefs)
+
+    def tearDown(self) -> None:
+        self.driver.stop()
+
+    def test_build_plan_sends_nothing(self):
+        sent = [ ]
+        self.driver.executor.send = lambda cmds: sent.extend(cmds)
+        plan = self.driver.build_plan(make_profile(3))
+        self.assertEqual(sent, [ ])
+        self.assertIsNone(self.driver.plan)
+        self.assertEqual(plan.num_steps, 3)
+        self.assertGreater(plan.num_presses, 3 * 20)
+
+    def test_build_plan_quiet(self):
+        with self.assertLogs(logger, level="DEBUG") as logs:
+            self.driver.build_plan(make_profile(2), is_quiet=True)
+            logger.info("built")
+        self.assertEqual(logs.output, [ "INFO:root:built" ])
+        self.assertEqual(logger.filters, [ ])
+
+    def test_stpt_direct(self):
+        profile = make_profile(30)
+        profile.waypoints[1].is_set_cur = True
+        plan = self.driver.build_plan(profile)
+        presses = [ cmd.press[0] for cmd in plan if cmd.op == "PRESS" ]
+        self.assertEqual(presses[-3:], [ "ICP_BTN_2 1", "ICP_ENTR_BTN 1", "ICP_DATA_RTN_SEQ_SW 0" ])
+        self.driver.plan = drivers.DriverPlan()
+        self.driver.stpt_step(3, 5)
+        self.driver.stpt_step(5, 4)
+        self.assertEqual([ cmd.press[0] for cmd in self.driver.plan ], [ "ICP_DED_SW 2" ] * 2 + [ "ICP_DED_SW 0" ])
+        self.driver.plan = None
+
+    def test_plan_timeline(self):
+        plan = self.driver.build_plan(make_profile(2))
+        timeline = plan.timeline()
+        self.assertEqual(timeline[0][0], 0.0)
+        self.assertTrue(all(a[0] <= b[0] for a, b in zip(timeline, timeline[1:])))
+        self.assertAlmostEqual(timeline[-1][0] + timeline[-1][1].duration, plan.duration)
+
+    def test_plan_scales(self):
+        plan = self.driver.build_plan(make_profile(127))
+        self.assertEqual(plan.num_steps, 127)
+        self.assertEqual(plan.num_presses, len([ cmd for cmd in plan if cmd.op == "PRESS" ]))
+
+    def test_run_plan(self):
+        sent = [ ]
+        self.driver.executor.send = lambda cmds: sent.extend(cmds) or True
+        plan = drivers.DriverPlan([ drivers.DriverCmd("PRESS", press=("ICP_BTN_1 1",), release=("ICP_BTN_1 0",),
+                                                      hold=0.01, after=0.02),
+                                    drivers.DriverCmd("STEP"),
+                                    drivers.DriverCmd("WAIT", after=0.09) ])
+        progress_q = queue.Queue()
+        self.driver.executor.run(plan, progress_q=progress_q)
+        self.assertEqual(sent, [ "ICP_BTN_1 1", "ICP_BTN_1 0" ])
+        progress = list(progress_q.queue)
+        self.assertEqual([ prog[0] for prog in progress[:-1] ], [ 25.0, 100.0, 100.0 ])
+        self.assertAlmostEqual(progress[0][1], 0.09, delta=0.05)
+        self.assertEqual(progress[-1], "DONE")
+
+    def test_run_plan_payloads(self):
+        sent = [ ]
+        self.driver.s = SimpleNamespace(sendto=lambda payload, dest: sent.append(payload) or len(payload),
+                                        close=lambda: None)
+        self.driver.icp_data("DN")
+        self.assertEqual(sent, [ b"ICP_DATA_UP_DN_SW 0\n", b"ICP_DATA_UP_DN_SW 1\n" ])
+        self.assertIn("ICP_DATA_UP_DN_SW 1", self.driver.executor.payloads)
+
+    def test_run_plan_coalesce(self):
+        sent = [ ]
+        self.driver.s = SimpleNamespace(sendto=lambda payload, dest: sent.append(payload) or len(payload),
+                                        close=lambda: None)
+        plan = drivers.DriverPlan([ drivers.DriverCmd("PRESS", press=("ICP_DED_SW 2",), release=("ICP_DED_SW 1",),
+                                                      hold=0.01),
+                                    drivers.DriverCmd("PRESS", press=("ICP_DATA_UP_DN_SW 0",),
+                                                      release=("ICP_DATA_UP_DN_SW 1",), hold=0.01),
+                                    drivers.DriverCmd("PRESS", press=("ICP_DED_SW 2",), release=("ICP_DED_SW 1",),
+                                                      hold=0.01),
+                                    drivers.DriverCmd("PRESS", press=("ICP_DED_SW 2",), release=("ICP_DED_SW 1",),
+                                                      hold=0.01, after=0.01) ])
+        self.driver.executor.run(plan)
+        self.assertEqual(sent, [ b"ICP_DED_SW 2\n", b"ICP_DED_SW 1\nICP_DATA_UP_DN_SW 0\n",
+                                 b"ICP_DATA_UP_DN_SW 1\nICP_DED_SW 2\n", b"ICP_DED_SW 1\n",
+                                 b"ICP_DED_SW 2\n", b"ICP_DED_SW 1\n" ])
+        self.assertTrue(all([ type(key) == str for key in self.driver.executor.payloads ]))
+        self.assertIn(("ICP_DED_SW 1", "ICP_DATA_UP_DN_SW 0"), self.driver.executor.datagram_cache)
+        self.driver.executor.run(drivers.DriverPlan(plan.cmds[:1]))
+        self.assertNotIn(("ICP_DED_SW 1", "ICP_DATA_UP_DN_SW 0"), self.driver.executor.datagram_cache)
+
+    def test_run_plan_cancel(self):
+        command_q = queue.Queue()
+        command_q.put("CANCEL")
+        plan = drivers.DriverPlan([ drivers.DriverCmd("STEP") ])
+        with self.assertRaises(Exception):
+            self.driver.executor.run(plan, command_q=command_q)
+
+    def test_run_plan_cancel_press(self):
+        sent = [ ]
+        command_q = queue.Queue()
+        plan = drivers.DriverPlan([ drivers.DriverCmd("SEND", press=("ICP_BTN_1 1",), after=0.01),
+                                    drivers.DriverCmd("SEND", press=("ICP_BTN_2 1",), after=0.01) ])
+        self.driver.executor.send = lambda cmds: sent.extend(cmds) or command_q.put("CANCEL") or True
+        with self.assertRaises(Exception):
+            self.driver.executor.run(plan, command_q=command_q)
+        self.assertEqual(sent, [ "ICP_BTN_1 1" ])
+
+    def test_run_plan_spans(self):
+        self.driver.executor.send = lambda cmds: True
+        plan = drivers.DriverPlan([ drivers.DriverCmd("PHASE", key="tacan"),
+                                    drivers.DriverCmd("SEND", press=("ICP_BTN_1 1",), after=0.02),
+                                    drivers.DriverCmd("SEND", press=("ICP_BTN_2 1",), after=0.02),
+                                    drivers.DriverCmd("PHASE", key="bulls"),
+                                    drivers.DriverCmd("PHASE", key="jhmcs"),
+                                    drivers.DriverCmd("WAIT", after=0.05) ])
+        self.driver.executor.run(plan)
+        spans = self.driver.executor.spans
+        self.assertEqual([ span.phase for span in spans ], [ "tacan", "jhmcs" ])
+        self.assertEqual([ span.num_presses for span in spans ], [ 2, 0 ])
+        self.assertAlmostEqual(spans[0].planned, 0.04)
+        self.assertAlmostEqual(spans[1].duration, 0.05, delta=0.02)
+        self.assertAlmostEqual(spans[1].t_wait, 0.05, delta=0.02)
+        self.assertNotIn("t_start", spans[0].to_dict())
+
+    def test_run_plan_notes(self):
+        self.driver.executor.send = lambda cmds: True
+        self.driver.plan = drivers.DriverPlan()
+        with self.assertNoLogs(logger, level="INFO"):
+            self.driver.enter_cmds([ ])
+        plan = self.driver.plan
+        self.driver.plan = None
+        with self.assertLogs(logger, level="INFO") as logs:
+            self.driver.executor.run(plan)
+        self.assertEqual(logs.output, [ "INFO:root:Skipping unchanged CMDS programs" ])
+
+    def test_run_plan_jitter(self):
+        self.driver.executor.send = lambda cmds: True
+        plan = drivers.DriverPlan([ drivers.DriverCmd("WAIT", after=0.01) ] * 10)
+        t_start = time.monotonic()
+        self.driver.executor.run(plan)
+        self.assertAlmostEqual(time.monotonic() - t_start, 0.1, delta=0.02)
+        self.assertEqual(self.driver.executor.jitter.num_waits, 10)
+        self.assertLess(self.driver.executor.jitter.worst, 0.02)
+
+
+class TestDriverCalDelays(unittest.TestCase):
+    def setUp(self) -> None:
+        cal_prefs = SimpleNamespace(**vars(prefs))
+        cal_prefs.dcs_btn_cal_delays_map = { ("viper", "icp") : (0.05, 0.06),
+                                             ("viper", "rocker") : (0.07, 0.08) }
+        self.driver = drivers.ViperDriver(logger, cal_prefs)
+
+    def tearDown(self) -> None:
+        self.driver.stop()
+
+    def test_cal_delays(self):
+        plan = self.driver.build_plan(make_profile(1), is_optimized=False)
+        icp = [ cmd for cmd in plan if cmd.press == ("ICP_BTN_2 1",) ]
+        ded = [ cmd for cmd in plan if cmd.press == ("ICP_DED_SW 2",) ]
+        self.assertEqual((icp[0].hold, icp[0].after), (0.05, 0.06))
+        self.assertEqual((ded[0].hold, ded[0].after), (0.07, 0.08))
+        self.assertEqual(self.driver.btn_delays("osb"), (self.driver.short_delay, self.driver.short_delay))
+        self.driver.plan = drivers.DriverPlan()
+        self.driver.icp_data("RTN", delay_after=0.0)
+        self.assertEqual(self.driver.plan.cmds[0].after, 0.0)
+        self.driver.plan = None
+
+    def test_cal_supported(self):
+        self.assertTrue(self.driver.is_cal_supported)
+        for driver_class in (drivers.HornetDriver, drivers.MirageDriver):
+            driver = driver_class(logger, prefs)
+            self.assertEqual(driver.is_cal_supported, driver_class == drivers.HornetDriver)
+            driver.stop()
+
+
+class TestDriverPlanOptimize(unittest.TestCase):
+    def setUp(self) -> None:
+        self.driver = drivers.ViperDriver(logger, prefs)
+
+    def tearDown(self) -> None:
+        self.driver.stop()
+
+    def press(self, cmd, hold=0.1, after=0.1):
+        return drivers.DriverCmd("PRESS", press=(cmd,), release=("REL",), hold=hold, after=after)
+
+    def test_idempotent(self):
+        rtn = "ICP_DATA_RTN_SEQ_SW 0"
+        plan = drivers.DriverPlan([ self.press(rtn), drivers.DriverCmd("STEP"), self.press(rtn) ])
+        opt, stats = plan.optimize(idempotent=self.driver.press_idempotent)
+        self.assertEqual(opt.num_presses, 1)
+        self.assertEqual(stats.num_presses, 1)
+        self.assertAlmostEqual(stats.seconds, 0.2)
+
+    def test_inverses(self):
+        plan = drivers.DriverPlan([ self.press("ICP_DED_SW 2"), self.press("ICP_DED_SW 2"),
+                                    drivers.DriverCmd("WAIT", after=0.5),
+                                    self.press("ICP_DED_SW 0"), self.press("ICP_DED_SW 0") ])
+        opt, stats = plan.optimize(inverses=self.driver.press_inverses)
+        self.assertEqual(opt.num_presses, 0)
+        self.assertEqual(stats.num_presses, 4)
+        self.assertAlmostEqual(opt.duration, 0.5)
+
+    def test_merge_waits(self):
+        plan = drivers.DriverPlan([ self.press("ICP_BTN_1"), drivers.DriverCmd("WAIT", after=0.1),
+                                    drivers.DriverCmd("WAIT", after=0.2) ])
+        opt, stats = plan.optimize()
+        self.assertEqual(len(opt), 1)
+        self.assertEqual(stats.num_waits, 2)
+        self.assertAlmostEqual(opt.duration, plan.duration)
+
+    def test_optimized_profile(self):
+        profile = make_profile(10)
+        plan = self.driver.build_plan(profile, is_optimized=False)
+        opt, stats = plan.optimize(idempotent=self.driver.press_idempotent,
+                                   inverses=self.driver.press_inverses)
+        self.assertLess(opt.num_presses, plan.num_presses)
+        self.assertAlmostEqual(plan.duration - opt.duration, stats.seconds)
+        self.assertEqual(opt.num_steps, plan.num_steps)
+
+
+class TestAckPacing(unittest.TestCase):
+    def frame(self, addr, word):
+        return b"\x55\x55\x55\x55" + bytes([ addr & 0xff, addr >> 8, 2, 0, word & 0xff, word >> 8 ])
+
+    def setUp(self) -> None:
+        self.state = DcsBiosExportState()
+        self.pacer = DcsBiosAckPacer(self.state, { "ICP_BTN_1" : (0x4400, 0x0004, 2) },
+                                     displays=[ (0x4500, 4) ])
+
+    def test_parse(self):
+        self.assertEqual(self.state.update(self.frame(0x4400, 0x0004)), [ 0x4400 ])
+        self.assertEqual(self.state.value(0x4400, 0x0004, 2), 1)
+        self.assertEqual(self.state.update(self.frame(0x4400, 0x0004)), [ ])
+
+    def test_ack(self):
+        self.state.update(self.frame(0x4400, 0x0000))
+        seq = self.pacer.mark()
+        threading.Timer(0.05, lambda: self.state.update(self.frame(0x4400, 0x0004))).start()
+        self.assertTrue(self.pacer.wait([ "ICP_BTN_1 1" ], seq, 2.0))
+        self.assertFalse(self.pacer.wait([ "ICP_BTN_1 1" ], seq, 0.05, is_display=True))
+        self.state.update(self.frame(0x4502, 0x2020))
+        self.assertTrue(self.pacer.wait([ "ICP_BTN_1 1" ], seq, 2.0, is_display=True))
+
+    def test_fallback(self):
+        seq = self.pacer.mark()
+        self.assertFalse(self.pacer.wait([ "ICP_BTN_1 1" ], seq, 0.01))
+        self.state.update(self.frame(0x4400, 0x0004))
+        self.assertFalse(self.pacer.wait([ "UFC_1 1" ], seq, 0.01))
+
+
+class TestDriverBench(unittest.TestCase):
+    def setUp(self) -> None:
+        self.driver = drivers.ViperDriver(logger, prefs)
+        self.sink = DriverBenchSink()
+        self.sink.start()
+        self.driver.host, self.driver.port = self.sink.host, self.sink.port
+
+    def tearDown(self) -> None:
+        self.sink.stop()
+        self.driver.stop()
+
+    def test_presses(self):
+        for executor in (self.driver.executor, DriverBenchSleepExecutor(self.driver)):
+            self.driver.executor = executor
+            errors = bench_presses(self.driver, self.sink, 0.01, num_presses=5)
+            self.assertEqual(len(errors['hold']), 5)
+            self.assertEqual(len(errors['interval']), 4)
+            self.assertLess(bench_error_stats(errors['hold'])[0], 0.01)
+
+    def test_error_stats(self):
+        self.assertEqual(bench_error_stats([ ]), (0.0, 0.0, 0.0, 0.0))
+        self.assertEqual(bench_error_stats([ -0.003, 0.001, 0.002 ]), (0.002, 0.002, 0.002, 0.003))
@@ -0,0 +1,224 @@
+import unittest
+import logging
+import os
+import queue
+import tempfile
+import time
+import src.drivers as drivers
+
+from types import SimpleNamespace
+from LatLon23 import LatLon, Longitude, Latitude
+
+from src.db_objects import Profile, Waypoint, av_setup_parse_cmds, av_setup_parse_mfd
+from src.driver_plan import DriverPlan
+from src.driver_trace import DriverTraceRecorder, driver_trace_diff, driver_trace_load, driver_trace_load_all, driver_trace_replay
+from src.driver_trace import driver_trace_cmds, driver_trace_stats
+from src.dcs_bios_export import DcsBiosAckPacer, DcsBiosExportState, dcs_bios_load_control_ref
+from src.viper_sim import ViperSim
+
+logger = logging.getLogger()
+
+prefs = SimpleNamespace(dcs_btn_rel_delay_short="0.03", dcs_btn_rel_delay_medium="0.06",
+                        is_btn_ack_pacing_bool=False,
+                        is_disable_export_bool=True, dcs_btn_cal_delays_map=dict(),
+                        is_trace_record_bool=False)
+
+
+def make_profile():
+    wps = [ Waypoint(LatLon(Latitude(36.2), Longitude(-115.05)), elevation=2500, name="WP1"),
+            Waypoint(LatLon(Latitude(-12.5), Longitude(44.75)), elevation=-200, name="WP2") ]
+    return Profile("test", waypoints=wps, aircraft="viper")
+
+
+class TestViperSim(unittest.TestCase):
+    def setUp(self) -> None:
+        self.state = DcsBiosExportState()
+        self.sim = ViperSim(port=0, exp_port=0, frame_rate=100)
+        self.driver = drivers.ViperDriver(logger, prefs)
+
+    def tearDown(self) -> None:
+        self.driver.stop()
+
+    def test_short_press_dropped(self):
+        self.sim.is_sampled = True
+        self.sim.pending = [ ("ICP_BTN_4", 1), ("ICP_BTN_4", 0) ]
+        self.sim.frame()
+        self.assertEqual(self.sim.avionics.page, "CNI")
+        self.sim.pending = [ ("ICP_BTN_4", 1) ]
+        self.sim.frame()
+        self.assertEqual(self.sim.avionics.page, "STPT")
+
+    def test_export(self):
+        self.state.update(b"\x55\x55\x55\x55" + self.frame_bytes())
+        with tempfile.TemporaryDirectory() as path:
+            self.sim.write_control_ref(os.path.join(path, "sim.json"))
+            ints, strings = dcs_bios_load_control_ref(os.path.join(path, "sim.json"))
+        addr, length = strings["DED_LINE_1"]
+        self.assertIn(b"STPT", self.state.mem[addr:addr+length])
+        self.assertEqual(self.state.value(*ints["ICP_DED_SW"]), 1)
+
+    def frame_bytes(self):
+        mem = self.sim.export_mem()
+        return bytes([ 0x00, 0x44, len(mem) & 0xff, len(mem) >> 8 ]) + mem
+
+    def enter_profile(self, pacer=None):
+        self.sim.start()
+        try:
+            self.driver.port = self.sim.port
+            self.driver.executor.pacer = pacer
+            self.driver.executor.run(self.driver.build_plan(make_profile()))
+        finally:
+            self.sim.stop()
+        self.check_profile(self.sim)
+
+    def check_profile(self, sim):
+        stpts = sim.avionics.stpts
+        self.assertAlmostEqual(stpts[1]["LAT"], 36.2, places=4)
+        self.assertAlmostEqual(stpts[1]["LNG"], -115.05, places=4)
+        self.assertEqual(stpts[1]["ELEV"], 2500)
+        self.assertAlmostEqual(stpts[2]["LAT"], -12.5, places=4)
+        self.assertAlmostEqual(stpts[2]["LNG"], 44.75, places=4)
+        self.assertEqual(stpts[2]["ELEV"], -200)
+        self.assertEqual(sim.avionics.stpt_cur, 2)
+        self.assertEqual(sim.avionics.page, "CNI")
+
+    def test_enter_waypoints(self):
+        self.enter_profile()
+
+    def test_enter_waypoints_paced(self):
+        with tempfile.TemporaryDirectory() as path:
+            self.sim.write_control_ref(os.path.join(path, "sim.json"))
+            ints, strings = dcs_bios_load_control_ref(os.path.join(path, "sim.json"))
+        self.state.listen(port=0)
+        try:
+            self.sim.exp_port = self.state.port
+            displays = [ strings[ident] for ident in self.driver.exp_displays ]
+            self.enter_profile(pacer=DcsBiosAckPacer(self.state, ints, displays))
+        finally:
+            self.state.stop()
+
+    def test_enter_waypoints_delta(self):
+        profile = make_profile()
+        self.sim.start()
+        try:
+            self.driver.port = self.sim.port
+            self.driver.executor.run(self.driver.build_plan(profile))
+            baseline = self.driver.snapshot(profile)
+            self.assertEqual(self.driver.build_plan(profile, baseline=baseline).num_presses, 0)
+
+            profile.waypoints[1].position = LatLon(Latitude(-12.75), Longitude(44.5))
+            plan_full = self.driver.build_plan(profile)
+            plan_delta = self.driver.build_plan(profile, baseline=baseline)
+            self.assertLess(plan_delta.num_presses, plan_full.num_presses)
+            self.sim.avionics.stpt_cur = 1              # pilot changes steerpoint between loads
+            self.driver.executor.run(plan_delta)
+        finally:
+            self.sim.stop()
+
+        stpts = self.sim.avionics.stpts
+        self.assertAlmostEqual(stpts[1]["LAT"], 36.2, places=4)
+        self.assertAlmostEqual(stpts[1]["LNG"], -115.05, places=4)
+        self.assertAlmostEqual(stpts[2]["LAT"], -12.75, places=4)
+        self.assertAlmostEqual(stpts[2]["LNG"], 44.5, places=4)
+        self.assertEqual(stpts[2]["ELEV"], -200)
+        self.assertEqual(self.sim.avionics.stpt_cur, 2)
+        self.assertEqual(self.sim.avionics.page, "CNI")
+
+    def test_enter_waypoints_fanout(self):
+        sim_2 = ViperSim(port=0, exp_port=0, frame_rate=100)
+        self.sim.start()
+        sim_2.start()
+        try:
+            endpoints = [ ("127.0.0.1", self.sim.port), ("127.0.0.1", sim_2.port), ("127.0.0.1", 0) ]
+            duration = self.driver.build_plan(make_profile()).duration
+            t_start = time.monotonic()
+            progress_q = queue.Queue()
+            results = self.driver.enter_all_endpoints(make_profile(), endpoints,
+                                                      progress_q=progress_q)
+            self.assertLess(time.monotonic() - t_start, duration * 1.5)
+        finally:
+            self.sim.stop()
+            sim_2.stop()
+        self.assertEqual(results, { endpoints[0] : True, endpoints[1] : True, endpoints[2] : False })
+        self.check_profile(self.sim)
+        self.check_profile(sim_2)
+        progress = dict()
+        while not progress_q.empty():
+            item = progress_q.get(False)
+            if type(item) == tuple and len(item) == 3:
+                progress[item[0]] = item[1]
+        self.assertEqual(progress[endpoints[0]], 100.0)
+        self.assertEqual(progress[endpoints[1]], 100.0)
+
+    def test_trace_replay(self):
+        profile = make_profile()
+        sim_2 = ViperSim(port=0, exp_port=0, frame_rate=100)
+        with tempfile.TemporaryDirectory() as path:
+            trace_path = os.path.join(path, "trace.bin")
+            self.driver.executor.recorder = DriverTraceRecorder(trace_path)
+            self.driver.executor.run(self.driver.build_plan(profile, is_optimized=False))
+            self.driver.executor.run(self.driver.build_plan(profile))
+            self.driver.executor.recorder = None
+            loads = driver_trace_load_all(trace_path)
+            records = driver_trace_load(trace_path)
+
+            sim_2.start()
+            try:
+                driver_trace_replay(records, port=sim_2.port, scale=0.5)
+            finally:
+                sim_2.stop()
+
+        self.assertEqual(len(loads), 2)
+        self.check_profile(sim_2)
+        diff = driver_trace_diff(loads[0], loads[1])
+        self.assertTrue(diff[1].startswith("commands"))
+        self.assertTrue(diff[2].startswith("datagrams"))
+        self.assertEqual(driver_trace_stats(records)['num_cmds'], len(driver_trace_cmds(records)))
+        self.assertGreater(driver_trace_stats(records)['num_cmds'], driver_trace_stats(records)['num_sends'])
+        self.assertIn("  waypoints", "\n".join(diff))
+
+    def test_enter_cmds(self):
+        dflt = av_setup_parse_cmds("1,1,1,1;1,1,1,1")
+        progs = [ (None, dflt) ] * 6
+        progs[1] = (av_setup_parse_cmds("1,2,1,1;1,1,1,1"), dflt)
+        progs[5] = (av_setup_parse_cmds("1,1,1,1;1,1,1,4"), dflt)
+        self.driver.plan = DriverPlan()
+        self.driver.phase("cmds")
+        self.driver.enter_cmds(progs)
+        plan = self.driver.plan
+        self.driver.plan = None
+        self.sim.start()
+        try:
+            self.driver.port = self.sim.port
+            self.driver.executor.run(plan)
+        finally:
+            self.sim.stop()
+
+        self.assertEqual(self.sim.avionics.cmds, { "CHAFF" : { 2 : { "BI" : "2" } }, "FLARE" : { 6 : { "SI" : "4" } } })
+        self.assertEqual(self.sim.avionics.cmds_prog, 1)
+        self.assertEqual(self.sim.avionics.page, "CNI")
+        self.assertLess(plan.num_presses, 20)
+        self.assertEqual([ span.phase for span in self.driver.executor.spans ], [ "cmds", "cmds.chaff", "cmds.flare" ])
+
+    def test_enter_mfd_dgft(self):
+        self.driver.plan = DriverPlan()
+        dflt = av_setup_parse_mfd("0,0,0,0,0,0")
+        self.driver.enter_mfd("DGFT_D", av_setup_parse_mfd("20,7,8,1,2,3"), dflt)
+        self.driver.enter_mfd("DGFT_M", av_setup_parse_mfd("4,5,6,9,10,11"), dflt)
+        plan = self.driver.plan
+        self.driver.plan = None
+        self.sim.start()
+        try:
+            self.driver.port = self.sim.port
+            self.driver.executor.run(plan)
+        finally:
+            self.sim.stop()
+
+        self.assertNotIn("KEY", [ cmd.op for cmd in plan ])
+        fmts = self.sim.avionics.mfd_fmts
+        self.assertEqual([ fmts[("DGFT", lr, osb)] for lr in ("L", "R") for osb in ("14", "13", "12") ],
+                         [ "20", "7", "8", "1", "2", "3" ])
+        self.assertEqual([ fmts[("AA", lr, osb)] for lr in ("L", "R") for osb in ("14", "13", "12") ],
+                         [ "4", "5", "6", "9", "10", "11" ])
+        self.assertEqual(fmts[("NAV", "L", "14")], None)
+        self.assertEqual(self.sim.avionics.dgft, 1)